@@ -37,7 +37,10 @@ if __name__ == '__main__':
 
     # troubleshooting system
     troubleshooting_service = TroubleShootingSystemService()
-    troubleshooting_service.schedule_troubleshooting_procedure()
+    if troubleshooting_service.is_server_enabled():
+        troubleshooting_service.start_troubleshooting_server(background=True)
+    else:
+        troubleshooting_service.schedule_troubleshooting_procedure()
 
     performanceMonitoringSystem = PerformanceMonitoringSystem()
 
@@ -0,0 +1,158 @@
+"""
+Script for tuning the nearest-neighbour prefilter of the troubleshooting system
+
+This script compares the ranking computed with the IVF prefilter against the
+exhaustive ranking of the similarity model, for every combination of the given
+number of lists, probed lists and shortlist sizes. For each combination it
+reports the recall of the top-k candidates and the mean latency per query.
+
+The same is done for the product-quantized candidates, for every combination
+of the given number of subspaces and shortlist sizes, also reporting the
+compression ratio of the candidates.
+
+Queries are sampled from the candidate problems themselves.
+
+Usage: python ann_recall_report.py [-k 10] [--n-lists 16 64] [--n-probe 1 4 8]
+                                   [--shortlist-size 100 200]
+                                   [--pq-subspaces 48 96] [-o report.json]
+
+Author: Filippo Guggino
+"""
+
+import argparse
+import json
+import time
+from itertools import product
+
+import numpy as np
+
+from smart_troubleshooting.feature_vector_store import header_path, \
+    read_feature_vectors
+from smart_troubleshooting.troubleshooting_system.product_quantizer \
+    import ProductQuantizer
+from smart_troubleshooting.troubleshooting_system.scoring_engine \
+    import ScoringEngine
+
+
+def load_candidates(path):
+    _, problem_ids, vectors = read_feature_vectors(path)
+    return problem_ids, np.asarray(vectors, dtype=np.float32)
+
+
+def recall(exact_rankings, rankings):
+    return float(np.mean([
+        len(np.intersect1d(exact, approximate)) / max(len(exact), 1)
+        for exact, approximate in zip(exact_rankings, rankings)]))
+
+
+def mean_latency(engine, snapshot, queries, k, shortlist_size=None, n_probe=None):
+    start = time.perf_counter()
+    rankings = engine.rank(snapshot, queries, k, shortlist_size, n_probe=n_probe)
+    return rankings, (time.perf_counter() - start) / len(queries)
+
+
+def main(argv=None):
+    """
+    Write the recall vs latency report
+    :param argv: the command line arguments, None for sys.argv
+    :return: the report
+    """
+    parser = argparse.ArgumentParser(description="Recall vs latency report of the "
+                                                 "troubleshooting prefilter")
+    parser.add_argument('--model-file', type=str,
+                        help="Path to the similarity model",
+                        default="../smart_troubleshooting/pd_similarity_dev_system/"
+                                "models/output_model.joblib")
+    parser.add_argument('--feature-vector-store', type=str,
+                        help="Path to the feature vector store",
+                        default="../smart_troubleshooting/pd_preparation_system/"
+                                "feature_vectors")
+    parser.add_argument('-k', type=int, help="Number of candidates returned",
+                        default=10)
+    parser.add_argument('-q', '--queries', type=int, help="Number of queries",
+                        default=100)
+    parser.add_argument('--metric', type=str, choices=["cosine", "l2"],
+                        default="cosine")
+    parser.add_argument('--n-lists', type=int, nargs='+', default=[16, 64])
+    parser.add_argument('--n-probe', type=int, nargs='+', default=[1, 4, 8])
+    parser.add_argument('--shortlist-size', type=int, nargs='+',
+                        default=[100, 200, 500])
+    parser.add_argument('--pq-subspaces', type=int, nargs='*', default=[48, 96],
+                        help="Number of subspaces of the product quantizer")
+    parser.add_argument('-o', '--output-file', type=str,
+                        help="Path to the json report (printed if missing)")
+
+    args = parser.parse_args(argv)
+
+    exact_engine = ScoringEngine(
+        args.model_file, header_path(args.feature_vector_store),
+        lambda: load_candidates(args.feature_vector_store))
+    exact_snapshot = exact_engine.refresh()
+
+    rng = np.random.default_rng(0)
+    queries = exact_snapshot.candidates[
+        rng.choice(len(exact_snapshot.candidates),
+                   min(args.queries, len(exact_snapshot.candidates)),
+                   replace=False)]
+
+    exact_rankings, exact_latency = mean_latency(exact_engine, exact_snapshot,
+                                                 queries, args.k)
+
+    report = {
+        "candidates": len(exact_snapshot.candidates),
+        "queries": len(queries),
+        "k": args.k,
+        "exhaustiveLatency": exact_latency,
+        "results": [],
+        "compression": []
+    }
+
+    for n_lists in args.n_lists:
+        prefilter = {"enabled": True, "n_lists": n_lists, "n_probe": 1,
+                     "metric": args.metric, "shortlist_size": 1}
+        engine = ScoringEngine(
+            args.model_file, header_path(args.feature_vector_store),
+            lambda: (exact_snapshot.problem_ids, exact_snapshot.candidates),
+            prefilter=prefilter)
+        snapshot = engine.refresh()
+
+        for n_probe, shortlist_size in product(args.n_probe, args.shortlist_size):
+            rankings, latency = mean_latency(engine, snapshot, queries, args.k,
+                                             shortlist_size, n_probe)
+            report["results"].append({
+                "n_lists": n_lists,
+                "n_probe": n_probe,
+                "shortlist_size": shortlist_size,
+                "recall": recall(exact_rankings, rankings),
+                "latency": latency
+            })
+
+    for n_subspaces in args.pq_subspaces:
+        quantizer = ProductQuantizer(n_subspaces).fit(exact_snapshot.candidates)
+        codes = quantizer.encode(exact_snapshot.candidates)
+        for shortlist_size in args.shortlist_size:
+            engine = ScoringEngine(
+                args.model_file, header_path(args.feature_vector_store),
+                lambda: (exact_snapshot.problem_ids, exact_snapshot.candidates),
+                compression={"enabled": True, "shortlist_size": shortlist_size},
+                load_codes=lambda: (exact_snapshot.problem_ids, quantizer, codes))
+            snapshot = engine.refresh()
+            rankings, latency = mean_latency(engine, snapshot, queries, args.k)
+            report["compression"].append({
+                "n_subspaces": n_subspaces,
+                "shortlist_size": shortlist_size,
+                "compressionRatio": exact_snapshot.candidates.nbytes / codes.nbytes,
+                "recall": recall(exact_rankings, rankings),
+                "latency": latency
+            })
+
+    if args.output_file is None:
+        print(json.dumps(report, indent=4))
+    else:
+        with open(args.output_file, "w") as report_file:
+            json.dump(report, report_file, indent=4)
+    return report
+
+
+if __name__ == "__main__":
+    main()
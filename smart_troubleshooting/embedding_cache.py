@@ -0,0 +1,123 @@
+"""
+This module offers a persistent cache of feature vectors, stored in a SQLite
+database, with least-recently-used eviction once it holds too many entries.
+
+Keys are hashed, so any tuple of strings (normalized sentence, data manipulation
+configuration, embedding model) can be used as a key.
+"""
+
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+
+import numpy as np
+
+
+def _hash_key(key):
+    return hashlib.sha256("\0".join(key).encode()).digest()
+
+
+class PersistentEmbeddingCache:
+    """
+    On-disk mapping from keys to float32 feature vectors, offering the same
+    get/put interface as LRUCache. Lookups are marked as recent uses and
+    eviction happens when the pending changes are flushed.
+    Hits and misses are counted to measure the effectiveness of the cache.
+    """
+
+    def __init__(self, path, max_entries=100000):
+        """
+        Open the cache, creating the database if missing
+        :param path: the path of the SQLite database
+        :param max_entries: the maximum number of entries kept after a flush
+        """
+        self.path = path
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        # used by the threads of the periodic preparation procedure, one at a time
+        self._connection = sqlite3.connect(path, check_same_thread=False)
+        self._connection.execute("CREATE TABLE IF NOT EXISTS embeddings ("
+                                 "key BLOB PRIMARY KEY, vector BLOB NOT NULL, "
+                                 "last_used REAL NOT NULL)")
+        self._connection.execute("CREATE INDEX IF NOT EXISTS embeddings_last_used "
+                                 "ON embeddings (last_used)")
+        self._connection.commit()
+        self._used = set()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        """
+        Get the feature vector associated to a key, marking it as recently used
+        :param key: the key to look up, a tuple of strings
+        :return: the cached feature vector, None if the key is missing
+        """
+        key_hash = _hash_key(key)
+        with self._lock:
+            row = self._connection.execute("SELECT vector FROM embeddings WHERE key = ?",
+                                           (key_hash,)).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            self._used.add(key_hash)
+            self.hits += 1
+        return np.frombuffer(row[0], dtype=np.float32)
+
+    def put(self, key, value):
+        """
+        Associate a feature vector to a key, persisted at the next flush
+        :param key: the key, a tuple of strings
+        :param value: the feature vector
+        :return: None
+        """
+        vector = np.asarray(value, dtype=np.float32).tobytes()
+        with self._lock:
+            self._connection.execute("INSERT OR REPLACE INTO embeddings VALUES (?, ?, ?)",
+                                     (_hash_key(key), vector, time.time()))
+
+    def flush(self):
+        """
+        Persist the new entries and the recent uses, then evict the least
+        recently used entries exceeding max_entries
+        :return: None
+        """
+        with self._lock:
+            self._connection.executemany("UPDATE embeddings SET last_used = ? WHERE key = ?",
+                                         ((time.time(), key_hash) for key_hash in self._used))
+            self._used.clear()
+            self._connection.execute("DELETE FROM embeddings WHERE key IN ("
+                                     "SELECT key FROM embeddings ORDER BY last_used DESC "
+                                     "LIMIT -1 OFFSET ?)", (max(self.max_entries, 0),))
+            self._connection.commit()
+
+    def stats(self):
+        """
+        Get the statistics of the cache
+        :return: a dictionary with size, hits, misses and hit rate
+        """
+        with self._lock:
+            size = self._connection.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+            lookups = self.hits + self.misses
+            return {
+                "size": size,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hitRate": self.hits / lookups if lookups else 0.0
+            }
+
+    def close(self):
+        """
+        Flush the pending changes and close the database
+        :return: None
+        """
+        self.flush()
+        with self._lock:
+            self._connection.close()
+
+    def __len__(self):
+        return self.stats()["size"]
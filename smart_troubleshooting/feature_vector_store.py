@@ -0,0 +1,166 @@
+"""
+This module offers an API to write and read the binary store of the problem
+feature vectors.
+
+A store is a directory containing:
+    - header.json: number of vectors, dimensions, dtype, embedding model,
+        hash of the data manipulation configuration and name of the data files
+    - vectors-<revision>.npy: the (n_problems, n_features) feature vectors matrix
+    - ids-<revision>.npy: the problem ids, the i-th id being the one of the i-th row
+    - codes-<revision>.npy and codebooks-<revision>.npy (optional): the product
+        quantization codes of the vectors and the codebooks they refer to
+    - hashes-<revision>.npy (optional): the hash of the description each vector
+        was generated from, to detect the edited problems
+
+Data files of a new revision are written first, then the header is atomically
+replaced: readers always see a complete revision. Readers memory-map the matrix.
+"""
+
+import os
+import time
+
+import numpy as np
+
+from smart_troubleshooting.file_io import dump_csv, load_json, dump_json
+
+DTYPES = ["float32", "float16"]
+
+
+def header_path(store_path):
+    """
+    Get the path of the header of a store, which changes with every new revision
+    :param store_path: the directory of the store
+    :return: the path of header.json
+    """
+    return os.path.join(store_path, "header.json")
+
+
+def write_feature_vectors(store_path, problem_ids, vectors, model_name,
+                          configuration_hash, dtype="float32", codes=None, codebooks=None,
+                          description_hashes=None):
+    """
+    Write a new revision of the store, removing the previous one
+    :param store_path: the directory of the store, created if missing
+    :param problem_ids: the ids of the problems
+    :param vectors: the feature vectors, the i-th row being the one of the i-th problem
+    :param model_name: the name of the embedding model which generated the vectors
+    :param configuration_hash: the hash of the data manipulation configuration
+    :param dtype: one of DTYPES, the type the vectors are stored with
+    :param codes: the product quantization codes of the vectors, None if not compressed
+    :param codebooks: the codebooks of the product quantizer which generated the codes
+    :param description_hashes: the hashes of the problem descriptions, None if unknown
+    :return: None
+    """
+    if dtype not in DTYPES:
+        raise ValueError("Unknown dtype: %s" % dtype)
+
+    os.makedirs(store_path, exist_ok=True)
+    previous_header = load_json(header_path(store_path))
+
+    vectors = np.asarray(vectors, dtype=dtype)
+    revision = str(time.time_ns())
+    vectors_file = "vectors-%s.npy" % revision
+    ids_file = "ids-%s.npy" % revision
+    np.save(os.path.join(store_path, vectors_file), vectors)
+    np.save(os.path.join(store_path, ids_file), np.asarray(problem_ids, dtype=str))
+    codes_file = None
+    codebooks_file = None
+    if codes is not None:
+        codes_file = "codes-%s.npy" % revision
+        codebooks_file = "codebooks-%s.npy" % revision
+        np.save(os.path.join(store_path, codes_file), np.asarray(codes, dtype=np.uint8))
+        np.save(os.path.join(store_path, codebooks_file), codebooks)
+    hashes_file = None
+    if description_hashes is not None:
+        hashes_file = "hashes-%s.npy" % revision
+        np.save(os.path.join(store_path, hashes_file), np.asarray(description_hashes, dtype=str))
+
+    header = {
+        "count": int(vectors.shape[0]),
+        "dimensions": int(vectors.shape[1]) if vectors.ndim == 2 else 0,
+        "dtype": dtype,
+        "model": model_name,
+        "configurationHash": configuration_hash,
+        "vectorsFile": vectors_file,
+        "idsFile": ids_file,
+        "codesFile": codes_file,
+        "codebooksFile": codebooks_file,
+        "hashesFile": hashes_file
+    }
+    temporary_header = header_path(store_path) + ".tmp"
+    dump_json(header, temporary_header)
+    os.replace(temporary_header, header_path(store_path))
+
+    # readers of the previous revision keep their open (mapped) files on POSIX
+    if previous_header is not None:
+        for file in (previous_header["vectorsFile"], previous_header["idsFile"],
+                     previous_header.get("codesFile"), previous_header.get("codebooksFile"),
+                     previous_header.get("hashesFile")):
+            if file is None:
+                continue
+            try:
+                os.remove(os.path.join(store_path, file))
+            except OSError:
+                pass
+
+
+def read_feature_vectors(store_path, mmap=True):
+    """
+    Read the current revision of the store
+    :param store_path: the directory of the store
+    :param mmap: whether the vectors matrix is memory-mapped (read only) instead of loaded
+    :return: the tuple (header, problem ids, feature vectors),
+        None if the store doesn't exist
+    """
+    header = load_json(header_path(store_path))
+    if header is None:
+        return None
+    problem_ids = np.load(os.path.join(store_path, header["idsFile"]))
+    vectors = np.load(os.path.join(store_path, header["vectorsFile"]),
+                      mmap_mode="r" if mmap else None)
+    return header, problem_ids, vectors
+
+
+def read_quantized_feature_vectors(store_path):
+    """
+    Read the product quantization codes of the current revision of the store
+    :param store_path: the directory of the store
+    :return: the tuple (header, problem ids, codebooks, codes),
+        None if the store doesn't exist or isn't compressed
+    """
+    header = load_json(header_path(store_path))
+    if header is None or header.get("codesFile") is None:
+        return None
+    problem_ids = np.load(os.path.join(store_path, header["idsFile"]))
+    codebooks = np.load(os.path.join(store_path, header["codebooksFile"]))
+    codes = np.load(os.path.join(store_path, header["codesFile"]))
+    return header, problem_ids, codebooks, codes
+
+
+def read_description_hashes(store_path):
+    """
+    Read the description hashes of the current revision of the store
+    :param store_path: the directory of the store
+    :return: the hashes, the i-th one being the one of the i-th problem,
+        None if the store doesn't exist or has no hashes
+    """
+    header = load_json(header_path(store_path))
+    if header is None or header.get("hashesFile") is None:
+        return None
+    return np.load(os.path.join(store_path, header["hashesFile"]))
+
+
+def export_csv(store_path, csv_path):
+    """
+    Export the current revision of the store in the FeatureVectorOutputFile csv
+    format, for debugging
+    :param store_path: the directory of the store
+    :param csv_path: the path of the csv file
+    :return: None
+    """
+    header, problem_ids, vectors = read_feature_vectors(store_path)
+    head_row = ["problem_id", *[f"feature{i}" for i in range(header["dimensions"])]]
+    dump_csv(head_row, ({"problem_id": problem_id,
+                         **dict(zip(head_row[1:], vector.tolist()))}
+                        for problem_id, vector in zip(problem_ids, vectors)),
+             csv_path)
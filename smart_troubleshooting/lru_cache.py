@@ -0,0 +1,88 @@
+"""
+This module offers a thread-safe bounded cache with least-recently-used eviction
+"""
+
+import threading
+import time
+from collections import OrderedDict
+
+
+class LRUCache:
+    """
+    Bounded mapping which evicts the least recently used entry when full,
+    and optionally the entries older than a time to live.
+    Hits and misses are counted to measure the effectiveness of the cache.
+    """
+
+    def __init__(self, maxsize=1024, ttl=None):
+        """
+        Create a new empty cache
+        :param maxsize: the maximum number of entries, 0 disables the cache
+        :param ttl: the time (in seconds) an entry stays valid, None for no expiration
+        """
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        """
+        Get the value associated to a key, marking it as recently used
+        :param key: the key to look up
+        :return: the cached value, None if the key is missing
+        """
+        with self._lock:
+            if key not in self._entries:
+                self.misses += 1
+                return None
+            value, expiration = self._entries[key]
+            if expiration is not None and time.monotonic() >= expiration:
+                del self._entries[key]
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(self, key, value):
+        """
+        Associate a value to a key, evicting the least recently used entry if needed
+        :param key: the key
+        :param value: the value to cache
+        :return: None
+        """
+        if self.maxsize <= 0:
+            return
+        expiration = None if self.ttl is None else time.monotonic() + self.ttl
+        with self._lock:
+            self._entries[key] = (value, expiration)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        """
+        Remove all the entries, keeping the hit/miss counters
+        :return: None
+        """
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        """
+        Get the statistics of the cache
+        :return: a dictionary with size, hits, misses and hit rate
+        """
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": len(self._entries),
+                "hits": self.hits,
+                "misses": self.misses,
+                "hitRate": self.hits / lookups if lookups else 0.0
+            }
+
+    def __len__(self):
+        return len(self._entries)
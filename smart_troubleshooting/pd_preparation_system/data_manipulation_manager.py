@@ -4,16 +4,134 @@ This module provides a set of API to access data manipulation functionalities.
 Author: Filippo Guggino
 """
 
+import functools
+import hashlib
+import json
+import os
 import string
-import nltk
-from nltk.stem import WordNetLemmatizer
-from nltk.stem import PorterStemmer
-from nltk.corpus import stopwords
+import threading
 from smart_troubleshooting.file_io import load_json, validate_json
 
-nltk.download('punkt')
-nltk.download('wordnet')
-nltk.download('stopwords')
+# Local cache of the NLTK resources, filled by prepare_resources
+NLTK_DATA_PATH = "pd_preparation_system/nltk_data"
+# NLTK resources used by the data manipulation: {download name: resource path}
+NLTK_RESOURCES = {
+    "punkt": "tokenizers/punkt",
+    "wordnet": "corpora/wordnet",
+    "stopwords": "corpora/stopwords"
+}
+
+
+def prepare_resources(download=True):
+    """
+        Check that the NLTK resources are available in the local cache
+        (NLTK_DATA_PATH), downloading the missing ones. Meant to be run once,
+        when installing the system, instead of at every start.
+
+        :param download: whether the missing resources are downloaded
+        :type download: boolean
+        :returns: names of the resources still missing
+        :rtype: array of strings
+    """
+    import nltk  # pylint: disable=import-outside-toplevel
+
+    missing_resources = []
+    for name, resource in NLTK_RESOURCES.items():
+        try:
+            nltk.data.find(resource, paths=[NLTK_DATA_PATH])
+        except LookupError:
+            if not download or not nltk.download(name, download_dir=NLTK_DATA_PATH, quiet=True):
+                missing_resources.append(name)
+    return missing_resources
+
+
+@functools.lru_cache(maxsize=None)
+def _nltk_tools():
+    """
+        Load the stemmer, the lemmatizer and the stopwords on first use,
+        looking for the resources in the local cache first.
+
+        :returns: (stemmer, lemmatizer, stopwords)
+        :rtype: tuple(PorterStemmer, WordNetLemmatizer, set of strings)
+    """
+    # importing nltk takes seconds: it's done only when sentences are normalized
+    # pylint: disable=import-outside-toplevel
+    import nltk
+    from nltk.corpus import stopwords
+    from nltk.stem import PorterStemmer, WordNetLemmatizer
+
+    if NLTK_DATA_PATH not in nltk.data.path:
+        nltk.data.path.insert(0, NLTK_DATA_PATH)
+    return PorterStemmer(), WordNetLemmatizer(), set(stopwords.words('english'))
+
+
+class NormalizationPipeline:
+    """
+        Data manipulation configuration compiled once: the translation table and
+        the stopwords set are built when the pipeline is created, and each distinct
+        token is stemmed and lemmatized only once (the vocabulary is much smaller
+        than the number of tokens).
+    """
+    # Maximum number of distinct tokens whose normalized form is remembered
+    _token_cache_size = 65536
+
+    def __init__(self, configuration, stemmer=None, lemmatizer=None, stop_words=None):
+        """
+            :param configuration: the data manipulation configuration
+            :type configuration: dictionary
+            :param stemmer: stemmer used instead of the NLTK Porter stemmer
+            :type stemmer: object with a stem method
+            :param lemmatizer: lemmatizer used instead of the NLTK WordNet lemmatizer
+            :type lemmatizer: object with a lemmatize method
+            :param stop_words: stopwords used instead of the NLTK English ones
+            :type stop_words: set of strings
+        """
+        self.fingerprint = json.dumps(configuration, sort_keys=True)
+        self._to_lower_case = configuration['toLowerCase'] is True
+        self._translation_table = str.maketrans("", "", string.punctuation) \
+            if configuration['removePunctuation'] is True else None
+
+        self._stop_words = frozenset()
+        if configuration['removeStopwords'] is True:
+            if stop_words is None:
+                stop_words = _nltk_tools()[2]
+            self._stop_words = frozenset(stop_words).union(configuration['stopwords'])
+
+        self._stem = None
+        if configuration['performStemming'] is True:
+            self._stem = (stemmer or _nltk_tools()[0]).stem
+        self._lemmatize = None
+        if configuration['performLemmatization'] is True:
+            self._lemmatize = (lemmatizer or _nltk_tools()[1]).lemmatize
+        self.normalize_token = functools.lru_cache(maxsize=self._token_cache_size)(
+            self._normalize_token)
+
+    def _normalize_token(self, word):
+        if self._stem is not None:
+            word = self._stem(word)
+        if self._lemmatize is not None:
+            word = self._lemmatize(word)
+        # every word of a normalized sentence is followed by a space
+        return word + " "
+
+    def normalize(self, sentence):
+        """
+            Normalize a problem description.
+
+            :param sentence: the problem description
+            :type sentence: string
+            :returns: the normalized problem description
+            :rtype: string
+        """
+        sentence = str(sentence)
+        if self._to_lower_case:
+            sentence = sentence.lower()
+        if self._translation_table is not None:
+            sentence = sentence.translate(self._translation_table)
+        normalize_token = self.normalize_token
+        stop_words = self._stop_words
+        return "".join([normalize_token(word) for word in sentence.split(" ")
+                        if word not in stop_words])
 
 
 class DataManipulationManager:
@@ -33,26 +151,41 @@ class DataManipulationManager:
         "pd_preparation_system/json/basePreparationConfig.json"
     _base_configuration_schema = \
         "pd_preparation_system/json/schemas/basePreparationConfigSchema.json"
+    # Configuration, version of the file it comes from and pipeline compiled from it
+    _configuration = None
+    _configuration_version = None
+    _pipeline = None
+    _pipeline_lock = threading.Lock()
 
-    lemmatizer = WordNetLemmatizer()
-    stemmer = PorterStemmer()
-    stop_words = set(stopwords.words('english'))
+    @property
+    def stemmer(self):
+        """
+            Porter stemmer, loaded on first use.
+        """
+        return _nltk_tools()[0]
 
-    def perform_data_manipulation(self, sentences):
+    @property
+    def lemmatizer(self):
         """
-            Perform data manipulation on a set of problem descriptions passed
-            via parameter "sentences". Data manipulation refers to a set of
-            method used on a sentence in order to "normalize" it's content.
-            See class docstring for more details.
+            WordNet lemmatizer, loaded on first use.
+        """
+        return _nltk_tools()[1]
 
-            :param sentences: problem descriptions to be normalized
-            :type sentences: array of strings (problem descriptions)
-            :returns: normalized sentences
-            :rtype: array of strings
+    @property
+    def stop_words(self):
         """
+            English stopwords, loaded on first use.
+        """
+        return _nltk_tools()[2]
 
-        normalized_sentence_list = []
+    def load_configuration(self):
+        """
+            Load the data manipulation configuration from the base configuration file.
+            If the file doesn't respect its schema, the default configuration is returned.
 
+            :returns: the data manipulation configuration
+            :rtype: dictionary
+        """
         base_configuration = load_json(self._base_configuration_path)
         base_configuration_schema = load_json(self._base_configuration_schema)
         if validate_json(base_configuration, base_configuration_schema) is not True:
@@ -66,35 +199,78 @@ class DataManipulationManager:
                 "removePunctuation": True,
                 "stopwords": []
             }
+        return base_configuration
 
-        for sentence in sentences:
-            if base_configuration['toLowerCase'] is True:
-                # To lower case
-                sentence = sentence.lower()
+    def _reload_configuration(self):
+        # must be called holding _pipeline_lock
+        try:
+            stat = os.stat(self._base_configuration_path)
+            version = (stat.st_mtime_ns, stat.st_size)
+        except OSError:
+            version = None
+        if self._configuration is None or version != self._configuration_version:
+            self._configuration = self.load_configuration()
+            self._configuration_version = version
+            # compiled again on next use
+            self._pipeline = None
 
-            if base_configuration['removePunctuation'] is True:
-                # Remove punctuation
-                sentence = sentence.translate(str.maketrans("", "", string.punctuation))
+    def current_configuration(self):
+        """
+            Get the current data manipulation configuration. The configuration is
+            loaded and validated again only when its file changes.
 
-            problem_description_words = str(sentence).split(" ")
+            :returns: the data manipulation configuration
+            :rtype: dictionary
+        """
+        with self._pipeline_lock:
+            self._reload_configuration()
+            return self._configuration
 
-            if base_configuration['removeStopwords'] is True:
-                stop_words = [self.stop_words, base_configuration['stopwords']]
-                # Remove stopwords
-                problem_description_words = \
-                    [i for i in problem_description_words if not i in stop_words]
+    def pipeline(self):
+        """
+            Get the normalization pipeline compiled from the current configuration.
 
-            normalized_sentence = ""
-            for word in problem_description_words:
+            :returns: the normalization pipeline
+            :rtype: NormalizationPipeline
+        """
+        # the configuration can't change between its check and its compilation
+        with self._pipeline_lock:
+            self._reload_configuration()
+            if self._pipeline is None:
+                self._pipeline = NormalizationPipeline(self._configuration)
+            return self._pipeline
 
-                if base_configuration['performStemming'] is True:
-                    # Perform Stemming
-                    word = self.stemmer.stem(word)
+    def configuration_fingerprint(self):
+        """
+            Identify the current data manipulation configuration: sentences normalized
+            with the same fingerprint are normalized the same way.
 
-                if base_configuration['performLemmatization'] is True:
-                    # Perform Lemmatization
-                    word = self.lemmatizer.lemmatize(word)
+            :returns: canonical representation of the configuration
+            :rtype: string
+        """
+        return json.dumps(self.current_configuration(), sort_keys=True)
 
-                normalized_sentence += word + " "
-            normalized_sentence_list.append(normalized_sentence)
-        return normalized_sentence_list
+    def configuration_hash(self):
+        """
+            Hash of the configuration fingerprint, stored with the feature vectors
+            of the candidate problems (see feature_vector_store).
+
+            :returns: hexadecimal SHA-256 of the configuration fingerprint
+            :rtype: string
+        """
+        return hashlib.sha256(self.configuration_fingerprint().encode()).hexdigest()
+
+    def perform_data_manipulation(self, sentences):
+        """
+            Perform data manipulation on a set of problem descriptions passed
+            via parameter "sentences". Data manipulation refers to a set of
+            method used on a sentence in order to "normalize" it's content.
+            See class docstring for more details.
+
+            :param sentences: problem descriptions to be normalized
+            :type sentences: array of strings (problem descriptions)
+            :returns: normalized sentences
+            :rtype: array of strings
+        """
+        pipeline = self.pipeline()
+        return [pipeline.normalize(sentence) for sentence in sentences]
@@ -1,12 +1,25 @@
 """
 This module provides an interface to the engineer for testing purposes.
 
+Run with the "prepare_resources" argument to download the NLTK resources in the
+local cache once, before starting the service on a host without network access.
+
 Author: Filippo Guggino
 """
+import sys
 
+from smart_troubleshooting.pd_preparation_system.data_manipulation_manager \
+    import prepare_resources
 from smart_troubleshooting.pd_preparation_system.pd_preparation_system_service \
     import PDPreparationSystemService
 
 if __name__ == '__main__':
-    preparation_service = PDPreparationSystemService()
-    preparation_service.schedule_preparation_procedure()
+    if sys.argv[1:] == ["prepare_resources"]:
+        missing_resources = prepare_resources()
+        if missing_resources:
+            print("Missing NLTK resources: %s" % ", ".join(missing_resources))
+            sys.exit(1)
+        print("NLTK resources ready")
+    else:
+        preparation_service = PDPreparationSystemService()
+        preparation_service.schedule_preparation_procedure()
@@ -6,11 +6,20 @@ Author: Filippo Guggino
 
 import os
 import csv
+import hashlib
 import threading
 from datetime import datetime
+
+import numpy as np
+
+from smart_troubleshooting.embedding_cache import PersistentEmbeddingCache
 from smart_troubleshooting.file_io import dump_csv, dump_json, load_json
+from smart_troubleshooting.feature_vector_store import export_csv, read_description_hashes, \
+    read_feature_vectors, read_quantized_feature_vectors, write_feature_vectors
+from smart_troubleshooting.pd_preparation_system.preparation_pool import PreparationPool
 from smart_troubleshooting.pd_preparation_system.word_embedding_manager \
     import WordEmbeddingManager
+from smart_troubleshooting.troubleshooting_system.product_quantizer import ProductQuantizer
 
 
 class PDPreparationSystemService:
@@ -27,24 +36,95 @@ class PDPreparationSystemService:
     """
 
     _problem_mapping_path = "segregation_system/csv/ProblemMappingFile.csv"
+    _feature_vector_store = "pd_preparation_system/feature_vectors"
+    _feature_vector_dtype = "float32"
+    # product quantization codes stored alongside the feature vectors
+    _product_quantization = {"enabled": False}
+    # csv export of the feature vectors, for debugging
+    _export_feature_vector_csv = False
     _feature_vector_output_file = "pd_preparation_system/csv/FeatureVectorOutputFile.csv"
+    _normalized_descriptions_file = \
+        "pd_preparation_system/csv/NormalizedDescriptionsFile.csv"
     _preparation_report_file = "pd_preparation_system/json/preparationReport.json"
+    _preload_encoder = True
+    # only the added or edited problems are prepared, the previous store is updated
+    _incremental_preparation = True
+    # process pools used to normalize and encode the bulk preparations
+    _parallel_preparation = {
+        "enabled": False,
+        "normalization_workers": 2,
+        "encoding_workers": 4,
+        "chunk_size": 256
+    }
+    # sentences longer than max_seq_length tokens are truncated, quantization is one
+    # of the QUANTIZATIONS of word_embedding_manager
+    _encoder_settings = {"max_seq_length": 128, "batch_size": 32, "quantization": "none"}
+    # feature vectors of the already encoded sentences, kept between the cycles
+    _embedding_cache_settings = {
+        "enabled": True,
+        "path": "pd_preparation_system/embedding_cache/embeddings.sqlite3",
+        "max_entries": 100000
+    }
 
     def __init__(self):
         config_path = "pd_preparation_system/json/preparationServiceConfig.json"
         if os.path.exists(config_path):
             self._load_configuration(config_path)
 
+        # The encoder is shared with the other services of the process
+        self._word_embedding_manager = WordEmbeddingManager(
+            self._encoder_settings['max_seq_length'], self._encoder_settings['batch_size'],
+            self._encoder_settings['quantization'])
+        if self._preload_encoder:
+            threading.Thread(target=self._word_embedding_manager.preload, daemon=True).start()
+
+        self._preparation_pool = None
+        if self._parallel_preparation['enabled']:
+            self._preparation_pool = PreparationPool(
+                self._word_embedding_manager,
+                self._parallel_preparation['normalization_workers'],
+                self._parallel_preparation['encoding_workers'],
+                self._parallel_preparation['chunk_size'])
+
+        self._embedding_cache = None
+        if self._embedding_cache_settings['enabled']:
+            self._embedding_cache = PersistentEmbeddingCache(
+                self._embedding_cache_settings['path'],
+                self._embedding_cache_settings['max_entries'])
+
     def _load_configuration(self, config_path):
         config_data = load_json(config_path)
         self._problem_mapping_path = config_data['problem_mapping_path']
         self._feature_vector_output_file = config_data['feature_vector_output_file']
+        self._feature_vector_store = \
+            config_data.get('feature_vector_store', self._feature_vector_store)
+        self._feature_vector_dtype = \
+            config_data.get('feature_vector_dtype', self._feature_vector_dtype)
+        self._export_feature_vector_csv = \
+            config_data.get('export_feature_vector_csv', self._export_feature_vector_csv)
+        self._product_quantization = \
+            config_data.get('product_quantization', self._product_quantization)
+        self._normalized_descriptions_file = config_data.get(
+            'normalized_descriptions_file', self._normalized_descriptions_file)
         self._preparation_report_file = config_data['preparation_report_file']
+        self._preload_encoder = config_data.get('preload_encoder', self._preload_encoder)
+        self._embedding_cache_settings = \
+            config_data.get('embedding_cache', self._embedding_cache_settings)
+        self._incremental_preparation = \
+            config_data.get('incremental_preparation', self._incremental_preparation)
+        self._parallel_preparation = \
+            config_data.get('parallel_preparation', self._parallel_preparation)
+        self._encoder_settings = config_data.get('encoder', self._encoder_settings)
 
-    def _write_report(self, exit_status, error_message=None):
+    def _write_report(self, exit_status, error_message=None, delta=None):
         report_json = {"exitStatus": exit_status,
                        "errorMessage": error_message,
                        "lastSegregationTime": str(datetime.now())}
+        if delta is not None:
+            # number of problems added, updated and removed by the preparation
+            report_json["delta"] = delta
+        if self._embedding_cache is not None:
+            report_json["embeddingCache"] = self._embedding_cache.stats()
 
         dump_json(report_json, self._preparation_report_file)
 
@@ -103,15 +183,103 @@ class PDPreparationSystemService:
         threading.Timer(period,  # re-init timer
                         self.schedule_preparation_procedure).start()
 
+    def _read_previous_preparation(self, model_name, configuration_hash):
+        """
+            Read the result of the previous preparation, if it can be updated
+            incrementally: same embedding model and data manipulation configuration,
+            and description hashes available.
+
+            :param model_name: the current encoder (see
+                WordEmbeddingManager.encoder_fingerprint)
+            :type model_name: string
+            :param configuration_hash: hash of the current data manipulation configuration
+            :type configuration_hash: string
+            :returns: the previous problem ids, feature vectors (memory-mapped),
+                description hashes, quantization codes and codebooks (None if not
+                compressed) and normalized descriptions (by problem id), None if
+                there's nothing to update
+            :rtype: dictionary
+        """
+        store = read_feature_vectors(self._feature_vector_store)
+        description_hashes = read_description_hashes(self._feature_vector_store)
+        if store is None or description_hashes is None:
+            return None
+        header, problem_ids, vectors = store
+        if header['model'] != model_name or header['configurationHash'] != configuration_hash:
+            return None
+
+        codes = None
+        codebooks = None
+        quantized_store = read_quantized_feature_vectors(self._feature_vector_store)
+        if quantized_store is not None:
+            codebooks, codes = quantized_store[2:]
+
+        normalized_descriptions = {}
+        if os.path.isfile(self._normalized_descriptions_file):
+            with open(self._normalized_descriptions_file) as normalized_descriptions_file:
+                for row in csv.DictReader(normalized_descriptions_file):
+                    normalized_descriptions[row['problem_id']] = row['normalized_description']
+
+        return {"problem_ids": [str(problem_id) for problem_id in problem_ids],
+                "vectors": vectors,
+                "description_hashes": description_hashes,
+                "codes": codes,
+                "codebooks": codebooks,
+                "normalized_descriptions": normalized_descriptions}
+
+    def _quantize(self, sentence_embeddings, previous, kept_rows, changed_rows):
+        """
+            Compute the product quantization codes of the feature vectors. The codes
+            of the kept problems and the codebooks are reused when available,
+            otherwise the codebooks are trained again on all the vectors.
+
+            :param sentence_embeddings: the feature vectors of all the problems
+            :type sentence_embeddings: ndarray of shape (n_problems, n_features)
+            :param previous: the previous preparation (see _read_previous_preparation)
+            :type previous: dictionary
+            :param kept_rows: row in the previous store of each kept problem, by row
+            :type kept_rows: dictionary
+            :param changed_rows: rows of the added or edited problems
+            :type changed_rows: array of integers
+            :returns: the codes and the codebooks
+            :rtype: tuple(ndarray, ndarray)
+        """
+        n_subspaces = self._product_quantization['n_subspaces']
+        n_centroids = self._product_quantization['n_centroids']
+        if previous is not None and previous['codes'] is not None \
+                and previous['codebooks'].shape[:2] == (n_subspaces, n_centroids):
+            quantizer = ProductQuantizer.from_codebooks(previous['codebooks'])
+            codes = np.empty((len(sentence_embeddings), n_subspaces), dtype=np.uint8)
+            if kept_rows:
+                codes[list(kept_rows)] = previous['codes'][list(kept_rows.values())]
+            if changed_rows:
+                codes[changed_rows] = quantizer.encode(sentence_embeddings[changed_rows])
+            return codes, quantizer.codebooks
+
+        quantizer = ProductQuantizer(n_subspaces, n_centroids)
+        codes = quantizer.fit(sentence_embeddings).encode(sentence_embeddings)
+        return codes, quantizer.codebooks
+
     def activate_pd_preparation_procedure(self):
         """
             Implements basic functionalities of the preparation service:
                 - read problem description from the "ProblemMappingFile.csv"
+                - compare them with the ones of the previous preparation (if
+                    incremental): only the added or edited problems are prepared,
+                    the removed ones are dropped
                 - data manipulation/normalization
-                - sentence embedding
-                - save problems' feature vectors on the "FeatureVectorOutputFile.csv"
+                - sentence embedding (both pipelined across process pools for the bulk
+                    preparations, if enabled), reusing the feature vectors of the sentences
+                    already encoded (see embedding_cache)
+                - save problems' feature vectors in the feature vector store (see
+                    feature_vector_store), optionally compressed with product
+                    quantization and exported to the "FeatureVectorOutputFile.csv"
+                - save normalized problem descriptions on the
+                    "NormalizedDescriptionsFile.csv" (used by the lexical prefilter of
+                    the troubleshooting_system)
         """
-        word_embedding_manager = WordEmbeddingManager()
+        word_embedding_manager = self._word_embedding_manager
+        data_manipulation_manager = word_embedding_manager.data_manipulation_manager
 
         if not self._wait_for_problem_mapping_file():
             return
@@ -125,13 +293,89 @@ class PDPreparationSystemService:
 
         sentence_list = [problem['problem description'] for problem in problem_mapping_data]
         id_list = [problem['problem id'] for problem in problem_mapping_data]
-        sentence_embeddings = word_embedding_manager.create_feature_vector(sentence_list)
-        head_rows = ["problem_id", *[f"feature{i}" for i in range(len(sentence_embeddings[0]))]]
+        description_hashes = [hashlib.sha256(sentence.encode()).hexdigest()
+                              for sentence in sentence_list]
+        configuration_hash = data_manipulation_manager.configuration_hash()
+
+        previous = None
+        if self._incremental_preparation:
+            previous = self._read_previous_preparation(word_embedding_manager.encoder_fingerprint,
+                                                       configuration_hash)
+
+        # row of each kept problem in the new store: row in the previous store
+        kept_rows = {}
+        previous_ids = []
+        if previous is not None:
+            previous_ids = previous['problem_ids']
+            previous_rows = {problem_id: row for row, problem_id in enumerate(previous_ids)}
+            for row, (problem_id, description_hash) in enumerate(zip(id_list,
+                                                                     description_hashes)):
+                previous_row = previous_rows.get(problem_id)
+                if previous_row is not None \
+                        and previous['description_hashes'][previous_row] == description_hash:
+                    kept_rows[row] = previous_row
+        changed_rows = [row for row in range(len(id_list)) if row not in kept_rows]
+        delta = {"added": len(set(id_list) - set(previous_ids)),
+                 "updated": 0,
+                 "removed": len(set(previous_ids) - set(id_list))}
+        delta['updated'] = len(changed_rows) - delta['added']
+
+        if previous is not None and not changed_rows and not delta['removed'] \
+                and len(previous_ids) == len(id_list):
+            print("No problem added, edited or removed since the previous preparation")
+            self._write_report("OK", delta=delta)
+            return
+
+        # normalized descriptions of the kept problems are reused when available
+        normalized_descriptions = previous['normalized_descriptions'] if previous else {}
+        to_normalize = [row for row in range(len(id_list))
+                        if row not in kept_rows or id_list[row] not in normalized_descriptions]
+        normalized_sentence_list = [normalized_descriptions.get(problem_id)
+                                    for problem_id in id_list]
+        if self._preparation_pool is not None and len(changed_rows) > \
+                self._parallel_preparation['chunk_size']:
+            # bulk preparation: normalization and encoding pipelined across the workers
+            normalized_sentences, embeddings = self._preparation_pool.prepare(
+                [sentence_list[row] for row in to_normalize], self._embedding_cache)
+            prepared_embeddings = dict(zip(to_normalize, embeddings))
+            changed_embeddings = [prepared_embeddings[row] for row in changed_rows]
+        else:
+            normalized_sentences = data_manipulation_manager.perform_data_manipulation(
+                [sentence_list[row] for row in to_normalize])
+            changed_embeddings = None
+        for row, normalized_sentence in zip(to_normalize, normalized_sentences):
+            normalized_sentence_list[row] = normalized_sentence
+
+        if changed_embeddings is None:
+            # only the sentences of the changed problems missing from the embedding cache
+            # are encoded
+            changed_embeddings = word_embedding_manager.embed_normalized_sentences(
+                [normalized_sentence_list[row] for row in changed_rows], self._embedding_cache)
+        if self._embedding_cache is not None:
+            self._embedding_cache.flush()
+
+        n_features = len(changed_embeddings[0]) if changed_embeddings \
+            else previous['vectors'].shape[1]
+        sentence_embeddings = np.empty((len(id_list), n_features), dtype=np.float32)
+        if kept_rows:
+            sentence_embeddings[list(kept_rows)] = \
+                previous['vectors'][list(kept_rows.values())]
+        if changed_rows:
+            sentence_embeddings[changed_rows] = changed_embeddings
 
-        feature_vector_output = []
-        for problem_id, sentence_embedding in zip(id_list, sentence_embeddings):
-            feature_vector_output.append(
-                dict(zip(head_rows, [problem_id, *sentence_embedding])))
+        codes = None
+        codebooks = None
+        if self._product_quantization['enabled']:
+            codes, codebooks = self._quantize(sentence_embeddings, previous, kept_rows,
+                                              changed_rows)
 
-        dump_csv(head_rows, feature_vector_output, self._feature_vector_output_file)
-        self._write_report("OK")
+        write_feature_vectors(self._feature_vector_store, id_list, sentence_embeddings,
+                              word_embedding_manager.encoder_fingerprint, configuration_hash,
+                              self._feature_vector_dtype, codes, codebooks, description_hashes)
+        if self._export_feature_vector_csv:
+            export_csv(self._feature_vector_store, self._feature_vector_output_file)
+        dump_csv(["problem_id", "normalized_description"],
+                 [{"problem_id": problem_id, "normalized_description": " ".join(sentence.split())}
+                  for problem_id, sentence in zip(id_list, normalized_sentence_list)],
+                 self._normalized_descriptions_file)
+        self._write_report("OK", delta=delta)
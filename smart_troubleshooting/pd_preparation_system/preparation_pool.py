@@ -0,0 +1,152 @@
+"""
+This module provides a pool of processes preparing the problem descriptions in
+parallel, for the bulk preparations (e.g. full rebuild of the feature vectors
+after a change of the embedding model or of the data manipulation configuration).
+
+Sentences are sorted by length and split in chunks: a first set of workers
+normalizes them, and each normalized chunk is handed to a second set of workers
+encoding it, so that the encoding of a chunk overlaps the normalization of the
+following ones.
+
+Author: Filippo Guggino
+"""
+import multiprocessing
+import os
+import weakref
+from concurrent.futures import ProcessPoolExecutor
+
+from smart_troubleshooting.pd_preparation_system.data_manipulation_manager \
+    import DataManipulationManager
+from smart_troubleshooting.pd_preparation_system.word_embedding_manager \
+    import WordEmbeddingManager, length_sorted_order
+
+# State of a worker process, set once by _init_normalizer or _init_encoder
+_worker = {}
+
+
+def _init_normalizer():
+    _worker['data_manipulation_manager'] = DataManipulationManager()
+
+
+def _init_encoder(model_name, max_seq_length, batch_size, quantization, n_threads):
+    # pylint: disable=import-outside-toplevel
+    import torch
+    # the cores are shared with the other encoding workers
+    torch.set_num_threads(n_threads)
+    word_embedding_manager = WordEmbeddingManager(max_seq_length, batch_size, quantization)
+    word_embedding_manager.model_name = model_name
+    _worker['word_embedding_manager'] = word_embedding_manager
+
+
+def _normalize_chunk(sentences):
+    return _worker['data_manipulation_manager'].perform_data_manipulation(sentences)
+
+
+def _encode_chunk(normalized_sentences):
+    return _worker['word_embedding_manager'].embed_normalized_sentences(normalized_sentences)
+
+
+def _release(*executors):
+    for executor in executors:
+        executor.shutdown()
+
+
+class PreparationPool:
+    """
+        Pools of worker processes normalizing and encoding chunks of problem
+        descriptions. Each encoding worker loads its own sentence transformer, on
+        first use. The pool is released (workers stopped) when it's closed or
+        garbage collected.
+    """
+
+    def __init__(self, word_embedding_manager, normalization_workers, encoding_workers,
+                 chunk_size=256):
+        """
+            :param word_embedding_manager: the manager whose data manipulation
+                configuration, embedding model and encoding settings are used by
+                the workers
+            :type word_embedding_manager: WordEmbeddingManager
+            :param normalization_workers: number of worker processes normalizing sentences
+            :type normalization_workers: integer
+            :param encoding_workers: number of worker processes encoding sentences
+            :type encoding_workers: integer
+            :param chunk_size: number of sentences handed at once to a worker
+            :type chunk_size: integer
+        """
+        self._word_embedding_manager = word_embedding_manager
+        self._chunk_size = chunk_size
+        n_threads = max(1, (os.cpu_count() or 1) // encoding_workers)
+
+        # workers are spawned: forking would copy the threads of the service
+        context = multiprocessing.get_context("spawn")
+        self._normalization_executor = ProcessPoolExecutor(
+            normalization_workers, mp_context=context, initializer=_init_normalizer)
+        self._encoding_executor = ProcessPoolExecutor(
+            encoding_workers, mp_context=context, initializer=_init_encoder,
+            initargs=(word_embedding_manager.model_name, word_embedding_manager.max_seq_length,
+                      word_embedding_manager.batch_size, word_embedding_manager.quantization,
+                      n_threads))
+        self._finalizer = weakref.finalize(self, _release, self._normalization_executor,
+                                           self._encoding_executor)
+
+    def prepare(self, sentences, cache=None):
+        """
+            Normalize and encode problem descriptions. If a cache is given, only
+            the sentences whose feature vector is missing from it are encoded
+            (see WordEmbeddingManager.embed_normalized_sentences).
+
+            :param sentences: problem descriptions
+            :type sentences: array of strings
+            :param cache: cache of feature vectors, offering get(key) and put(key, value)
+            :type cache: LRUCache or PersistentEmbeddingCache
+            :returns: the normalized sentences and their feature vectors
+            :rtype: tuple(array of strings, array of array of float)
+        """
+        # chunks (and batches) of sentences of similar length waste less padding
+        order = length_sorted_order(sentences)
+        sorted_sentences = [sentences[i] for i in order]
+        normalization_futures = [
+            self._normalization_executor.submit(_normalize_chunk,
+                                                sorted_sentences[start:start + self._chunk_size])
+            for start in range(0, len(sorted_sentences), self._chunk_size)]
+
+        normalized_sentences = []
+        encoded_chunks = []
+        # chunks are handed to the encoding workers as soon as they are normalized
+        for future in normalization_futures:
+            chunk = future.result()
+            normalized_sentences.extend(chunk)
+            cache_keys = None
+            embeddings = [None] * len(chunk)
+            if cache is not None:
+                cache_keys = self._word_embedding_manager.cache_keys(chunk)
+                embeddings = [cache.get(key) for key in cache_keys]
+            missing = [i for i, embedding in enumerate(embeddings) if embedding is None]
+            encoding_future = None
+            if missing:
+                encoding_future = self._encoding_executor.submit(
+                    _encode_chunk, [chunk[i] for i in missing])
+            encoded_chunks.append((embeddings, cache_keys, missing, encoding_future))
+
+        sentence_embeddings = []
+        for embeddings, cache_keys, missing, encoding_future in encoded_chunks:
+            if encoding_future is not None:
+                for i, embedding in zip(missing, encoding_future.result()):
+                    embeddings[i] = embedding
+                    if cache is not None:
+                        cache.put(cache_keys[i], embedding)
+            sentence_embeddings.extend(embeddings)
+
+        # back to the order of the given sentences
+        restored_sentences = [None] * len(sentences)
+        restored_embeddings = [None] * len(sentences)
+        for position, i in enumerate(order):
+            restored_sentences[i] = normalized_sentences[position]
+            restored_embeddings[i] = sentence_embeddings[position]
+        return restored_sentences, restored_embeddings
+
+    def close(self):
+        """
+            Stop the workers.
+        """
+        self._finalizer()
@@ -0,0 +1,100 @@
+"""
+Testing for NormalizationPipeline and DataManipulationManager classes.
+"""
+
+import json
+import os
+import shutil
+
+from smart_troubleshooting.pd_preparation_system.data_manipulation_manager import \
+    DataManipulationManager, NormalizationPipeline
+
+
+class SuffixStemmer:
+
+    def __init__(self):
+        self.calls = 0
+
+    def stem(self, word):
+        self.calls += 1
+        return word[:-1] if word.endswith("s") else word
+
+
+class IdentityLemmatizer:
+
+    @staticmethod
+    def lemmatize(word):
+        return word
+
+
+def configuration(**overrides):
+    return {
+        "toLowerCase": True,
+        "performLemmatization": True,
+        "performStemming": True,
+        "removeStopwords": True,
+        "removePunctuation": True,
+        "stopwords": ["printer"],
+        **overrides
+    }
+
+
+class TestNormalizationPipeline:
+
+    def test_normalize(self):
+        pipeline = NormalizationPipeline(configuration(), SuffixStemmer(), IdentityLemmatizer(),
+                                         {"the", "is"})
+        # every word is followed by a space, as the sentences already prepared
+        assert pipeline.normalize("The Printer is jamming papers!") == "jamming paper "
+
+    def test_stopwords_not_removed(self):
+        pipeline = NormalizationPipeline(configuration(removeStopwords=False), SuffixStemmer(),
+                                         IdentityLemmatizer(), {"the"})
+        assert pipeline.normalize("the printer") == "the printer "
+
+    def test_tokens_normalized_once(self):
+        stemmer = SuffixStemmer()
+        pipeline = NormalizationPipeline(configuration(), stemmer, IdentityLemmatizer(), set())
+        for _ in range(10):
+            pipeline.normalize("papers jam papers")
+        assert stemmer.calls == 2
+
+    def test_fingerprint(self):
+        first = NormalizationPipeline(configuration(removeStopwords=False,
+                                                    performStemming=False,
+                                                    performLemmatization=False))
+        second = NormalizationPipeline(configuration(removeStopwords=False,
+                                                     performStemming=False,
+                                                     performLemmatization=False,
+                                                     toLowerCase=False))
+        assert first.fingerprint != second.fingerprint
+        assert first.normalize("Paper, jam.") == "paper jam "
+        assert second.normalize("Paper, jam.") == "Paper jam "
+
+
+class TestDataManipulationManager:
+
+    def test_pipeline_follows_configuration(self, tmp_path, monkeypatch):
+        schema_path = DataManipulationManager._base_configuration_schema
+        os.makedirs(tmp_path / os.path.dirname(schema_path))
+        shutil.copy(schema_path, tmp_path / schema_path)
+        monkeypatch.chdir(tmp_path)
+        config_path = DataManipulationManager._base_configuration_path
+
+        def write_configuration(**overrides):
+            with open(config_path, "w") as config_file:
+                json.dump(configuration(removeStopwords=False, performStemming=False,
+                                        performLemmatization=False, **overrides), config_file)
+
+        write_configuration()
+        manager = DataManipulationManager()
+        pipeline = manager.pipeline()
+        assert manager.pipeline() is pipeline
+        assert manager.perform_data_manipulation(["Paper, jam."]) == ["paper jam "]
+
+        # the size changes with the configuration, so the change is detected
+        write_configuration(toLowerCase=False, stopwords=[])
+        assert manager.pipeline() is not pipeline
+        assert manager.pipeline().fingerprint == \
+            NormalizationPipeline(manager.current_configuration()).fingerprint
+        assert manager.perform_data_manipulation(["Paper, jam."]) == ["Paper jam "]
@@ -0,0 +1,76 @@
+"""
+Testing for the incremental preparation of PDPreparationSystemService class.
+"""
+
+import os
+import shutil
+
+import numpy as np
+
+from smart_troubleshooting.file_io import dump_csv, dump_json, load_json
+from smart_troubleshooting.feature_vector_store import read_feature_vectors
+from smart_troubleshooting.pd_preparation_system.pd_preparation_system_service import \
+    PDPreparationSystemService
+from smart_troubleshooting.pd_preparation_system.word_embedding_manager import \
+    WordEmbeddingManager
+
+SCHEMA_PATH = os.path.abspath(
+    "pd_preparation_system/json/schemas/basePreparationConfigSchema.json")
+
+
+class TestIncrementalPreparation:
+
+    def setup_method(self, test_method):
+        self.encoded = []
+
+    def fake_encode(self, sentences):
+        self.encoded.extend(sentences)
+        return [np.full(4, len(sentence), dtype=np.float32) for sentence in sentences]
+
+    def prepare(self, problems):
+        dump_csv(["problem id", "problem description"],
+                 [{"problem id": problem_id, "problem description": description}
+                  for problem_id, description in problems],
+                 "segregation_system/csv/ProblemMappingFile.csv")
+        self.encoded.clear()
+        self.service.activate_pd_preparation_procedure()
+        return load_json("pd_preparation_system/json/preparationReport.json")
+
+    def test_delta(self, tmp_path, monkeypatch):
+        monkeypatch.chdir(tmp_path)
+        os.makedirs("pd_preparation_system/json/schemas")
+        os.makedirs("segregation_system/csv")
+        os.makedirs("pd_preparation_system/csv")
+        shutil.copy(SCHEMA_PATH, "pd_preparation_system/json/schemas")
+        # normalization without NLTK resources
+        dump_json({"toLowerCase": True, "performLemmatization": False,
+                   "performStemming": False, "removeStopwords": False,
+                   "removePunctuation": True, "stopwords": []},
+                  "pd_preparation_system/json/basePreparationConfig.json")
+        monkeypatch.setattr(WordEmbeddingManager, "_encode",
+                            lambda manager, sentences: self.fake_encode(sentences))
+        monkeypatch.setattr(PDPreparationSystemService, "_preload_encoder", False)
+        monkeypatch.setattr(PDPreparationSystemService, "_embedding_cache_settings",
+                            {"enabled": False})
+        self.service = PDPreparationSystemService()
+
+        report = self.prepare([("1", "Paper jam"), ("2", "No power"), ("3", "Bad print")])
+        assert report["delta"] == {"added": 3, "updated": 0, "removed": 0}
+        assert len(self.encoded) == 3
+
+        report = self.prepare([("1", "Paper jam"), ("2", "No power")])
+        assert report["delta"] == {"added": 0, "updated": 0, "removed": 1}
+        assert not self.encoded
+
+        report = self.prepare([("1", "Paper jam"), ("2", "No power at all"), ("4", "Noise")])
+        assert report["delta"] == {"added": 1, "updated": 1, "removed": 0}
+        assert sorted(self.encoded) == ["no power at all ", "noise "]
+
+        _, problem_ids, vectors = read_feature_vectors("pd_preparation_system/feature_vectors")
+        assert problem_ids.tolist() == ["1", "2", "4"]
+        assert vectors[:, 0].tolist() == [len("paper jam "), len("no power at all "),
+                                          len("noise ")]
+
+        report = self.prepare([("1", "Paper jam"), ("2", "No power at all"), ("4", "Noise")])
+        assert report["delta"] == {"added": 0, "updated": 0, "removed": 0}
+        assert not self.encoded
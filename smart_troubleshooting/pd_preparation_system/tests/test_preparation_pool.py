@@ -0,0 +1,90 @@
+"""
+Testing for PreparationPool class.
+"""
+
+import os
+import shutil
+
+import numpy as np
+
+from smart_troubleshooting.file_io import dump_json
+from smart_troubleshooting.lru_cache import LRUCache
+from smart_troubleshooting.pd_preparation_system.data_manipulation_manager import \
+    DataManipulationManager
+from smart_troubleshooting.pd_preparation_system.preparation_pool import PreparationPool
+from smart_troubleshooting.pd_preparation_system.word_embedding_manager import \
+    WordEmbeddingManager
+
+SCHEMA_PATH = os.path.abspath(
+    "pd_preparation_system/json/schemas/basePreparationConfigSchema.json")
+
+# Stand-in for the sentence transformers package, imported by the spawned
+# encoding workers: every encoded sentence is logged next to the module
+FAKE_SENTENCE_TRANSFORMERS = '''
+import os
+
+import numpy as np
+
+LOG_PATH = os.path.join(os.path.dirname(__file__), "encoded.txt")
+
+
+class SentenceTransformer:
+
+    def __init__(self, model_name):
+        self.max_seq_length = None
+
+    def encode(self, sentences, batch_size=32, convert_to_numpy=True):
+        with open(LOG_PATH, "a") as log_file:
+            log_file.writelines(sentence + "\\n" for sentence in sentences)
+        return np.array([[len(sentence), len(sentence.split())] for sentence in sentences],
+                        dtype=np.float32)
+'''
+
+
+class TestPreparationPool:
+
+    def test_prepare(self, tmp_path, monkeypatch):
+        package_path = tmp_path / "packages" / "sentence_transformers"
+        os.makedirs(package_path)
+        with open(package_path / "__init__.py", "w") as module_file:
+            module_file.write(FAKE_SENTENCE_TRANSFORMERS)
+        # spawned workers inherit the path of the parent process
+        monkeypatch.syspath_prepend(str(tmp_path / "packages"))
+
+        monkeypatch.chdir(tmp_path)
+        os.makedirs("pd_preparation_system/json/schemas")
+        shutil.copy(SCHEMA_PATH, "pd_preparation_system/json/schemas")
+        # normalization without NLTK resources
+        dump_json({"toLowerCase": True, "performLemmatization": False,
+                   "performStemming": False, "removeStopwords": False,
+                   "removePunctuation": True, "stopwords": []},
+                  "pd_preparation_system/json/basePreparationConfig.json")
+
+        sentences = ["Paper jam!", "The printer does not start at all", "Noise",
+                     "No power, no lights", "Toner low"]
+        expected_sentences = DataManipulationManager().perform_data_manipulation(sentences)
+
+        word_embedding_manager = WordEmbeddingManager()
+        cache = LRUCache(16)
+        cached_key = word_embedding_manager.cache_keys([expected_sentences[3]])[0]
+        cache.put(cached_key, np.full(2, -1, dtype=np.float32))
+
+        pool = PreparationPool(word_embedding_manager, 1, 1, chunk_size=2)
+        try:
+            normalized_sentences, embeddings = pool.prepare(sentences, cache)
+        finally:
+            pool.close()
+
+        # sentences are sorted by length in the pool, and restored in the given order
+        assert normalized_sentences == expected_sentences
+        np.testing.assert_array_equal(embeddings[3], [-1, -1])
+        for i in (0, 1, 2, 4):
+            np.testing.assert_array_equal(
+                embeddings[i], [len(expected_sentences[i]), len(expected_sentences[i].split())])
+
+        # the cached sentence isn't sent to the encoding workers, the others are cached
+        with open(package_path / "encoded.txt") as log_file:
+            encoded = log_file.read().splitlines()
+        assert sorted(encoded) == sorted(expected_sentences[i] for i in (0, 1, 2, 4))
+        assert all(cache.get(key) is not None
+                   for key in word_embedding_manager.cache_keys(expected_sentences))
@@ -0,0 +1,61 @@
+"""
+Testing for the encoder front end of WordEmbeddingManager class.
+"""
+
+import sys
+import types
+
+import numpy as np
+import pytest
+
+from smart_troubleshooting.pd_preparation_system import word_embedding_manager
+from smart_troubleshooting.pd_preparation_system.word_embedding_manager import \
+    WordEmbeddingManager, length_sorted_order
+
+
+class FakeSentenceTransformer:
+
+    def __init__(self, model_name):
+        self.max_seq_length = 512
+
+    def encode(self, sentences, batch_size=32, convert_to_numpy=True):
+        # sentences are truncated to the cap of the model encoding them
+        return np.array([[min(len(sentence.split()), self.max_seq_length)]
+                         for sentence in sentences], dtype=np.float32)
+
+
+class TestWordEmbeddingManager:
+
+    def test_length_sorted_order(self):
+        sentences = ["paper jam", "printer does not start at all", "noise", "no power"]
+        assert length_sorted_order(sentences) == [1, 0, 3, 2]
+
+    def test_cache_keys(self):
+        sentences = ["paper  jam "]
+        short_keys = WordEmbeddingManager(max_seq_length=128).cache_keys(sentences)
+        long_keys = WordEmbeddingManager(max_seq_length=512).cache_keys(sentences)
+        assert short_keys[0][0] == "paper jam"
+        # truncation changes the feature vectors of the long sentences
+        assert short_keys != long_keys
+
+    def test_quantization(self):
+        with pytest.raises(ValueError):
+            WordEmbeddingManager(quantization="int4")
+        # quantized and full precision feature vectors are not interchangeable
+        assert WordEmbeddingManager(quantization="dynamic_int8").encoder_fingerprint != \
+            WordEmbeddingManager().encoder_fingerprint
+
+    def test_models_per_sequence_length(self, monkeypatch):
+        monkeypatch.setitem(sys.modules, "sentence_transformers",
+                            types.SimpleNamespace(SentenceTransformer=FakeSentenceTransformer))
+        monkeypatch.setattr(word_embedding_manager, "_sentence_transformers", {})
+        short_manager = WordEmbeddingManager(max_seq_length=2)
+        long_manager = WordEmbeddingManager(max_seq_length=8)
+
+        # a cap is never changed on a model shared with another one
+        assert short_manager.model is not long_manager.model
+        assert short_manager.model is WordEmbeddingManager(max_seq_length=2).model
+        sentence = ["printer does not start at all"]
+        assert long_manager.embed_normalized_sentences(sentence)[0][0] == 6
+        assert short_manager.embed_normalized_sentences(sentence)[0][0] == 2
+        assert long_manager.model.max_seq_length == 8
@@ -4,10 +4,65 @@
 
     Author: Filippo Guggino
 """
-from sentence_transformers import SentenceTransformer
+import threading
+
 from smart_troubleshooting.pd_preparation_system.data_manipulation_manager \
     import DataManipulationManager
 
+# Encoder modes: full precision, or linear layers dynamically quantized to int8 (CPU only)
+QUANTIZATIONS = ["none", "dynamic_int8"]
+
+# Sentence transformers loaded in this process, shared by all the services
+_sentence_transformers = {}
+_sentence_transformers_lock = threading.Lock()
+
+
+def get_sentence_transformer(model_name, quantization="none", max_seq_length=128):
+    """
+        Get the sentence transformer with the given name, loading it on first use.
+        The model is loaded once per process and settings, and shared by all its users.
+
+        :param model_name: name of the sentence transformer model (or path of a
+            model saved locally)
+        :type model_name: string
+        :param quantization: one of QUANTIZATIONS, "dynamic_int8" to quantize the
+            weights of the linear layers to int8 (activations are quantized on the fly)
+        :type quantization: string
+        :param max_seq_length: number of tokens after which sentences are truncated
+        :type max_seq_length: integer
+        :returns: the sentence transformer
+        :rtype: SentenceTransformer
+    """
+    # the truncation is part of the key: setting it on a model shared with
+    # another cap would change the feature vectors encoded concurrently
+    key = (model_name, quantization, max_seq_length)
+    with _sentence_transformers_lock:
+        if key not in _sentence_transformers:
+            # importing sentence_transformers loads torch, only done when needed
+            # pylint: disable=import-outside-toplevel
+            import torch
+            from sentence_transformers import SentenceTransformer
+            model = SentenceTransformer(model_name)
+            model.max_seq_length = max_seq_length
+            if quantization == "dynamic_int8":
+                model = torch.ao.quantization.quantize_dynamic(model.to("cpu"), {torch.nn.Linear},
+                                                               dtype=torch.qint8)
+            _sentence_transformers[key] = model
+        return _sentence_transformers[key]
+
+
+def length_sorted_order(sentences):
+    """
+        Order the sentences by decreasing number of words, so that batches of
+        consecutive sentences hold sentences of similar length (and little padding).
+
+        :param sentences: the sentences
+        :type sentences: array of strings
+        :returns: the indices of the sentences, the longest first
+        :rtype: array of integers
+    """
+    return sorted(range(len(sentences)), key=lambda i: -len(sentences[i].split()))
+
 
 class WordEmbeddingManager:
     """
@@ -15,16 +70,64 @@ class WordEmbeddingManager:
        starting from a vector of sentences. This is used both to train and use the NN.
     """
 
-    model = SentenceTransformer('paraphrase-distilroberta-base-v1')
+    model_name = 'paraphrase-distilroberta-base-v1'
     data_manipulation_manager = DataManipulationManager()
 
-    def create_feature_vector(self, sentences):
+    def __init__(self, max_seq_length=128, batch_size=32, quantization="none"):
+        """
+            :param max_seq_length: number of tokens after which sentences are truncated
+            :type max_seq_length: integer
+            :param batch_size: number of sentences encoded at once by the transformer
+            :type batch_size: integer
+            :param quantization: one of QUANTIZATIONS (see get_sentence_transformer)
+            :type quantization: string
+        """
+        if quantization not in QUANTIZATIONS:
+            raise ValueError("Unknown quantization: %s" % quantization)
+
+        self.max_seq_length = max_seq_length
+        self.batch_size = batch_size
+        self.quantization = quantization
+
+    @property
+    def encoder_fingerprint(self):
+        """
+            Identify the encoder: feature vectors generated with the same
+            fingerprint are generated the same way.
+        """
+        fingerprint = "%s/max_seq_length=%d" % (self.model_name, self.max_seq_length)
+        if self.quantization != "none":
+            fingerprint += "/" + self.quantization
+        return fingerprint
+
+    @property
+    def model(self):
+        """
+            The sentence transformer, loaded on first use (see get_sentence_transformer).
+        """
+        return get_sentence_transformer(self.model_name, self.quantization,
+                                        self.max_seq_length)
+
+    def preload(self):
+        """
+            Load the sentence transformer and run a first encoding, so that the
+            first real request doesn't pay the cold-start cost.
+        """
+        self._encode(["warm up"])
+
+    def create_feature_vector(self, sentences, cache=None):
         """
             Generate feature vectors of problem descriptions received through parameter "sentences"
 
+            If a cache is given, feature vectors are looked up by normalized sentence,
+            data manipulation configuration and embedding model, and only the sentences
+            missing from the cache are embedded.
+
             :param sentences: sentences on which perform data manipulation and sentence embedding.
                 ["problem description 1", ... , "problem description n"]
             :type sentences: array of strings (problem descriptions)
+            :param cache: cache of feature vectors, offering get(key) and put(key, value)
+            :type cache: LRUCache
             :returns: feature vector of normalized problem description sentences
             :rtype: array of array of float
                 [
@@ -35,8 +138,57 @@ class WordEmbeddingManager:
         """
         normalized_sentence_list = \
             self.data_manipulation_manager.perform_data_manipulation(sentences)
+        return self.embed_normalized_sentences(normalized_sentence_list, cache)
 
-        sentence_embeddings = self.model.encode(normalized_sentence_list, convert_to_numpy=True)
-        sentence_embeddings = [*sentence_embeddings.tolist()]
+    def embed_normalized_sentences(self, normalized_sentence_list, cache=None):
+        """
+            Generate feature vectors of sentences already normalized by the
+            data_manipulation_manager (see create_feature_vector).
+
+            :param normalized_sentence_list: normalized problem descriptions
+            :type normalized_sentence_list: array of strings
+            :param cache: cache of feature vectors, offering get(key) and put(key, value)
+            :type cache: LRUCache
+            :returns: feature vector of each sentence
+            :rtype: array of array of float
+        """
+        if cache is None:
+            return self._encode(normalized_sentence_list)
+
+        cache_keys = self.cache_keys(normalized_sentence_list)
+        sentence_embeddings = [cache.get(key) for key in cache_keys]
+
+        missing = [i for i, embedding in enumerate(sentence_embeddings) if embedding is None]
+        if missing:
+            missing_embeddings = self._encode([normalized_sentence_list[i] for i in missing])
+            for i, embedding in zip(missing, missing_embeddings):
+                sentence_embeddings[i] = embedding
+                cache.put(cache_keys[i], embedding)
 
         return sentence_embeddings
+
+    def cache_keys(self, normalized_sentence_list):
+        """
+            Compute the keys of the feature vectors of normalized sentences in a
+            cache: the sentence, the data manipulation configuration and the
+            encoder (see encoder_fingerprint).
+
+            :param normalized_sentence_list: normalized problem descriptions
+            :type normalized_sentence_list: array of strings
+            :returns: the key of each sentence
+            :rtype: array of tuples of strings
+        """
+        configuration = self.data_manipulation_manager.configuration_fingerprint()
+        encoder = self.encoder_fingerprint
+        return [(" ".join(sentence.split()), configuration, encoder)
+                for sentence in normalized_sentence_list]
+
+    def _encode(self, normalized_sentence_list):
+        # a pasted log is truncated (at max_seq_length) instead of blowing up the
+        # latency of its batch; sentences are sorted by length in batches by the
+        # transformer itself
+        sentence_embeddings = self.model.encode(normalized_sentence_list,
+                                                batch_size=self.batch_size,
+                                                convert_to_numpy=True)
+        # rows are kept as float32 arrays, without converting every value to a Python float
+        return list(sentence_embeddings)
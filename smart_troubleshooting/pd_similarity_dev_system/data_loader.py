@@ -7,8 +7,12 @@ Input files are separated into problem list and problem pairings.
 Author: Riccardo Mancini
 """
 
+import os
+
 import pandas as pd
 
+from smart_troubleshooting.feature_vector_store import read_feature_vectors
+
 
 class DataLoader:
     """
@@ -19,14 +23,25 @@ class DataLoader:
     def __init__(self, prob_desc_path):
         """Create a new DataLoader instance
 
-        :param prob_desc_path: path to the file containing the embeddings for
-            all problem descriptions. This file is expected to be a CSV with
-            problem_id as first column and then the embeddings.
+        :param prob_desc_path: path to the embeddings for all problem
+            descriptions. This is either a feature vector store directory
+            (see ``feature_vector_store``) or a CSV with problem_id as first
+            column and then the embeddings.
         :type prob_desc_path: str
         """
 
-        self._prob_desc = pd.read_csv(prob_desc_path, index_col=0, header=None,
-                                      skiprows=1)
+        if os.path.isdir(prob_desc_path):
+            _, problem_ids, vectors = read_feature_vectors(prob_desc_path)
+            try:
+                # ids are stored as strings, numeric ids are parsed like in the CSV
+                problem_ids = problem_ids.astype(int)
+            except ValueError:
+                pass
+            self._prob_desc = pd.DataFrame(
+                vectors.astype(float), index=pd.Index(problem_ids))
+        else:
+            self._prob_desc = pd.read_csv(prob_desc_path, index_col=0,
+                                          header=None, skiprows=1)
         self._prob_desc.index.name = "id"
 
         self._prob_desc.columns = [
@@ -5,7 +5,9 @@ is a wrapper around MLPRegressor.
 Author: Riccardo Mancini
 """
 
+import numpy as np
 from sklearn.neural_network import MLPRegressor
+from sklearn.neural_network._base import ACTIVATIONS
 from joblib import dump, load
 
 
@@ -87,7 +89,67 @@ class SimilarityModel:
 
         prediction = self._model.predict(input_data)
 
-        # force prediction within the required range
+        return self._force_range(prediction)
+
+    def project_first_layer(self, input_data):
+        """Compute the first-layer projections (without bias) of the given
+        problem embeddings.
+
+        The first layer of the MLP is linear, so the projection of the
+        difference between two embeddings is the difference of their
+        projections: ``W·(c - u) = W·c - W·u``. Projections of the candidate
+        problems can thus be computed once and reused by
+        ``predict_from_projections`` for every query.
+
+        :param input_data: The problem embeddings
+        :type input_data: ndarray of shape (n_samples, n_features)
+        :returns: The first-layer projections
+        :rtype: ndarray of shape (n_samples, n_hidden_units)
+        """
+
+        return np.asarray(input_data) @ self._model.coefs_[0]
+
+    def predict_from_projections(self, candidate_projections, query_data):
+        """Predict the similarity between each candidate and the query
+        problems, using the candidate first-layer projections.
+
+        The result is the same of ``predict(candidates - query)``, but only the
+        query embeddings need to be multiplied by the first-layer weights.
+
+        :param candidate_projections: The candidate projections, as returned
+            by ``project_first_layer``
+        :type candidate_projections: ndarray of shape
+            (n_candidates, n_hidden_units)
+        :param query_data: The query embedding or embeddings
+        :type query_data: ndarray of shape (n_features,) or
+            (n_queries, n_features)
+        :returns: The predicted values in the range [0,1]
+        :rtype: ndarray of shape (n_candidates,) or (n_queries, n_candidates)
+        """
+
+        query_projections = self.project_first_layer(np.atleast_2d(query_data))
+
+        # broadcast to (n_queries, n_candidates, n_hidden_units)
+        activation = candidate_projections[np.newaxis, :, :] \
+            - query_projections[:, np.newaxis, :] \
+            + self._model.intercepts_[0]
+
+        hidden_activation = ACTIVATIONS[self._model.activation]
+        for i in range(1, self._model.n_layers_ - 1):
+            hidden_activation(activation)
+            activation = activation @ self._model.coefs_[i] \
+                + self._model.intercepts_[i]
+        ACTIVATIONS[self._model.out_activation_](activation)
+
+        prediction = self._force_range(activation[:, :, 0])
+        if np.ndim(query_data) == 1:
+            return prediction[0]
+        return prediction
+
+    @staticmethod
+    def _force_range(prediction):
+        """Force prediction within the required range"""
+
         prediction[prediction < 0] = 0
         prediction[prediction > 1] = 1
 
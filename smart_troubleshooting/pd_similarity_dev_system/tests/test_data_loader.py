@@ -4,8 +4,12 @@ Testing for DataLoader class.
 Author: Riccardo Mancini
 """
 
+import tempfile
+
 import numpy as np
 
+from smart_troubleshooting.feature_vector_store import write_feature_vectors
+
 from smart_troubleshooting.pd_similarity_dev_system.data_loader \
     import DataLoader
 
@@ -28,3 +32,17 @@ class TestDataLoader:
 
         np.testing.assert_array_equal(x_train, expected_x)
         np.testing.assert_array_equal(y_train, expected_y)
+
+    def test_load_from_store(self):
+        embeddings = np.genfromtxt(path_of("dummy_problem_embeddings.csv"),
+                                   delimiter=',', skip_header=1)
+        with tempfile.TemporaryDirectory() as store_path:
+            write_feature_vectors(store_path, embeddings[:, 0].astype(int),
+                                  embeddings[:, 1:], "model", "hash")
+            x_train, y_train = DataLoader(store_path).load(
+                path_of("dummy_training_set.csv"))
+
+        expected_x = np.genfromtxt(
+            path_of("dummy_training_set_expected_x.csv"),
+            delimiter=',')
+        np.testing.assert_array_equal(x_train, expected_x)
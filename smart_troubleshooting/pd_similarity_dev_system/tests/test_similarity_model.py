@@ -47,6 +47,22 @@ class TestSimilarityModel:
         assert np.all(predictions <= 1)
         assert len(predictions) == len(self.y_test)
 
+    def test_predict_from_projections(self, params):
+        model = SimilarityModel(**params)
+        model.fit(self.x_train, self.y_train)
+
+        candidates = self.x_test
+        queries = self.x_validation[:3]
+        projections = model.project_first_layer(candidates)
+
+        for query in queries:
+            np.testing.assert_allclose(
+                model.predict_from_projections(projections, query),
+                model.predict(candidates - query))
+
+        batch_predictions = model.predict_from_projections(projections, queries)
+        assert batch_predictions.shape == (len(queries), len(candidates))
+
     def test_score(self, params):
         model = SimilarityModel(**params)
         model.fit(self.x_train, self.y_train)
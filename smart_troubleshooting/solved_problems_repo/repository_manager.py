@@ -70,6 +70,21 @@ class RepositoryManager:
             return self.__db.solutions.find_one({"_id": problem["solution_id"]})["description"]
         return None
 
+    def get_solutions(self, solution_ids):
+        """
+        Get the descriptions of a set of solutions with a single query
+        :param solution_ids: the ids of the solutions, missing ones (None or "None",
+            for the problems without a solution) are ignored
+        :return: a dictionary mapping each found solution id to its description
+        """
+        solution_ids_mongo = [ObjectId(solution_id) for solution_id in solution_ids
+                              if solution_id not in (None, "None")]
+        if not solution_ids_mongo:
+            return {}
+
+        result = self.__db.solutions.find({"_id": {"$in": solution_ids_mongo}})
+        return {str(solution["_id"]): solution["description"] for solution in result}
+
     def get_ingestion_records(self, max_age, max_records, keywords):
         """
         Get records ready to be used to ingest Neural Network training
@@ -9,6 +9,8 @@ Author: Leonardo Bacciottini
 import threading
 from datetime import datetime
 
+from bson.errors import InvalidId
+from pymongo.errors import PyMongoError
 
 from smart_troubleshooting.file_io import load_json, dump_json, validate_json
 from smart_troubleshooting.solved_problems_repo.repository_manager import RepositoryManager
@@ -35,6 +37,8 @@ class RepositoryService:
     # I/O files declaration
     __report_filename = None
     __ingestion_filename = None
+    __solution_index_filename = None
+    __solution_index_schema_name = None
 
     __req_filename = None
     __resp_filename = None
@@ -63,6 +67,8 @@ class RepositoryService:
 
             self.__report_filename = output_dir + "IngestionReport.json"
             self.__ingestion_filename = output_dir + "IngestionRecordsFile.json"
+            self.__solution_index_filename = output_dir + "SolutionIndexFile.json"
+            self.__solution_index_schema_name = schema_dir + "SolutionIndexFileSchema.json"
 
             self.__req_filename = input_dir + "SolutionRequestsFile.json"
             self.__resp_filename = output_dir + "SolutionResponsesFile.json"
@@ -198,11 +204,37 @@ class RepositoryService:
         }
         dump_json(init_records_json, self.__new_records_filename)
 
+    def __update_solution_index(self, repo_manager, ingestion_records):
+        """
+        Update SolutionIndexFile.json, mapping each ingested problem to its solution
+        and each solution to its description. Problems without a solution are left
+        out. All the referenced descriptions are retrieved again with a single query,
+        so that edited solutions are picked up (solutions have no version to compare);
+        the file is rewritten only if the index changed, so that the troubleshooting
+        system doesn't reload it (and drop its cached responses) for nothing.
+        :param repo_manager: a connected RepositoryManager
+        :param ingestion_records: the records of the ingestion dataset
+        :return: None
+        """
+        solution_index = load_json(self.__solution_index_filename)
+        schema = load_json(self.__solution_index_schema_name)
+        if solution_index is None or not validate_json(solution_index, schema):
+            solution_index = None
+
+        problems = {record["problem_id"]: record["solution_id"] for record in ingestion_records
+                    if record["solution_id"] != "None"}
+        solutions = repo_manager.get_solutions(set(problems.values()))
+
+        new_solution_index = {"problems": problems, "solutions": solutions}
+        if new_solution_index != solution_index:
+            dump_json(new_solution_index, self.__solution_index_filename)
+
     def activate_ingestion_procedure(self):
         """
         Read IngestionConfig.json to get configuration filters.
         Build a new ingestion dataset based on these filters.
-        Save the outcome in IngestionRecordsFile.json
+        Save the outcome in IngestionRecordsFile.json, and the solutions of the
+        ingested problems in SolutionIndexFile.json
         """
 
         # print("ingestion procedure started")
@@ -246,11 +278,17 @@ class RepositoryService:
             total += 1
             ingestion_records.append(record)
 
-        repo_manager.close()
-
         # dump new state of ingestion file
         dump_json(output_json, self.__ingestion_filename)
 
+        # the solution index is optional: the ingestion goes on without it
+        try:
+            self.__update_solution_index(repo_manager, ingestion_records)
+        except (InvalidId, PyMongoError) as error:
+            print("Warning: could not update the solution index: %s" % error)
+
+        repo_manager.close()
+
         # build report
         report = {
             "numberOfRecords": total,
@@ -7,5 +7,6 @@ Author: Leonardo Cecchelli
 from smart_troubleshooting.technical_support_system.main_menu import MainMenu
 
 
-technical_sys = MainMenu()
-technical_sys.start_interface()
+if __name__ == '__main__':
+    technical_sys = MainMenu()
+    technical_sys.start_interface()
@@ -6,6 +6,9 @@ applications.
 Author: Leonardo Cecchelli
 """
 
+import json
+import socket
+
 from smart_troubleshooting.file_io import load_json, validate_json, dump_json
 
 
@@ -14,7 +17,8 @@ class RequestManager:
     This class implements the APIs required to insert a new similar
     problems/solution request and to read
     a new similar problems/solution response. Everything is done
-    by using as I/O a set of json files.
+    by using as I/O a set of json files, except similar problems requests
+    which can be sent to the troubleshooting server if one is configured.
     """
 
     # I/O files
@@ -41,6 +45,65 @@ class RequestManager:
     __similar_problems_req_schema = \
         "technical_support_system/json/schemas/SimilarProblemsReqSchema.json"
 
+    # troubleshooting server (host, port, timeout), None to use json files
+    __troubleshooting_server = None
+
+    def set_troubleshooting_server(self, host, port, timeout=10):
+        """
+        Send similar problems requests to the troubleshooting server
+        instead of using the json files
+        :param host: the address of the troubleshooting server
+        :param port: the port of the troubleshooting server
+        :param timeout: the maximum time (in seconds) to wait for a response
+        """
+        self.__troubleshooting_server = (host, port, timeout)
+
+    def uses_troubleshooting_server(self):
+        """
+        Check whether similar problems requests are sent to the troubleshooting server
+        :return: True if a troubleshooting server has been set
+        """
+        return self.__troubleshooting_server is not None
+
+    def request_similar_problems(self, request_id, problem_desc):
+        """
+        Sends a new similar problem request to the troubleshooting server
+        and waits for its response
+        :param request_id: the id associated to the request
+        :param problem_desc: the problem description
+        inserted by the user through the GUI
+        :return: the response (similar problems IDs array and, if known,
+        their solutions) in case of success, an Error message in case of problems
+        """
+        host, port, timeout = self.__troubleshooting_server
+        req_json = {
+            "requests": [
+                {
+                    'requestID': request_id,
+                    'problemDescription': problem_desc
+                }
+            ]
+        }
+        try:
+            with socket.create_connection((host, port), timeout) as connection:
+                connection.sendall(json.dumps(req_json).encode() + b"\n")
+                with connection.makefile("r") as response_stream:
+                    data = json.loads(response_stream.readline())
+        except (OSError, ValueError) as err:
+            print("Error: could not reach the troubleshooting server: %s" % err)
+            return "Error"
+
+        schema = load_json(self.__similar_problems_response_schema)
+        if not validate_json(data, schema):
+            return "Error"
+        for prob in data['responses']:
+            if prob['requestID'] == request_id:
+                # the troubleshooting system couldn't answer the request
+                if prob.get('responseType', "OK") != "OK":
+                    return "Error"
+                return prob
+        return "Error"
+
     def add_similar_problem_req(self, request_id, problem_desc):
         """
         Inserts a new similar problem requests inside the corresponding json file
@@ -133,10 +196,10 @@ class RequestManager:
 
     def read_similar_prob(self, request_id):
         """
-        Reads all the problems IDs from the response json file
+        Reads the response to a similar problems request from the response json file
         :param request_id: the id associated to the request
-        :return: the requested problems IDs array in case of success,
-        an Error message in case of problems
+        :return: the response (similar problems IDs array and, if known,
+        their solutions) in case of success, an Error message in case of problems
         and a Not Found message if there is no response available at the moment
         """
         data = load_json(self.__similar_problems_response_file)
@@ -145,7 +208,9 @@ class RequestManager:
             return "Error"
         for prob in data['responses']:
             if prob['requestID'] == request_id:
-                return prob['problemsIDs']
+                if prob.get('responseType', "OK") != "OK":
+                    return "Error"
+                return prob
         return "Not Found"
 
     def read_solution(self, request_id):
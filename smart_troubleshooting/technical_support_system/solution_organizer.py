@@ -60,6 +60,10 @@ class SolutionOrganizer:
             self.num_tries = config_json['number_of_retry']
             if self.num_tries < 10:
                 self.num_tries = 200
+            server = config_json.get('troubleshooting_server')
+            if server is not None and server['enabled']:
+                request_manager.set_troubleshooting_server(
+                    server['host'], server['port'], server['timeout'])
         else:
             self.num_tries = 200
 
@@ -86,10 +90,16 @@ class SolutionOrganizer:
         message in case of success
         """
         self.similar_problem_req_id = self.similar_problem_req_id + 1
-        request_manager.add_similar_problem_req(self.similar_problem_req_id, problem_description)
+        if not request_manager.uses_troubleshooting_server():
+            request_manager.add_similar_problem_req(self.similar_problem_req_id,
+                                                    problem_description)
 
         while True:
-            response = request_manager.read_similar_prob(self.similar_problem_req_id)
+            if request_manager.uses_troubleshooting_server():
+                response = request_manager.request_similar_problems(
+                    self.similar_problem_req_id, problem_description)
+            else:
+                response = request_manager.read_similar_prob(self.similar_problem_req_id)
             if response == "Not Found":
                 self.num_tries = self.num_tries + 1
                 if self.num_tries == 200:
@@ -99,10 +109,13 @@ class SolutionOrganizer:
             if response == "Error":
                 return "Error"
             req_id = 0
-            for prob in response:
+            for prob in response['problemsIDs']:
                 req_id = req_id + 1
                 entry = {'requestID': req_id, 'problemID': prob}
                 problems_requested.append(entry)
+            # solutions already resolved by the Troubleshooting system
+            # don't need to be requested to the repository
+            solutions.extend(response.get('solutions', []))
             return "Ok"
 
     def compute_solution_list(self, problem_description):
@@ -114,7 +127,8 @@ class SolutionOrganizer:
         res = self.retrieve_similar_problems(problem_description)
         if res == "Error":
             return "No solutions"
-        retrieve_solutions()
+        if not solutions:
+            retrieve_solutions()
         if not solutions:
             return "None"
         return solutions
@@ -7,5 +7,8 @@ if __name__ == '__main__':
     # loads = range(5, 310, 10)
     # TestingFactory.test_non_elasticity_training_pipeline(loads)
     # TestingFactory.test_training_pipeline(300)
+    # TestingFactory.test_preparation_scaling([0, 1, 2, 4, 8, 16, 32])
+    # TestingFactory.test_encoding_latency([128, 256, 512])
+    # TestingFactory.test_quantized_encoder()
     loads = range(1, 10, 1)
     TestingFactory.test_non_elasticity_submission_pipeline(loads)
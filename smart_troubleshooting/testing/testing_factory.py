@@ -19,6 +19,9 @@ from smart_troubleshooting.solved_problems_repo.repository_service import \
     RepositoryService
 from smart_troubleshooting.pd_preparation_system.pd_preparation_system_service \
     import PDPreparationSystemService
+from smart_troubleshooting.pd_preparation_system.preparation_pool import PreparationPool
+from smart_troubleshooting.pd_preparation_system.word_embedding_manager \
+    import WordEmbeddingManager, length_sorted_order
 from smart_troubleshooting.troubleshooting_system.troubleshooting_system_service import \
     TroubleShootingSystemService
 from smart_troubleshooting.pd_similarity_dev_system.main import _main
@@ -273,3 +276,141 @@ class TestingFactory:
         out_data = np.column_stack((loads, results))
 
         dump_csv_array(out_data, output)
+
+    @staticmethod
+    def test_preparation_scaling(workers, problems_count=10000,
+                                 data_set="./testing/csv/dummy_dataset.csv",
+                                 output="./testing/csv/preparation_scaling.csv"):
+        """
+        Measure the time of a bulk preparation (normalization and encoding of
+        problem descriptions, without cache) for different numbers of workers,
+        and collect the results in an output file
+        :param workers: The list of numbers of encoding workers to test, 0 for the
+        single process preparation. The normalization workers are half of them.
+        :param problems_count: The number of problem descriptions prepared, taken
+        repeatedly from the data set
+        :param data_set: the csv file containing problem_description,solution_description rows
+        :param output: The output filename
+        :return: None
+        """
+        descriptions = []
+        read_csv(data_set, lambda row: descriptions.append(row[0]))
+        sentences = [descriptions[i % len(descriptions)] for i in range(problems_count)]
+
+        word_embedding_manager = WordEmbeddingManager()
+        # the single process preparation doesn't pay the loading of the model
+        word_embedding_manager.preload()
+
+        results = []
+        for n_workers in workers:
+            if n_workers == 0:
+                starting_time = time.perf_counter()
+                word_embedding_manager.create_feature_vector(sentences)
+            else:
+                pool = PreparationPool(word_embedding_manager, max(1, n_workers // 2), n_workers)
+                # warm up the workers, loading the model in each of them
+                pool.prepare(sentences[:n_workers * 256])
+                starting_time = time.perf_counter()
+                pool.prepare(sentences)
+                pool.close()
+            results.append(time.perf_counter() - starting_time)
+            print("%d workers: %.2f s" % (n_workers, results[-1]))
+
+        out_data = np.column_stack((workers, results))
+
+        dump_csv_array(out_data, output)
+
+    @staticmethod
+    def test_encoding_latency(max_seq_lengths, problems_count=1000, log_rate=0.05,
+                              data_set="./testing/csv/dummy_dataset.csv",
+                              output="./testing/csv/encoding_latency.csv"):
+        """
+        Measure the bulk encoding time (in chunks of 256 sentences, in arrival order
+        and sorted by length) and the latency of single requests for different
+        sequence length caps, on problem descriptions mixed with pasted logs
+        :param max_seq_lengths: The list of sequence length caps to test
+        :param problems_count: The number of problem descriptions encoded
+        :param log_rate: The fraction of problem descriptions replaced by a log
+        (300 to 2000 words)
+        :param data_set: the csv file containing problem_description,solution_description rows
+        :param output: The output filename, with a row (max_seq_length, arrival order
+        time, sorted time, median latency, 99th percentile latency) per cap
+        :return: None
+        """
+        descriptions = []
+        read_csv(data_set, lambda row: descriptions.append(row[0]))
+        words = " ".join(descriptions).split()
+        rng = np.random.default_rng(0)
+        sentences = [" ".join(rng.choice(words, rng.integers(300, 2000)))
+                     if rng.random() < log_rate else descriptions[i % len(descriptions)]
+                     for i in range(problems_count)]
+        sorted_sentences = [sentences[i] for i in length_sorted_order(sentences)]
+
+        results = []
+        for max_seq_length in max_seq_lengths:
+            word_embedding_manager = WordEmbeddingManager(max_seq_length)
+            word_embedding_manager.preload()
+            bulk_times = []
+            for order in (sentences, sorted_sentences):
+                starting_time = time.perf_counter()
+                for start in range(0, len(order), 256):
+                    word_embedding_manager.embed_normalized_sentences(order[start:start + 256])
+                bulk_times.append(time.perf_counter() - starting_time)
+            latencies = []
+            for sentence in sentences[:200]:
+                starting_time = time.perf_counter()
+                word_embedding_manager.embed_normalized_sentences([sentence])
+                latencies.append(time.perf_counter() - starting_time)
+            results.append([max_seq_length, *bulk_times, *np.percentile(latencies, [50, 99])])
+            print("max_seq_length %d: arrival order %.2f s, sorted %.2f s, "
+                  "p50 %.3f s, p99 %.3f s" % tuple(results[-1]))
+
+        dump_csv_array(results, output)
+
+    @staticmethod
+    def test_quantized_encoder(quantization="dynamic_int8",
+                               data_set="./testing/csv/dummy_dataset.csv",
+                               output="./testing/json/quantized_encoder_report.json"):
+        """
+        Compare a quantized encoder with the full precision one on a problem set:
+        accuracy parity (cosine similarity between the feature vectors of the same
+        problem description, agreement of their nearest neighbours) and throughput
+        :param quantization: The quantization of the tested encoder
+        (see word_embedding_manager.QUANTIZATIONS)
+        :param data_set: the csv file containing problem_description,solution_description rows
+        :param output: The output filename
+        :return: the report
+        """
+        descriptions = []
+        read_csv(data_set, lambda row: descriptions.append(row[0]))
+
+        report = {"problems": len(descriptions)}
+        feature_vectors = {}
+        for mode in ("none", quantization):
+            word_embedding_manager = WordEmbeddingManager(quantization=mode)
+            word_embedding_manager.preload()
+            starting_time = time.perf_counter()
+            vectors = np.asarray(word_embedding_manager.create_feature_vector(descriptions))
+            elapsed_time = time.perf_counter() - starting_time
+            report[mode] = {"seconds": elapsed_time,
+                            "sentencesPerSecond": len(descriptions) / elapsed_time}
+            feature_vectors[mode] = vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+        cosine_similarities = np.sum(feature_vectors["none"] * feature_vectors[quantization],
+                                     axis=1)
+        neighbours = {mode: np.argsort(-(vectors @ vectors.T), axis=1)[:, 1:11]
+                      for mode, vectors in feature_vectors.items()}
+        report["parity"] = {
+            "meanCosineSimilarity": float(cosine_similarities.mean()),
+            "minCosineSimilarity": float(cosine_similarities.min()),
+            # fraction of the 10 nearest neighbours of each problem found by both encoders
+            "neighbourAgreement": float(np.mean([
+                len(np.intersect1d(full_precision, quantized)) / 10
+                for full_precision, quantized in zip(neighbours["none"],
+                                                     neighbours[quantization])]))
+        }
+        report["speedup"] = report["none"]["seconds"] / report[quantization]["seconds"]
+        print(report)
+
+        dump_json(report, output)
+        return report
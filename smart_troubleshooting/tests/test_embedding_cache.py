@@ -0,0 +1,57 @@
+"""
+Testing for PersistentEmbeddingCache class.
+"""
+
+import os
+import tempfile
+
+import numpy as np
+
+from smart_troubleshooting.embedding_cache import PersistentEmbeddingCache
+
+
+class TestPersistentEmbeddingCache:
+
+    def setup_method(self, test_method):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.cache_path = os.path.join(self.temp_dir.name, "cache", "embeddings.sqlite3")
+
+    def teardown_method(self, test_method):
+        self.temp_dir.cleanup()
+
+    def test_persistence(self):
+        vector = np.random.rand(8).astype(np.float32)
+        cache = PersistentEmbeddingCache(self.cache_path)
+        cache.put(("printer jam", "configuration", "model"), vector)
+        cache.close()
+
+        cache = PersistentEmbeddingCache(self.cache_path)
+        assert np.array_equal(cache.get(("printer jam", "configuration", "model")), vector)
+        # the configuration and the model are part of the key
+        assert cache.get(("printer jam", "other configuration", "model")) is None
+        assert cache.get(("printer jam", "configuration", "other model")) is None
+        cache.close()
+
+    def test_eviction(self):
+        cache = PersistentEmbeddingCache(self.cache_path, max_entries=2)
+        for sentence in ("a", "b"):
+            cache.put((sentence, "configuration", "model"), np.zeros(4))
+        cache.flush()
+        cache.get(("a", "configuration", "model"))
+        cache.put(("c", "configuration", "model"), np.zeros(4))
+        cache.flush()
+
+        # "b" is the least recently used entry
+        assert len(cache) == 2
+        assert cache.get(("b", "configuration", "model")) is None
+        assert cache.get(("a", "configuration", "model")) is not None
+        assert cache.get(("c", "configuration", "model")) is not None
+        cache.close()
+
+    def test_stats(self):
+        cache = PersistentEmbeddingCache(self.cache_path)
+        cache.put(("a", "configuration", "model"), np.zeros(4))
+        cache.get(("a", "configuration", "model"))
+        cache.get(("b", "configuration", "model"))
+        assert cache.stats() == {"size": 1, "hits": 1, "misses": 1, "hitRate": 0.5}
+        cache.close()
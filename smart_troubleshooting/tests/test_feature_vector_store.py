@@ -0,0 +1,85 @@
+"""
+Testing for the feature vector store.
+"""
+
+import os
+import tempfile
+
+import numpy as np
+
+from smart_troubleshooting.feature_vector_store import export_csv, read_description_hashes, \
+    read_feature_vectors, read_quantized_feature_vectors, write_feature_vectors
+
+
+class TestFeatureVectorStore:
+
+    def setup_method(self, test_method):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.store_path = os.path.join(self.temp_dir.name, "feature_vectors")
+        self.vectors = np.random.rand(4, 3).astype(np.float32)
+
+    def teardown_method(self, test_method):
+        self.temp_dir.cleanup()
+
+    def test_read_missing(self):
+        assert read_feature_vectors(self.store_path) is None
+
+    def test_write_read(self):
+        write_feature_vectors(self.store_path, ["1", "2", "3", "4"], self.vectors,
+                              "model", "hash")
+        header, problem_ids, vectors = read_feature_vectors(self.store_path)
+
+        assert header["count"] == 4 and header["dimensions"] == 3
+        assert header["model"] == "model" and header["configurationHash"] == "hash"
+        assert problem_ids.tolist() == ["1", "2", "3", "4"]
+        assert isinstance(vectors, np.memmap)
+        np.testing.assert_array_equal(vectors, self.vectors)
+
+    def test_new_revision(self):
+        write_feature_vectors(self.store_path, ["1", "2", "3", "4"], self.vectors,
+                              "model", "hash")
+        write_feature_vectors(self.store_path, ["5"], self.vectors[:1],
+                              "model", "hash", dtype="float16")
+        header, problem_ids, vectors = read_feature_vectors(self.store_path)
+
+        assert problem_ids.tolist() == ["5"]
+        assert vectors.dtype == np.float16
+        np.testing.assert_allclose(vectors, self.vectors[:1], rtol=1e-3)
+        # only the files of the current revision are kept
+        assert sorted(os.listdir(self.store_path)) == \
+            sorted(["header.json", header["vectorsFile"], header["idsFile"]])
+
+    def test_quantized(self):
+        write_feature_vectors(self.store_path, ["1", "2", "3", "4"], self.vectors,
+                              "model", "hash")
+        assert read_quantized_feature_vectors(self.store_path) is None
+
+        codes = np.arange(8).reshape(4, 2)
+        codebooks = np.random.rand(2, 4, 3).astype(np.float32)
+        write_feature_vectors(self.store_path, ["1", "2", "3", "4"], self.vectors,
+                              "model", "hash", codes=codes, codebooks=codebooks)
+        _, problem_ids, stored_codebooks, stored_codes = \
+            read_quantized_feature_vectors(self.store_path)
+        assert problem_ids.tolist() == ["1", "2", "3", "4"]
+        assert stored_codes.dtype == np.uint8
+        np.testing.assert_array_equal(stored_codes, codes)
+        np.testing.assert_array_equal(stored_codebooks, codebooks)
+
+    def test_description_hashes(self):
+        write_feature_vectors(self.store_path, ["1", "2", "3", "4"], self.vectors,
+                              "model", "hash")
+        assert read_description_hashes(self.store_path) is None
+
+        write_feature_vectors(self.store_path, ["1", "2", "3", "4"], self.vectors,
+                              "model", "hash", description_hashes=["a", "b", "c", "d"])
+        assert read_description_hashes(self.store_path).tolist() == ["a", "b", "c", "d"]
+
+    def test_export_csv(self):
+        write_feature_vectors(self.store_path, ["1", "2", "3", "4"], self.vectors,
+                              "model", "hash")
+        csv_path = os.path.join(self.temp_dir.name, "FeatureVectorOutputFile.csv")
+        export_csv(self.store_path, csv_path)
+
+        csv_rows = np.loadtxt(csv_path, delimiter=',', skiprows=1, ndmin=2)
+        np.testing.assert_array_equal(csv_rows[:, 0], [1, 2, 3, 4])
+        np.testing.assert_allclose(csv_rows[:, 1:], self.vectors, rtol=1e-6)
@@ -0,0 +1,48 @@
+"""
+Testing for LRUCache class.
+"""
+
+import time
+
+from smart_troubleshooting.lru_cache import LRUCache
+
+
+class TestLRUCache:
+
+    def test_eviction(self):
+        cache = LRUCache(maxsize=2)
+        cache.put("a", 1)
+        cache.put("b", 2)
+        assert cache.get("a") == 1
+        cache.put("c", 3)
+
+        # "b" is the least recently used entry
+        assert cache.get("b") is None
+        assert cache.get("a") == 1
+        assert cache.get("c") == 3
+        assert len(cache) == 2
+
+    def test_stats(self):
+        cache = LRUCache(maxsize=2)
+        cache.put("a", 1)
+        cache.get("a")
+        cache.get("b")
+
+        stats = cache.stats()
+        assert stats["hits"] == 1
+        assert stats["misses"] == 1
+        assert stats["hitRate"] == 0.5
+
+    def test_disabled(self):
+        cache = LRUCache(maxsize=0)
+        cache.put("a", 1)
+        assert cache.get("a") is None
+
+    def test_ttl(self):
+        cache = LRUCache(maxsize=2, ttl=0.05)
+        cache.put("a", 1)
+        assert cache.get("a") == 1
+
+        time.sleep(0.1)
+        assert cache.get("a") is None
+        assert len(cache) == 0
@@ -0,0 +1,64 @@
+"""
+Testing for the startup time of the service entry points: importing them must
+not load the heavy libraries (torch, sentence transformers, NLTK) nor access
+the network. Entry points whose third-party dependencies are not installed
+are skipped.
+"""
+
+import os
+import subprocess
+import sys
+
+import pytest
+
+# Maximum import time (in seconds) of an entry point: the slowest ones import
+# scikit-learn (about 2 s), importing sentence transformers alone takes longer
+STARTUP_BUDGET = 4
+
+ENTRY_POINTS = [
+    "global_main",
+    "smart_troubleshooting.troubleshooting_system.main",
+    "smart_troubleshooting.troubleshooting_system.troubleshooting_system_service",
+    "smart_troubleshooting.pd_preparation_system.main",
+    "smart_troubleshooting.pd_preparation_system.pd_preparation_system_service",
+    "smart_troubleshooting.solved_problems_repo.main",
+    "smart_troubleshooting.segregation_system.main",
+    "smart_troubleshooting.pd_similarity_dev_system.main",
+    "smart_troubleshooting.technical_support_system.main",
+    "smart_troubleshooting.performance_monitoring_system.main",
+    "smart_troubleshooting.testing.main",
+]
+
+LAZY_MODULES = ["torch", "sentence_transformers", "nltk"]
+
+IMPORT_SCRIPT = """
+import sys
+import time
+start = time.perf_counter()
+try:
+    import {module}
+except ModuleNotFoundError as error:
+    if error.name.split(".")[0] == "smart_troubleshooting":
+        raise
+    print("missing " + error.name)
+    sys.exit()
+print(time.perf_counter() - start)
+print(",".join(name for name in {lazy_modules} if name in sys.modules))
+"""
+
+
+@pytest.mark.parametrize("module", ENTRY_POINTS)
+def test_startup_time(module):
+    repository_root = os.path.dirname(os.path.dirname(os.path.dirname(
+        os.path.realpath(__file__))))
+    environment = {**os.environ, "PYTHONPATH": repository_root}
+
+    output = subprocess.run(
+        [sys.executable, "-c", IMPORT_SCRIPT.format(module=module, lazy_modules=LAZY_MODULES)],
+        env=environment, capture_output=True, text=True, check=True,
+        timeout=60).stdout.splitlines()
+
+    if output[0].startswith("missing "):
+        pytest.skip("%s is not installed" % output[0].split()[1])
+    assert float(output[0]) < STARTUP_BUDGET
+    assert output[1] == ""
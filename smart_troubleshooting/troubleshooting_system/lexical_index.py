@@ -0,0 +1,110 @@
+"""
+This module provides a lexical (BM25) index over the normalized descriptions of
+the candidate problems, used to shortlist the candidates sharing words with the
+query before they are scored by the similarity model.
+
+Author: Filippo Guggino
+"""
+import numpy as np
+
+
+class BM25Index:
+    """
+        Inverted index storing, for each token, the candidates containing it
+        together with the BM25 weight of the token in each of them, so that a
+        query only visits the postings of its own tokens.
+    """
+
+    def __init__(self, k1=1.5, b=0.75):
+        """
+            :param k1: term frequency saturation
+            :type k1: float
+            :param b: document length normalization, between 0 and 1
+            :type b: float
+        """
+        self.k1 = k1
+        self.b = b
+        self._vocabulary = {}
+        self._n_documents = 0
+        self._postings_offsets = None
+        self._postings_documents = None
+        self._postings_weights = None
+
+    def fit(self, documents):
+        """
+            Build the index over the given documents.
+
+            :param documents: the tokens of each candidate problem
+            :type documents: array of arrays of strings
+            :returns: self
+        """
+        self._vocabulary = {}
+        self._n_documents = len(documents)
+        term_ids = []
+        document_ids = []
+        for document_id, tokens in enumerate(documents):
+            for token in tokens:
+                term_ids.append(self._vocabulary.setdefault(token, len(self._vocabulary)))
+                document_ids.append(document_id)
+
+        term_ids = np.array(term_ids, dtype=np.int64)
+        document_ids = np.array(document_ids, dtype=np.int64)
+        lengths = np.bincount(document_ids, minlength=self._n_documents)
+
+        # (term, document) pairs sorted by term, with the term frequencies
+        pairs, term_frequencies = np.unique(term_ids * max(self._n_documents, 1) + document_ids,
+                                            return_counts=True)
+        terms = pairs // max(self._n_documents, 1)
+        self._postings_documents = pairs % max(self._n_documents, 1)
+        # postings of the i-th term are at _postings_offsets[i]:_postings_offsets[i+1]
+        document_frequencies = np.bincount(terms, minlength=len(self._vocabulary))
+        self._postings_offsets = np.concatenate(([0], np.cumsum(document_frequencies)))
+
+        idf = np.log(1 + (self._n_documents - document_frequencies + 0.5)
+                     / (document_frequencies + 0.5))
+        relative_lengths = lengths[self._postings_documents] / max(lengths.mean(), 1)
+        self._postings_weights = idf[terms] * term_frequencies * (self.k1 + 1) \
+            / (term_frequencies + self.k1 * (1 - self.b + self.b * relative_lengths))
+        return self
+
+    def score(self, tokens):
+        """
+            Compute the BM25 score of every candidate for a query.
+
+            :param tokens: the tokens of the query
+            :type tokens: array of strings
+            :returns: the score of each candidate, 0 if it shares no token with the query
+            :rtype: ndarray of shape (n_candidates,)
+        """
+        scores = np.zeros(self._n_documents)
+        for token in tokens:
+            term = self._vocabulary.get(token)
+            if term is None:
+                continue
+            postings = slice(self._postings_offsets[term], self._postings_offsets[term + 1])
+            # a candidate appears at most once in the postings of a term
+            scores[self._postings_documents[postings]] += self._postings_weights[postings]
+        return scores
+
+    def search(self, queries, shortlist_size):
+        """
+            Shortlist the candidates with the highest BM25 score for each query.
+
+            :param queries: the tokens of each query
+            :type queries: array of arrays of strings
+            :param shortlist_size: maximum number of candidates returned for each query
+            :type shortlist_size: integer
+            :returns: for each query, the indices of the shortlisted candidates (only
+                the ones sharing at least a token with the query, in no particular
+                order) and their scores
+            :rtype: list of tuple(ndarray, ndarray)
+        """
+        shortlists = []
+        for tokens in queries:
+            scores = self.score(tokens)
+            candidates = np.flatnonzero(scores)
+            if len(candidates) > shortlist_size:
+                candidates = candidates[np.argpartition(-scores[candidates], shortlist_size - 1)
+                                        [:shortlist_size]]
+            shortlists.append((candidates, scores[candidates]))
+        return shortlists
@@ -3,4 +3,7 @@ from smart_troubleshooting.troubleshooting_system.troubleshooting_system_service
 
 if __name__ == '__main__':
     troubleshooting_service = TroubleShootingSystemService()
-    troubleshooting_service.schedule_troubleshooting_procedure()
+    if troubleshooting_service.is_server_enabled():
+        troubleshooting_service.start_troubleshooting_server()
+    else:
+        troubleshooting_service.schedule_troubleshooting_procedure()
@@ -0,0 +1,126 @@
+"""
+This module provides a micro-batcher collecting the requests received by the
+troubleshooting server, so that they are embedded and scored together.
+
+Author: Filippo Guggino
+"""
+import asyncio
+from collections import Counter, deque
+
+
+class MicroBatcher:
+    """
+        Collects requests for up to window_ms milliseconds (or until max_batch_size
+        requests are pending), then solves them with a single call and fans the
+        responses back out to the waiting callers.
+
+        Responses are matched to requests by position, since request ids are only
+        unique within the client that generated them.
+
+        Batch sizes and queueing delays are recorded to tune the window.
+    """
+    # Number of recent queueing delays kept to compute the percentiles
+    _delay_samples = 1000
+
+    def __init__(self, solve_requests, window_ms=5, max_batch_size=32):
+        """
+            :param solve_requests: function solving a list of requests, returning
+                the list of responses in the same order (or None on failure)
+            :type solve_requests: callable
+            :param window_ms: maximum time a request waits for other requests
+            :type window_ms: float
+            :param max_batch_size: maximum number of requests solved together
+            :type max_batch_size: integer
+        """
+        self._solve_requests = solve_requests
+        self._window = window_ms / 1000
+        self._max_batch_size = max_batch_size
+        self._pending = []
+        self._flush_handle = None
+        self._batch_sizes = Counter()
+        self._delays = deque(maxlen=self._delay_samples)
+        self._total_delay = 0.0
+        self._total_requests = 0
+
+    async def submit(self, requests):
+        """
+            Enqueue the requests and wait for their responses.
+
+            :param requests: the requests to solve
+            :type requests: array of dictionaries
+            :returns: the responses, in the same order of the requests
+                (None for the requests that couldn't be solved)
+            :rtype: array of dictionaries
+        """
+        loop = asyncio.get_event_loop()
+        futures = []
+        for request in requests:
+            future = loop.create_future()
+            self._pending.append((request, future, loop.time()))
+            futures.append(future)
+
+        if len(self._pending) >= self._max_batch_size:
+            self._flush()
+        elif self._flush_handle is None:
+            self._flush_handle = loop.call_later(self._window, self._flush)
+
+        return await asyncio.gather(*futures)
+
+    def _flush(self):
+        loop = asyncio.get_event_loop()
+        if self._flush_handle is not None:
+            self._flush_handle.cancel()
+            self._flush_handle = None
+
+        while self._pending:
+            batch = self._pending[:self._max_batch_size]
+            self._pending = self._pending[self._max_batch_size:]
+
+            now = loop.time()
+            self._batch_sizes[len(batch)] += 1
+            for _, _, arrival_time in batch:
+                self._delays.append(now - arrival_time)
+                self._total_delay += now - arrival_time
+            self._total_requests += len(batch)
+
+            loop.create_task(self._solve_batch(batch))
+
+    async def _solve_batch(self, batch):
+        loop = asyncio.get_event_loop()
+        requests = [request for request, _, _ in batch]
+        try:
+            responses = await loop.run_in_executor(None, self._solve_requests, requests)
+        except Exception as err:  # pylint: disable=broad-except
+            for _, future, _ in batch:
+                future.set_exception(err)
+            return
+
+        if responses is None:
+            responses = [None] * len(batch)
+        for (_, future, _), response in zip(batch, responses):
+            future.set_result(response)
+
+    def metrics(self):
+        """
+            Get the batching metrics.
+
+            :returns: distribution of the batch sizes and queueing delay statistics
+                (in milliseconds)
+            :rtype: dictionary
+        """
+        delays = sorted(self._delays)
+
+        def percentile(fraction):
+            if not delays:
+                return 0.0
+            return delays[min(int(fraction * len(delays)), len(delays) - 1)] * 1000
+
+        return {
+            "batchSizes": {str(size): count for size, count in sorted(self._batch_sizes.items())},
+            "requests": self._total_requests,
+            "meanQueueingDelay":
+                self._total_delay / self._total_requests * 1000 if self._total_requests else 0.0,
+            "medianQueueingDelay": percentile(0.5),
+            "p99QueueingDelay": percentile(0.99),
+            "maxQueueingDelay": delays[-1] * 1000 if delays else 0.0
+        }
@@ -0,0 +1,159 @@
+"""
+This module provides a product quantization codec for the feature vectors of the
+candidate problems: each vector is split in sub-vectors, and each sub-vector is
+replaced by the index of the closest centroid of its subspace (one byte).
+
+Distances between a query and the compressed candidates are computed without
+decoding them (asymmetric distance computation), to shortlist the candidates
+to be scored by the similarity model.
+
+Author: Filippo Guggino
+"""
+import numpy as np
+
+from smart_troubleshooting.troubleshooting_system.vector_index import \
+    assign_clusters, kmeans, squared_distances
+
+
+class ProductQuantizer:
+    """
+        Product quantizer with n_subspaces codebooks of up to 256 centroids,
+        so that a vector is encoded in n_subspaces bytes.
+    """
+    # Maximum number of training points used to compute the codebooks
+    _training_points = 65536
+
+    def __init__(self, n_subspaces=96, n_centroids=256, random_state=0):
+        """
+            :param n_subspaces: number of sub-vectors, must divide the number of features
+            :type n_subspaces: integer
+            :param n_centroids: number of centroids of each subspace, at most 256
+            :type n_centroids: integer
+            :param random_state: seed used to train the codebooks
+            :type random_state: integer
+        """
+        if not 0 < n_centroids <= 256:
+            raise ValueError("Codes are stored in a byte: n_centroids must be in [1, 256]")
+
+        self.n_subspaces = n_subspaces
+        self.n_centroids = n_centroids
+        self.random_state = random_state
+        # codebook of the i-th subspace is codebooks[i]
+        self.codebooks = None
+
+    @classmethod
+    def from_codebooks(cls, codebooks):
+        """
+            Build a trained quantizer from its codebooks.
+
+            :param codebooks: the codebooks, as returned by fit
+            :type codebooks: ndarray of shape (n_subspaces, n_centroids, subspace_size)
+            :returns: the quantizer
+            :rtype: ProductQuantizer
+        """
+        quantizer = cls(codebooks.shape[0], codebooks.shape[1])
+        quantizer.codebooks = np.asarray(codebooks, dtype=np.float32)
+        return quantizer
+
+    def _split(self, vectors):
+        vectors = np.asarray(vectors, dtype=np.float32)
+        if vectors.shape[1] % self.n_subspaces != 0:
+            raise ValueError("%d features can't be split in %d subspaces"
+                             % (vectors.shape[1], self.n_subspaces))
+        # (n_subspaces, n_vectors, subspace_size)
+        return vectors.reshape(len(vectors), self.n_subspaces, -1).transpose(1, 0, 2)
+
+    def fit(self, vectors):
+        """
+            Train the codebooks on the given vectors.
+
+            :param vectors: feature vectors of the candidate problems
+            :type vectors: ndarray of shape (n_vectors, n_features)
+            :returns: self
+        """
+        rng = np.random.default_rng(self.random_state)
+        n_training = min(len(vectors), self._training_points)
+        training = np.asarray(vectors)[np.sort(rng.choice(len(vectors), n_training,
+                                                          replace=False))]
+        subvectors = self._split(training)
+
+        codebooks = np.zeros((self.n_subspaces, self.n_centroids, subvectors.shape[2]),
+                             dtype=np.float32)
+        for i, subspace in enumerate(subvectors):
+            centroids = kmeans(subspace, self.n_centroids, random_state=self.random_state)
+            # with fewer training points than centroids, the missing ones are never used
+            codebooks[i, :len(centroids)] = centroids
+            codebooks[i, len(centroids):] = np.inf
+        self.codebooks = codebooks
+        return self
+
+    def encode(self, vectors):
+        """
+            Compress the given vectors.
+
+            :param vectors: the feature vectors
+            :type vectors: ndarray of shape (n_vectors, n_features)
+            :returns: the codes of the vectors
+            :rtype: ndarray of uint8 of shape (n_vectors, n_subspaces)
+        """
+        subvectors = self._split(vectors)
+        codes = np.empty((subvectors.shape[1], self.n_subspaces), dtype=np.uint8)
+        for i, (subspace, codebook) in enumerate(zip(subvectors, self.codebooks)):
+            codes[:, i] = assign_clusters(subspace, codebook[np.isfinite(codebook[:, 0])])
+        return codes
+
+    def decode(self, codes):
+        """
+            Approximate the vectors from their codes.
+
+            :param codes: the codes, as returned by encode
+            :type codes: ndarray of uint8 of shape (n_vectors, n_subspaces)
+            :returns: the reconstructed vectors
+            :rtype: ndarray of shape (n_vectors, n_features)
+        """
+        return np.concatenate([codebook[codes[:, i]]
+                               for i, codebook in enumerate(self.codebooks)], axis=1)
+
+    def distances(self, query_vectors, codes):
+        """
+            Compute the (approximate) squared L2 distance between each query and
+            each compressed vector, from a table of the distances between the
+            query sub-vectors and the centroids.
+
+            :param query_vectors: feature vectors of the query problems
+            :type query_vectors: ndarray of shape (n_queries, n_features)
+            :param codes: the codes of the candidates
+            :type codes: ndarray of uint8 of shape (n_candidates, n_subspaces)
+            :returns: the distance matrix
+            :rtype: ndarray of shape (n_queries, n_candidates)
+        """
+        subqueries = self._split(np.atleast_2d(query_vectors))
+        distances = np.zeros((subqueries.shape[1], len(codes)), dtype=np.float32)
+        for i, (subquery, codebook) in enumerate(zip(subqueries, self.codebooks)):
+            # unused centroids are never referenced by the codes
+            table = squared_distances(subquery, np.nan_to_num(codebook, posinf=0))
+            distances += table[:, codes[:, i]]
+        return distances
+
+    def search(self, query_vectors, codes, shortlist_size):
+        """
+            Shortlist the compressed candidates closest to each query.
+
+            :param query_vectors: feature vectors of the query problems
+            :type query_vectors: ndarray of shape (n_queries, n_features)
+            :param codes: the codes of the candidates
+            :type codes: ndarray of uint8 of shape (n_candidates, n_subspaces)
+            :param shortlist_size: maximum number of candidates returned for each query
+            :type shortlist_size: integer
+            :returns: for each query, the indices of the shortlisted candidates
+                (in no particular order)
+            :rtype: list of ndarray
+        """
+        shortlists = []
+        for distances in self.distances(query_vectors, codes):
+            if len(distances) > shortlist_size:
+                shortlists.append(np.argpartition(distances, shortlist_size - 1)
+                                  [:shortlist_size])
+            else:
+                shortlists.append(np.arange(len(distances)))
+        return shortlists
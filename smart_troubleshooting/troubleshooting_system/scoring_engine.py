@@ -0,0 +1,604 @@
+"""
+This module provides a long-lived scoring engine for the troubleshooting system.
+It keeps the similarity model and the candidate problems in memory and reloads
+them only when their files change on disk.
+
+Author: Filippo Guggino
+"""
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from smart_troubleshooting.pd_similarity_dev_system.similarity_model import SimilarityModel
+from smart_troubleshooting.troubleshooting_system.lexical_index import BM25Index
+from smart_troubleshooting.troubleshooting_system.scoring_pool import ScoringPool
+from smart_troubleshooting.troubleshooting_system.vector_index import IVFIndex
+
+
+def file_version(path):
+    """
+        Compute the version of a file from its metadata, used to detect changes
+        without re-reading its content.
+
+        :param path: path of the file
+        :type path: string
+        :returns: (modification time in ns, size in bytes) or None if the file is missing
+        :rtype: tuple or None
+    """
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return stat.st_mtime_ns, stat.st_size
+
+
+def select_top_k(scores, k):
+    """
+        Select the indices of the k highest scores, sorted by decreasing score.
+        Only the selected scores are sorted, so the cost is linear in the number
+        of scores.
+
+        :param scores: the scores to rank
+        :type scores: ndarray of shape (n_scores,)
+        :param k: the maximum number of indices to return
+        :type k: integer
+        :returns: indices of the top k scores
+        :rtype: ndarray of shape (min(k, n_scores),)
+    """
+    if k <= 0:
+        return np.empty(0, dtype=np.intp)
+    if k < len(scores):
+        top_k = np.argpartition(-scores, k - 1)[:k]
+    else:
+        top_k = np.arange(len(scores))
+    return top_k[np.argsort(-scores[top_k], kind='stable')]
+
+
+def select_top_solutions(scores, solution_codes, k, aggregation="max"):
+    """
+        Find the k best distinct solutions, aggregating the scores of the
+        candidates sharing the same solution.
+
+        :param scores: the scores of the candidates
+        :type scores: ndarray of shape (n_candidates,)
+        :param solution_codes: the solution of each candidate, as an integer code
+        :type solution_codes: ndarray of shape (n_candidates,)
+        :param k: number of solutions to return
+        :type k: integer
+        :param aggregation: how the scores of a solution are combined, "max" or "mean"
+        :type aggregation: string
+        :returns: for each of the best solutions, the index of its best candidate,
+            sorted by decreasing solution score
+        :rtype: ndarray of shape (min(k, n_solutions),)
+    """
+    # In decreasing score order, the first candidate of each solution is its best one
+    order = np.argsort(-scores, kind='stable')
+    codes, first_positions = np.unique(solution_codes[order], return_index=True)
+    best_candidates = order[first_positions]
+
+    if aggregation == "max":
+        solution_scores = scores[best_candidates]
+    else:
+        sums = np.bincount(solution_codes, weights=scores)
+        counts = np.bincount(solution_codes)
+        solution_scores = sums[codes] / counts[codes]
+
+    return best_candidates[select_top_k(solution_scores, k)]
+
+
+def encode_solutions(problem_ids, solution_index):
+    """
+        Map the solution of each candidate to an integer code. Candidates whose
+        solution is unknown are given a code of their own.
+
+        :param problem_ids: the ids of the candidates
+        :type problem_ids: ndarray of shape (n_candidates,)
+        :param solution_index: the solution index (see SolutionIndexFile)
+        :type solution_index: dictionary
+        :returns: the solution code of each candidate
+        :rtype: ndarray of shape (n_candidates,)
+    """
+    problems = solution_index['problems']
+    solution_ids = ["solution:" + problems[problem_id] if problem_id in problems
+                    else "problem:" + problem_id for problem_id in problem_ids]
+    _, solution_codes = np.unique(solution_ids, return_inverse=True)
+    return solution_codes.reshape(-1)
+
+
+class ScoringSnapshot:
+    """
+        Immutable view of the artifacts used to score a request. A new snapshot
+        is built every time an artifact changes, so a request holding a reference
+        to a snapshot never sees a half-loaded state.
+    """
+    # pylint: disable=too-few-public-methods
+
+    def __init__(self, versions):
+        # version of each artifact file (see file_version)
+        self.versions = versions
+        self.model = None
+        self.problem_ids = None
+        self.candidates = None
+        # first-layer projections of the candidates, None if not precomputed
+        self.projections = None
+        # nearest-neighbour index over the candidates, None if prefiltering is disabled
+        self.index = None
+        # problem -> solution mapping, None if not available
+        self.solution_index = None
+        # solution code of each candidate (see encode_solutions), None if not available
+        self.solution_codes = None
+        # worker processes scoring the candidates, None to score them in process
+        self.pool = None
+        # BM25 index over the normalized descriptions of the candidates,
+        # None if lexical prefiltering is disabled
+        self.lexical_index = None
+        # product quantizer and codes of the candidates, None if not compressed
+        self.quantizer = None
+        self.codes = None
+
+
+class ScoringEngine:
+    """
+        This class keeps the similarity model and the candidate problems resident
+        in memory. Artifacts are hot-reloaded only when their file changes
+        (modification time or size) and the new state is published by swapping
+        the current snapshot reference.
+
+        Two scoring modes are available:
+            - "full": the model is evaluated on every (candidate - query) difference
+            - "projection": the first-layer projections of the candidates are
+                computed once per model/candidates version, so each query only
+                needs its own projection
+
+        Optionally, an approximate nearest-neighbour index (see IVFIndex) and/or a
+        lexical index over the normalized descriptions (see BM25Index) are built
+        over the candidates, and only the shortlisted ones are scored by the model.
+        The lexical shortlist takes precedence: queries sharing no word with any
+        candidate fall back to the nearest-neighbour (or exhaustive) search.
+
+        If compression is enabled and the candidates come with product
+        quantization codes (see ProductQuantizer), exhaustive search is replaced
+        by a shortlist of the closest codes, rescored by the model on the full
+        vectors, which are not kept resident.
+
+        The solution index (problem -> solution mapping) is an optional artifact:
+        scoring doesn't wait for it.
+
+        Exhaustive scoring streams over chunks of candidates, sized so that the
+        intermediate activations fit in the memory budget, keeping only the
+        running top-k of each query. Chunks can be scored by a pool of threads.
+    """
+    SCORING_MODES = ["full", "projection"]
+    AGGREGATIONS = ["max", "mean"]
+
+    # pylint: disable=too-many-arguments, too-many-instance-attributes
+
+    def __init__(self, model_path, candidates_path, load_candidates, scoring_mode="projection",
+                 prefilter=None, solution_index_path=None, load_solution_index=None,
+                 scoring_workers=0, memory_budget_mb=256, scoring_threads=1,
+                 lexical_prefilter=None, descriptions_path=None, load_descriptions=None,
+                 compression=None, load_codes=None):
+        """
+            :param model_path: path of the joblib similarity model
+            :type model_path: string
+            :param candidates_path: path of the candidate problems feature vectors
+            :type candidates_path: string
+            :param load_candidates: function (without arguments) returning the pair
+                (problem ids, feature vectors matrix) read from candidates_path
+            :type load_candidates: callable
+            :param scoring_mode: one of SCORING_MODES
+            :type scoring_mode: string
+            :param prefilter: configuration of the nearest-neighbour prefilter:
+                {"enabled", "n_lists", "n_probe", "metric", "shortlist_size"},
+                None to disable it
+            :type prefilter: dictionary
+            :param solution_index_path: path of the solution index
+            :type solution_index_path: string
+            :param load_solution_index: function (without arguments) returning the
+                solution index read from solution_index_path
+            :type load_solution_index: callable
+            :param scoring_workers: number of processes scoring the candidates
+                (see ScoringPool), 0 to score them in the calling thread
+            :type scoring_workers: integer
+            :param memory_budget_mb: memory available for the intermediate
+                activations of the model (per process)
+            :type memory_budget_mb: float
+            :param scoring_threads: number of threads scoring the chunks of candidates
+            :type scoring_threads: integer
+            :param lexical_prefilter: configuration of the lexical prefilter:
+                {"enabled", "k1", "b", "shortlist_size", "blend"}, None to disable it.
+                blend is the weight of the (normalized) BM25 score in the final score
+            :type lexical_prefilter: dictionary
+            :param descriptions_path: path of the normalized descriptions of the candidates
+            :type descriptions_path: string
+            :param load_descriptions: function (without arguments) returning the pair
+                (problem ids, normalized descriptions) read from descriptions_path
+            :type load_descriptions: callable
+            :param compression: configuration of the compressed candidates:
+                {"enabled", "shortlist_size"}, None to disable it
+            :type compression: dictionary
+            :param load_codes: function (without arguments) returning the tuple
+                (problem ids, ProductQuantizer, codes of the candidates), None if not
+                available
+            :type load_codes: callable
+        """
+        if scoring_mode not in self.SCORING_MODES:
+            raise ValueError("Unknown scoring mode: %s" % scoring_mode)
+
+        self._scoring_mode = scoring_mode
+        self._prefilter = prefilter if prefilter and prefilter['enabled'] else None
+        self._lexical_prefilter = lexical_prefilter \
+            if lexical_prefilter and lexical_prefilter['enabled'] else None
+        self._descriptions_path = descriptions_path
+        self._load_descriptions = load_descriptions
+        self._compression = compression if compression and compression['enabled'] else None
+        self._load_codes = load_codes
+        self._model_path = model_path
+        self._candidates_path = candidates_path
+        self._load_candidates = load_candidates
+        self._solution_index_path = solution_index_path
+        self._load_solution_index = load_solution_index
+        self._scoring_workers = scoring_workers
+        self._memory_budget = memory_budget_mb * 2 ** 20
+        self._scoring_threads = max(scoring_threads, 1)
+        # NumPy releases the GIL during matrix products
+        self._executor = None
+        if self._scoring_threads > 1:
+            self._executor = ThreadPoolExecutor(self._scoring_threads)
+        self._reload_lock = threading.Lock()
+        self._snapshot = None
+
+    @property
+    def snapshot(self):
+        """
+            Last published snapshot, None if the artifacts have never been loaded.
+        """
+        return self._snapshot
+
+    def refresh(self):
+        """
+            Reload the artifacts whose file changed since the last refresh and
+            publish a new snapshot.
+
+            :returns: the current snapshot, None if the artifacts are not available yet
+            :rtype: ScoringSnapshot
+        """
+        with self._reload_lock:
+            current = self._snapshot
+            # Versions are read before loading: a file written while it's being
+            # loaded will have a different version and will be reloaded next time
+            versions = {
+                "model": file_version(self._model_path),
+                "candidates": file_version(self._candidates_path),
+                "solution_index": None if self._solution_index_path is None
+                                  else file_version(self._solution_index_path),
+                "descriptions": None if self._lexical_prefilter is None
+                                else file_version(self._descriptions_path)
+            }
+            if versions["model"] is None or versions["candidates"] is None:
+                return current
+
+            if current is not None and current.versions == versions:
+                return current
+
+            def changed(artifact):
+                return current is None or current.versions[artifact] != versions[artifact]
+
+            snapshot = ScoringSnapshot(versions)
+
+            if changed("model"):
+                snapshot.model = SimilarityModel.load(self._model_path)
+            else:
+                snapshot.model = current.model
+
+            if changed("candidates"):
+                snapshot.problem_ids, snapshot.candidates = self._load_candidates()
+                snapshot.quantizer, snapshot.codes = self._load_compressed_candidates(
+                    snapshot.problem_ids)
+                # compressed candidates are shortlisted with their codes
+                if snapshot.quantizer is None:
+                    snapshot.index = self._build_index(snapshot.candidates)
+            else:
+                snapshot.problem_ids, snapshot.candidates = \
+                    current.problem_ids, current.candidates
+                snapshot.quantizer, snapshot.codes = current.quantizer, current.codes
+                snapshot.index = current.index
+
+            # with compressed candidates, nothing proportional to the full vectors
+            # is kept resident: only the shortlisted vectors are read and scored
+            if changed("model") or changed("candidates"):
+                if self._scoring_mode == "projection" and snapshot.quantizer is None:
+                    snapshot.projections = self._project_candidates(snapshot.model,
+                                                                    snapshot.candidates)
+            else:
+                snapshot.projections = current.projections
+
+            if changed("model") or changed("candidates"):
+                if snapshot.quantizer is None:
+                    snapshot.pool = self._build_pool(snapshot)
+            else:
+                snapshot.pool = current.pool
+
+            if changed("solution_index"):
+                if versions["solution_index"] is not None:
+                    snapshot.solution_index = self._load_solution_index()
+            else:
+                snapshot.solution_index = current.solution_index
+
+            if changed("candidates") or changed("solution_index"):
+                if snapshot.solution_index is not None:
+                    snapshot.solution_codes = encode_solutions(snapshot.problem_ids,
+                                                               snapshot.solution_index)
+            else:
+                snapshot.solution_codes = current.solution_codes
+
+            if changed("candidates") or changed("descriptions"):
+                if versions["descriptions"] is not None:
+                    snapshot.lexical_index = self._build_lexical_index(snapshot.problem_ids)
+            else:
+                snapshot.lexical_index = current.lexical_index
+
+            # Reference assignment is atomic: readers get either the old or the new snapshot
+            self._snapshot = snapshot
+            return self._snapshot
+
+    def _load_compressed_candidates(self, problem_ids):
+        if self._compression is None:
+            return None, None
+        compressed_candidates = self._load_codes()
+        if compressed_candidates is None:
+            return None, None
+        code_ids, quantizer, codes = compressed_candidates
+        # codes of a different revision of the candidates are ignored
+        if not np.array_equal(code_ids, problem_ids):
+            return None, None
+        return quantizer, codes
+
+    def _project_candidates(self, model, candidates):
+        # candidates may be stored in half precision: only a chunk at a time is
+        # converted to float32, within the memory budget
+        chunk_size = max(1, int(self._memory_budget / max(candidates.shape[1] * 4, 1)))
+        if len(candidates) <= chunk_size:
+            return model.project_first_layer(np.asarray(candidates, dtype=np.float32))
+        return np.vstack([model.project_first_layer(
+            np.asarray(candidates[start:start + chunk_size], dtype=np.float32))
+                          for start in range(0, len(candidates), chunk_size)])
+
+    def _build_pool(self, snapshot):
+        # the pool of a replaced snapshot is released once no request uses it anymore
+        if self._scoring_workers <= 0:
+            return None
+        if snapshot.projections is not None:
+            return ScoringPool(snapshot.model, snapshot.projections, True,
+                               self._scoring_workers)
+        return ScoringPool(snapshot.model, snapshot.candidates, False, self._scoring_workers)
+
+    def _build_lexical_index(self, problem_ids):
+        description_ids, descriptions = self._load_descriptions()
+        tokens = dict(zip(description_ids, (description.split() for description in descriptions)))
+        # documents follow the order of the candidates, missing descriptions are empty
+        index = BM25Index(self._lexical_prefilter['k1'], self._lexical_prefilter['b'])
+        return index.fit([tokens.get(problem_id, []) for problem_id in problem_ids])
+
+    def _build_index(self, candidates):
+        if self._prefilter is None or len(candidates) == 0:
+            return None
+        index = IVFIndex(self._prefilter['n_lists'], self._prefilter['n_probe'],
+                         self._prefilter['metric'])
+        return index.fit(candidates)
+
+    def rank(self, snapshot, query_vectors, k, shortlist_size=None, aggregation=None,
+             query_tokens=None, n_probe=None):
+        """
+            Find the k candidates most similar to each query problem. If a
+            prefilter is enabled, only the candidates shortlisted by the lexical
+            index (if the tokens of the queries are given), by the
+            nearest-neighbour index or by the product quantizer are scored by
+            the model.
+
+            If an aggregation is given and the solution index is available, the
+            k best distinct solutions are ranked instead (see select_top_solutions),
+            returning the best candidate of each of them.
+
+            :param snapshot: the snapshot returned by refresh
+            :type snapshot: ScoringSnapshot
+            :param query_vectors: feature vectors of the query problems
+            :type query_vectors: array-like of shape (n_queries, n_features)
+            :param k: number of candidates to return for each query
+            :type k: integer
+            :param shortlist_size: number of candidates shortlisted by the
+                nearest-neighbour index, defaults to the configured one
+            :type shortlist_size: integer
+            :param aggregation: one of AGGREGATIONS, None to rank the candidates
+            :type aggregation: string
+            :param query_tokens: tokens of the normalized description of each query
+            :type query_tokens: array of arrays of strings
+            :param n_probe: number of lists probed by the nearest-neighbour index,
+                defaults to the configured one
+            :type n_probe: integer
+            :returns: for each query, the indices of the best candidates
+                sorted by decreasing similarity
+            :rtype: list of ndarray
+        """
+        # pylint: disable=too-many-locals
+        query_vectors = np.asarray(query_vectors, dtype=np.float32)
+        if len(snapshot.candidates) == 0:
+            return [np.empty(0, dtype=np.intp) for _ in query_vectors]
+
+        shortlists = [None] * len(query_vectors)
+        lexical_scores = [None] * len(query_vectors)
+        if snapshot.lexical_index is not None and query_tokens is not None:
+            lexical_shortlists = snapshot.lexical_index.search(
+                query_tokens, self._lexical_prefilter['shortlist_size'])
+            for i, (shortlist, scores) in enumerate(lexical_shortlists):
+                if len(shortlist) > 0:
+                    shortlists[i], lexical_scores[i] = shortlist, scores
+
+        remaining = [i for i, shortlist in enumerate(shortlists) if shortlist is None]
+        if remaining and snapshot.index is not None:
+            if shortlist_size is None:
+                shortlist_size = self._prefilter['shortlist_size']
+            for i, shortlist in zip(remaining, snapshot.index.search(
+                    query_vectors[remaining], shortlist_size, n_probe)):
+                shortlists[i] = shortlist
+            remaining = []
+
+        if remaining and snapshot.quantizer is not None:
+            for i, shortlist in zip(remaining, snapshot.quantizer.search(
+                    query_vectors[remaining], snapshot.codes,
+                    self._compression['shortlist_size'])):
+                shortlists[i] = shortlist
+            remaining = []
+
+        rankings = [None] * len(query_vectors)
+        if remaining:
+            for i, ranking in zip(remaining, self._rank_exhaustive(
+                    snapshot, query_vectors[remaining], k, aggregation)):
+                rankings[i] = ranking
+
+        for i, shortlist in enumerate(shortlists):
+            if shortlist is None:
+                continue
+            similarities = self.score(snapshot, query_vectors[i:i + 1], shortlist)[0]
+            if lexical_scores[i] is not None and self._lexical_prefilter['blend'] > 0:
+                blend = self._lexical_prefilter['blend']
+                similarities = (1 - blend) * similarities \
+                    + blend * lexical_scores[i] / lexical_scores[i].max()
+            rankings[i] = self._select(snapshot, similarities, k, aggregation, shortlist)
+        return rankings
+
+    def _rank_exhaustive(self, snapshot, query_vectors, k, aggregation):
+        if aggregation is not None and snapshot.solution_codes is not None:
+            return self._running_top_solutions(snapshot, query_vectors, k, aggregation)
+        return self._running_top_k(snapshot, query_vectors, k)
+
+    def chunk_size(self, snapshot, n_queries):
+        """
+            Compute the number of candidates scored at once, so that the estimated
+            intermediate activations of each thread fit in the memory budget.
+
+            :param snapshot: the snapshot returned by refresh
+            :type snapshot: ScoringSnapshot
+            :param n_queries: number of queries scored together
+            :type n_queries: integer
+            :returns: the number of candidates of each chunk
+            :rtype: integer
+        """
+        # two float64 matrices (input and output of a layer) of the widest layer
+        if snapshot.projections is not None:
+            bytes_per_candidate = n_queries * snapshot.projections.shape[1] * 8 * 2
+        else:
+            # in full mode queries are scored one at a time
+            bytes_per_candidate = snapshot.candidates.shape[1] * 8 * 2
+        return max(1, int(self._memory_budget
+                          / (self._scoring_threads * max(bytes_per_candidate, 1))))
+
+    def _score_chunks(self, snapshot, query_vectors):
+        # yields (first candidate index, scores of the chunk) in candidate order
+        chunk_size = self.chunk_size(snapshot, len(query_vectors))
+        n_candidates = len(snapshot.candidates)
+        if snapshot.pool is not None:
+            # each worker scores one chunk of the block
+            block_size = chunk_size * snapshot.pool.n_workers
+            for start in range(0, n_candidates, block_size):
+                yield start, snapshot.pool.score(query_vectors, chunk_size, start,
+                                                 start + block_size)
+            return
+
+        starts = range(0, n_candidates, chunk_size)
+
+        def score_chunk(start):
+            rows = slice(start, min(start + chunk_size, n_candidates))
+            return self.score(snapshot, query_vectors, rows)
+
+        if self._executor is None or len(starts) == 1:
+            chunks = map(score_chunk, starts)
+        else:
+            chunks = self._executor.map(score_chunk, starts)
+        yield from zip(starts, chunks)
+
+    def _running_top_k(self, snapshot, query_vectors, k):
+        best_rows = [np.empty(0, dtype=np.intp)] * len(query_vectors)
+        best_scores = [np.empty(0)] * len(query_vectors)
+        for start, chunk_scores in self._score_chunks(snapshot, query_vectors):
+            chunk_rows = np.arange(start, start + chunk_scores.shape[1])
+            for i, scores in enumerate(chunk_scores):
+                # merge the current top-k with the chunk, keeping the best k
+                rows = np.concatenate((best_rows[i], chunk_rows))
+                scores = np.concatenate((best_scores[i], scores))
+                top_k = select_top_k(scores, k)
+                best_rows[i], best_scores[i] = rows[top_k], scores[top_k]
+        return best_rows
+
+    def _running_top_solutions(self, snapshot, query_vectors, k, aggregation):
+        # per-solution aggregates, so the memory doesn't grow with the candidates
+        n_solutions = int(snapshot.solution_codes.max()) + 1
+        best_scores = np.full((len(query_vectors), n_solutions), -np.inf)
+        best_rows = np.zeros((len(query_vectors), n_solutions), dtype=np.intp)
+        sums = np.zeros((len(query_vectors), n_solutions))
+        counts = np.zeros(n_solutions)
+        for start, chunk_scores in self._score_chunks(snapshot, query_vectors):
+            chunk_codes = snapshot.solution_codes[start:start + chunk_scores.shape[1]]
+            counts += np.bincount(chunk_codes, minlength=n_solutions)
+            for i, scores in enumerate(chunk_scores):
+                # in decreasing score order, the first candidate of each solution
+                # is its best one in the chunk
+                order = np.argsort(-scores, kind='stable')
+                codes, first_positions = np.unique(chunk_codes[order], return_index=True)
+                chunk_best = order[first_positions]
+                # ties are won by the earlier candidate, as in select_top_solutions
+                improved = scores[chunk_best] > best_scores[i, codes]
+                best_scores[i, codes[improved]] = scores[chunk_best[improved]]
+                best_rows[i, codes[improved]] = start + chunk_best[improved]
+                if aggregation == "mean":
+                    sums[i] += np.bincount(chunk_codes, weights=scores, minlength=n_solutions)
+
+        solutions = np.flatnonzero(counts)
+        solution_scores = best_scores[:, solutions] if aggregation == "max" \
+            else sums[:, solutions] / counts[solutions]
+        return [best_rows[i, solutions[select_top_k(query_solution_scores, k)]]
+                for i, query_solution_scores in enumerate(solution_scores)]
+
+    @staticmethod
+    def _select(snapshot, similarities, k, aggregation, rows=None):
+        if aggregation is None or snapshot.solution_codes is None:
+            selected = select_top_k(similarities, k)
+        else:
+            solution_codes = snapshot.solution_codes if rows is None \
+                else snapshot.solution_codes[rows]
+            selected = select_top_solutions(similarities, solution_codes, k, aggregation)
+        return selected if rows is None else rows[selected]
+
+    @staticmethod
+    def score(snapshot, query_vectors, rows=None):
+        """
+            Compute the similarity between each query problem and every candidate
+            problem of the snapshot (or only the candidates in rows).
+
+            :param snapshot: the snapshot returned by refresh
+            :type snapshot: ScoringSnapshot
+            :param query_vectors: feature vectors of the query problems
+            :type query_vectors: array-like of shape (n_queries, n_features)
+            :param rows: indices (or slice) of the candidates to score, None for
+                all of them
+            :type rows: ndarray of shape (n_rows,) or slice
+            :returns: similarity of each candidate for each query, in the range [0,1]
+            :rtype: ndarray of shape (n_queries, n_candidates)
+        """
+        query_vectors = np.asarray(query_vectors, dtype=np.float32)
+        if rows is None and snapshot.pool is not None:
+            return snapshot.pool.score(query_vectors)
+
+        if snapshot.projections is not None:
+            projections = snapshot.projections if rows is None else snapshot.projections[rows]
+            # a single (n_queries, n_candidates) pass shared by all the queries
+            return snapshot.model.predict_from_projections(projections, query_vectors)
+
+        candidates = snapshot.candidates if rows is None else snapshot.candidates[rows]
+        # only the scored rows of half precision candidates are converted
+        candidates = np.asarray(candidates, dtype=np.float32)
+        # The query is subtracted from every candidate by broadcasting
+        return np.array([snapshot.model.predict(candidates - query_vector)
+                         for query_vector in query_vectors])
@@ -0,0 +1,121 @@
+"""
+This module provides a pool of processes scoring the candidate problems in
+parallel. The scoring matrix (first-layer projections or feature vectors of the
+candidates) is published once in shared memory, and the workers attach to it
+without copying, so the resident memory doesn't grow with the number of workers.
+
+Author: Filippo Guggino
+"""
+import multiprocessing
+import weakref
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import resource_tracker, shared_memory
+
+import numpy as np
+
+# State of a worker process, set once by _attach
+_worker = {}
+
+
+def _attach(block_name, shape, dtype, model, projection):
+    block = shared_memory.SharedMemory(name=block_name)
+    # the block is owned (and unlinked) by the parent process
+    resource_tracker.unregister(block._name, "shared_memory")  # pylint: disable=protected-access
+    _worker['block'] = block
+    _worker['matrix'] = np.ndarray(shape, dtype=dtype, buffer=block.buf)
+    _worker['model'] = model
+    _worker['projection'] = projection
+
+
+def _score_shard(start, stop, query_vectors, chunk_size):
+    model = _worker['model']
+    scores = np.empty((len(query_vectors), stop - start))
+    # the shard is scored in chunks to bound the intermediate activations
+    for chunk_start in range(start, stop, chunk_size):
+        chunk_stop = min(chunk_start + chunk_size, stop)
+        rows = _worker['matrix'][chunk_start:chunk_stop]
+        if _worker['projection']:
+            chunk_scores = model.predict_from_projections(rows, query_vectors)
+        else:
+            # half precision feature vectors are converted a chunk at a time
+            rows = np.asarray(rows, dtype=np.float32)
+            chunk_scores = [model.predict(rows - query_vector) for query_vector in query_vectors]
+        scores[:, chunk_start - start:chunk_stop - start] = chunk_scores
+    return scores
+
+
+def _release(executor, block):
+    executor.shutdown()
+    block.close()
+    block.unlink()
+
+
+class ScoringPool:
+    """
+        Pool of worker processes, each one scoring a contiguous shard of the
+        candidates for all the queries. The pool is released (workers stopped and
+        shared memory freed) when it's closed or garbage collected.
+    """
+
+    def __init__(self, model, matrix, projection, n_workers):
+        """
+            :param model: the similarity model
+            :type model: SimilarityModel
+            :param matrix: first-layer projections (if projection is True) or
+                feature vectors of the candidates
+            :type matrix: ndarray of shape (n_candidates, n_columns)
+            :param projection: whether matrix contains the first-layer projections
+            :type projection: boolean
+            :param n_workers: number of worker processes
+            :type n_workers: integer
+        """
+        matrix = np.ascontiguousarray(matrix)
+        self._block = shared_memory.SharedMemory(create=True, size=max(matrix.nbytes, 1))
+        shared_matrix = np.ndarray(matrix.shape, dtype=matrix.dtype, buffer=self._block.buf)
+        shared_matrix[:] = matrix
+        # the view must not outlive the block
+        del shared_matrix
+
+        self.n_workers = n_workers
+        self._n_candidates = len(matrix)
+
+        # workers are spawned: forking would copy the threads of the service
+        self._executor = ProcessPoolExecutor(
+            n_workers, mp_context=multiprocessing.get_context("spawn"),
+            initializer=_attach,
+            initargs=(self._block.name, matrix.shape, matrix.dtype, model, projection))
+        self._finalizer = weakref.finalize(self, _release, self._executor, self._block)
+
+    def score(self, query_vectors, chunk_size=None, start=0, stop=None):
+        """
+            Compute the similarity between each query problem and every candidate
+            (or only the candidates from start to stop, split among the workers).
+
+            :param query_vectors: feature vectors of the query problems
+            :type query_vectors: ndarray of shape (n_queries, n_features)
+            :param chunk_size: number of candidates scored at once by a worker,
+                None to score the whole shard at once
+            :type chunk_size: integer
+            :param start: index of the first candidate to score
+            :type start: integer
+            :param stop: index after the last candidate to score, None for the last one
+            :type stop: integer
+            :returns: similarity of each candidate for each query
+            :rtype: ndarray of shape (n_queries, stop - start)
+        """
+        stop = self._n_candidates if stop is None else min(stop, self._n_candidates)
+        bounds = np.linspace(start, stop, self.n_workers + 1).astype(int)
+        shards = [(shard_start, shard_stop) for shard_start, shard_stop
+                  in zip(bounds[:-1], bounds[1:]) if shard_stop > shard_start]
+        if not shards:
+            return np.empty((len(query_vectors), 0))
+        futures = [self._executor.submit(_score_shard, shard_start, shard_stop, query_vectors,
+                                         chunk_size or shard_stop - shard_start)
+                   for shard_start, shard_stop in shards]
+        return np.hstack([future.result() for future in futures])
+
+    def close(self):
+        """
+            Stop the workers and free the shared memory.
+        """
+        self._finalizer()
@@ -0,0 +1,50 @@
+"""
+Smoke test of the recall vs latency report of the troubleshooting prefilters
+(scripts/ann_recall_report.py).
+"""
+
+import importlib.util
+import json
+import os
+
+import numpy as np
+
+from smart_troubleshooting.feature_vector_store import write_feature_vectors
+from smart_troubleshooting.pd_similarity_dev_system.similarity_model \
+    import SimilarityModel
+
+SCRIPT_PATH = os.path.join(os.path.dirname(__file__), os.pardir, os.pardir, os.pardir,
+                           "scripts", "ann_recall_report.py")
+
+
+def load_script():
+    spec = importlib.util.spec_from_file_location("ann_recall_report", SCRIPT_PATH)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+class TestAnnRecallReport:
+
+    def test_report(self, tmp_path):
+        model_path = str(tmp_path / "model.joblib")
+        store_path = str(tmp_path / "feature_vectors")
+        report_path = str(tmp_path / "report.json")
+        model = SimilarityModel(hidden_layer_sizes=(4,), max_iter=5, random_state=0xdeadbeef)
+        model.fit(np.random.rand(20, 8), np.random.rand(20))
+        model.save(model_path)
+        write_feature_vectors(store_path, np.arange(60).astype(str), np.random.rand(60, 8),
+                              "encoder", "configuration")
+
+        report = load_script().main([
+            "--model-file", model_path, "--feature-vector-store", store_path,
+            "-k", "5", "-q", "4", "--n-lists", "4", "--n-probe", "1", "4",
+            "--shortlist-size", "60", "--pq-subspaces", "2", "-o", report_path])
+
+        with open(report_path) as report_file:
+            assert json.load(report_file) == report
+        assert report["candidates"] == 60 and report["queries"] == 4
+        assert [result["n_probe"] for result in report["results"]] == [1, 4]
+        assert [result["n_subspaces"] for result in report["compression"]] == [2]
+        assert all(0 <= result["recall"] <= 1
+                   for result in report["results"] + report["compression"])
@@ -0,0 +1,34 @@
+"""
+Testing for BM25Index class.
+
+Author: Filippo Guggino
+"""
+
+import numpy as np
+
+from smart_troubleshooting.troubleshooting_system.lexical_index import BM25Index
+
+
+class TestBM25Index:
+
+    def setup_method(self, test_method):
+        self.index = BM25Index().fit([
+            "log saw stop restart machin".split(),
+            "log blade stop restart machin".split(),
+            "request 24h servic problem sincro".split(),
+            [],
+        ])
+
+    def test_score(self):
+        scores = self.index.score("saw stop".split())
+        # "saw" is rarer than "stop"
+        assert scores[0] > scores[1] > 0
+        assert scores[2] == scores[3] == 0
+        assert np.all(self.index.score(["unknown"]) == 0)
+
+    def test_search(self):
+        (candidates, scores), (no_candidates, _) = self.index.search(
+            [["log", "saw"], ["unknown"]], 1)
+        assert candidates.tolist() == [0]
+        assert scores[0] > 0
+        assert len(no_candidates) == 0
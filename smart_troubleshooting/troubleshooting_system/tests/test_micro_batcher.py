@@ -0,0 +1,53 @@
+"""
+Testing for MicroBatcher class.
+
+Author: Filippo Guggino
+"""
+
+import asyncio
+
+from smart_troubleshooting.troubleshooting_system.micro_batcher \
+    import MicroBatcher
+
+
+class MockSolver:
+    def __init__(self):
+        self.batches = []
+
+    def __call__(self, requests):
+        self.batches.append(len(requests))
+        return [{"requestID": req["requestID"], "problemsIDs": [req["text"]]}
+                for req in requests]
+
+
+def submit_concurrently(batcher, texts):
+    async def submit_all():
+        return await asyncio.gather(
+            *[batcher.submit([{"requestID": 1, "text": text}]) for text in texts])
+    return asyncio.run(submit_all())
+
+
+class TestMicroBatcher:
+
+    def test_window(self):
+        solver = MockSolver()
+        batcher = MicroBatcher(solver, window_ms=50, max_batch_size=32)
+        results = submit_concurrently(batcher, ["a", "b", "c"])
+
+        # same request id from different clients, fanned out by position
+        assert [result[0]["problemsIDs"] for result in results] == \
+            [["a"], ["b"], ["c"]]
+        assert solver.batches == [3]
+
+        metrics = batcher.metrics()
+        assert metrics["batchSizes"] == {"3": 1}
+        assert metrics["requests"] == 3
+
+    def test_max_batch_size(self):
+        solver = MockSolver()
+        batcher = MicroBatcher(solver, window_ms=10000, max_batch_size=2)
+        results = submit_concurrently(batcher, ["a", "b", "c", "d"])
+
+        assert len(results) == 4
+        assert solver.batches == [2, 2]
+        assert batcher.metrics()["maxQueueingDelay"] < 10000
@@ -0,0 +1,57 @@
+"""
+Testing for ProductQuantizer class.
+
+Author: Filippo Guggino
+"""
+
+import numpy as np
+import pytest
+
+from smart_troubleshooting.troubleshooting_system.product_quantizer \
+    import ProductQuantizer
+from smart_troubleshooting.troubleshooting_system.vector_index \
+    import squared_distances
+
+
+class TestProductQuantizer:
+
+    def setup_method(self, test_method):
+        rng = np.random.default_rng(0)
+        # clustered vectors, as sentence embeddings of similar problems are
+        centers = rng.random((20, 16))
+        self.vectors = (centers[rng.integers(0, 20, 500)]
+                        + 0.01 * rng.random((500, 16))).astype(np.float32)
+        self.quantizer = ProductQuantizer(n_subspaces=4, n_centroids=32).fit(self.vectors)
+        self.codes = self.quantizer.encode(self.vectors)
+
+    def test_encode_decode(self):
+        assert self.codes.shape == (500, 4)
+        assert self.codes.dtype == np.uint8
+        # 16 float32 values are compressed in 4 bytes
+        assert self.vectors.nbytes // self.codes.nbytes == 16
+        # reconstruction error is a small fraction of the spread of the vectors
+        error = np.mean((self.quantizer.decode(self.codes) - self.vectors) ** 2)
+        assert error < 0.1 * np.mean((self.vectors - self.vectors.mean(axis=0)) ** 2)
+
+    def test_distances(self):
+        queries = self.vectors[:3]
+        np.testing.assert_allclose(
+            self.quantizer.distances(queries, self.codes),
+            squared_distances(queries, self.quantizer.decode(self.codes)),
+            rtol=1e-3, atol=1e-3)
+
+    def test_search_recall(self):
+        queries = self.vectors[:10]
+        exact = np.argsort(squared_distances(queries, self.vectors), axis=1)[:, :10]
+        shortlists = self.quantizer.search(queries, self.codes, 50)
+        recall = np.mean([len(np.intersect1d(e, s)) / 10
+                          for e, s in zip(exact, shortlists)])
+        assert recall >= 0.9
+
+    def test_from_codebooks(self):
+        quantizer = ProductQuantizer.from_codebooks(self.quantizer.codebooks)
+        np.testing.assert_array_equal(quantizer.encode(self.vectors), self.codes)
+
+    def test_invalid_subspaces(self):
+        with pytest.raises(ValueError):
+            ProductQuantizer(n_subspaces=5).fit(self.vectors)
@@ -0,0 +1,315 @@
+"""
+Testing for ScoringEngine class.
+
+Author: Filippo Guggino
+"""
+
+import os
+import tempfile
+import numpy as np
+
+from smart_troubleshooting.pd_similarity_dev_system.similarity_model \
+    import SimilarityModel
+from smart_troubleshooting.troubleshooting_system.product_quantizer \
+    import ProductQuantizer
+from smart_troubleshooting.troubleshooting_system.scoring_engine \
+    import ScoringEngine, encode_solutions, select_top_k, select_top_solutions
+
+
+def test_select_top_k():
+    scores = np.array([0.1, 0.9, 0.4, 0.7, 0.2])
+
+    np.testing.assert_array_equal(select_top_k(scores, 3), [1, 3, 2])
+    np.testing.assert_array_equal(select_top_k(scores, 10), [1, 3, 2, 4, 0])
+    assert len(select_top_k(scores, 0)) == 0
+
+
+def test_select_top_solutions():
+    scores = np.array([0.1, 0.9, 0.4, 0.7, 0.2])
+    solution_codes = np.array([0, 1, 0, 1, 2])
+
+    # solution 1 (best candidate 1), solution 0 (best candidate 2), solution 2
+    np.testing.assert_array_equal(
+        select_top_solutions(scores, solution_codes, 3), [1, 2, 4])
+    # means: 0.25, 0.8, 0.2
+    np.testing.assert_array_equal(
+        select_top_solutions(scores, solution_codes, 2, "mean"), [1, 2])
+
+
+def test_encode_solutions():
+    solution_index = {"problems": {"a": "s1", "b": "s2", "c": "s1"}, "solutions": {}}
+    codes = encode_solutions(np.array(["a", "b", "c", "d", "e"]), solution_index)
+
+    assert codes[0] == codes[2]
+    # problems without a known solution don't share their code
+    assert len(set(codes.tolist())) == 4
+
+
+class TestScoringEngine:
+
+    def setup_method(self, test_method):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.model_path = os.path.join(self.temp_dir.name, "model.joblib")
+        self.candidates_path = os.path.join(self.temp_dir.name, "candidates.csv")
+
+        model = SimilarityModel(hidden_layer_sizes=(4,), max_iter=5,
+                                random_state=0xdeadbeef)
+        model.fit(np.random.rand(20, 8), np.random.rand(20))
+        model.save(self.model_path)
+        with open(self.candidates_path, "w") as candidates_file:
+            candidates_file.write("problem_id\n1\n")
+
+        self.load_count = 0
+
+    def teardown_method(self, test_method):
+        self.temp_dir.cleanup()
+
+    def _load_candidates(self):
+        self.load_count += 1
+        return np.array([str(self.load_count)]), \
+            np.full((1, 8), self.load_count, dtype=np.float32)
+
+    def test_refresh_missing_artifacts(self):
+        engine = ScoringEngine(self.model_path + ".missing", self.candidates_path,
+                               self._load_candidates)
+        assert engine.refresh() is None
+        assert self.load_count == 0
+
+    def test_refresh_only_on_change(self):
+        engine = ScoringEngine(self.model_path, self.candidates_path,
+                               self._load_candidates)
+        first = engine.refresh()
+        assert engine.refresh() is first
+        assert self.load_count == 1
+
+        with open(self.candidates_path, "a") as candidates_file:
+            candidates_file.write("2\n")
+
+        second = engine.refresh()
+        assert second is not first
+        assert second is engine.snapshot
+        # unchanged model is kept, changed candidates are reloaded
+        assert second.model is first.model
+        assert second.problem_ids.tolist() == ["2"]
+        # the old snapshot is left untouched for in-flight requests
+        assert first.problem_ids.tolist() == ["1"]
+        assert np.all(first.candidates == 1)
+
+    def test_refresh_solution_index(self):
+        solution_index_path = os.path.join(self.temp_dir.name, "solutions.json")
+        engine = ScoringEngine(self.model_path, self.candidates_path,
+                               self._load_candidates,
+                               solution_index_path=solution_index_path,
+                               load_solution_index=lambda: {"problems": {}})
+        # a missing solution index doesn't prevent scoring
+        first = engine.refresh()
+        assert first is not None and first.solution_index is None
+
+        with open(solution_index_path, "w") as solution_index_file:
+            solution_index_file.write("{}")
+
+        second = engine.refresh()
+        assert second.solution_index == {"problems": {}}
+        assert second.candidates is first.candidates
+        assert self.load_count == 1
+
+    def test_score_modes(self):
+        candidates = np.random.rand(3, 8).astype(np.float32)
+
+        def load_candidates():
+            return np.array(["1", "2", "3"]), candidates
+
+        full_engine = ScoringEngine(self.model_path, self.candidates_path,
+                                    load_candidates, scoring_mode="full")
+        projection_engine = ScoringEngine(self.model_path, self.candidates_path,
+                                          load_candidates, scoring_mode="projection")
+        full_snapshot = full_engine.refresh()
+        projection_snapshot = projection_engine.refresh()
+        assert full_snapshot.projections is None
+        assert projection_snapshot.projections.shape == (3, 4)
+
+        queries = np.random.rand(2, 8)
+        full_scores = ScoringEngine.score(full_snapshot, queries)
+        assert full_scores.shape == (2, 3)
+        np.testing.assert_allclose(
+            full_scores, ScoringEngine.score(projection_snapshot, queries),
+            rtol=1e-5, atol=1e-7)
+
+    def test_score_half_precision(self):
+        candidates = np.random.rand(50, 8).astype(np.float16)
+        vectors_path = os.path.join(self.temp_dir.name, "vectors.npy")
+        np.save(vectors_path, candidates)
+
+        def load_candidates():
+            return np.arange(50).astype(str), np.load(vectors_path, mmap_mode="r")
+
+        queries = np.random.rand(3, 8)
+        for scoring_mode in ScoringEngine.SCORING_MODES:
+            engine = ScoringEngine(self.model_path, self.candidates_path, load_candidates,
+                                   scoring_mode=scoring_mode, memory_budget_mb=0.001)
+            snapshot = engine.refresh()
+            # the memory-mapped vectors are kept in their stored precision
+            assert isinstance(snapshot.candidates, np.memmap)
+            assert snapshot.candidates.dtype == np.float16
+            np.testing.assert_allclose(
+                ScoringEngine.score(snapshot, queries),
+                snapshot.model.predict_from_projections(
+                    snapshot.model.project_first_layer(candidates.astype(np.float32)),
+                    queries.astype(np.float32)),
+                rtol=1e-5, atol=1e-7)
+
+    def test_rank_in_chunks(self):
+        candidates = np.random.rand(50, 8).astype(np.float32)
+
+        def load_candidates():
+            return np.arange(50).astype(str), candidates
+
+        engine = ScoringEngine(self.model_path, self.candidates_path, load_candidates)
+        # budget of a few candidates per chunk, scored by two threads
+        chunked_engine = ScoringEngine(self.model_path, self.candidates_path,
+                                       load_candidates, memory_budget_mb=0.001,
+                                       scoring_threads=2)
+        snapshot = engine.refresh()
+        chunked_snapshot = chunked_engine.refresh()
+        assert 1 < chunked_engine.chunk_size(chunked_snapshot, 3) < 50
+
+        queries = np.random.rand(3, 8)
+        similarities = ScoringEngine.score(snapshot, queries)
+        for query_similarities, exact, chunked in zip(
+                similarities,
+                engine.rank(snapshot, queries, 5),
+                chunked_engine.rank(chunked_snapshot, queries, 5)):
+            np.testing.assert_allclose(query_similarities[exact],
+                                       query_similarities[chunked])
+
+    def test_rank_solutions_in_chunks(self):
+        candidates = np.random.rand(50, 8).astype(np.float32)
+        problem_ids = np.arange(50).astype(str)
+        solution_index_path = os.path.join(self.temp_dir.name, "solutions.json")
+        with open(solution_index_path, "w") as solution_index_file:
+            solution_index_file.write("{}")
+        # 7 solutions spread over the chunks, some problems without solution
+        solution_index = {"problems": {problem_id: "s%d" % (i % 7)
+                                       for i, problem_id in enumerate(problem_ids[:45])}}
+
+        engines = [ScoringEngine(self.model_path, self.candidates_path,
+                                 lambda: (problem_ids, candidates),
+                                 solution_index_path=solution_index_path,
+                                 load_solution_index=lambda: solution_index,
+                                 memory_budget_mb=0.001, **options)
+                   for options in ({"scoring_threads": 2}, {"scoring_workers": 2})]
+        queries = np.random.rand(3, 8)
+        try:
+            for engine in engines:
+                snapshot = engine.refresh()
+                similarities = ScoringEngine.score(snapshot, queries)
+                for aggregation in ScoringEngine.AGGREGATIONS:
+                    rankings = engine.rank(snapshot, queries, 4, aggregation=aggregation)
+                    for query_similarities, chunked in zip(similarities, rankings):
+                        expected = select_top_solutions(query_similarities,
+                                                        snapshot.solution_codes, 4, aggregation)
+                        np.testing.assert_allclose(query_similarities[chunked],
+                                                   query_similarities[expected])
+        finally:
+            engines[1].snapshot.pool.close()
+
+    def test_rank_with_prefilter(self):
+        candidates = np.random.rand(50, 8).astype(np.float32)
+
+        def load_candidates():
+            return np.arange(50).astype(str), candidates
+
+        prefilter = {"enabled": True, "n_lists": 5, "n_probe": 5,
+                     "metric": "l2", "shortlist_size": 50}
+        exact_engine = ScoringEngine(self.model_path, self.candidates_path,
+                                     load_candidates)
+        prefilter_engine = ScoringEngine(self.model_path, self.candidates_path,
+                                         load_candidates, prefilter=prefilter)
+        exact_snapshot = exact_engine.refresh()
+        prefilter_snapshot = prefilter_engine.refresh()
+        assert exact_snapshot.index is None
+        assert prefilter_snapshot.index is not None
+
+        # the shortlist covers all the candidates, so the ranking is exact
+        queries = np.random.rand(3, 8)
+        similarities = ScoringEngine.score(exact_snapshot, queries)
+        for query_similarities, exact, approximate in zip(
+                similarities,
+                exact_engine.rank(exact_snapshot, queries, 5),
+                prefilter_engine.rank(prefilter_snapshot, queries, 5)):
+            np.testing.assert_allclose(query_similarities[exact],
+                                       query_similarities[approximate])
+
+        for ranking in prefilter_engine.rank(prefilter_snapshot, queries, 5,
+                                             shortlist_size=10):
+            assert len(ranking) == 5
+
+    def test_rank_with_lexical_prefilter(self):
+        candidates = np.random.rand(3, 8).astype(np.float32)
+        descriptions_path = os.path.join(self.temp_dir.name, "descriptions.csv")
+        with open(descriptions_path, "w") as descriptions_file:
+            descriptions_file.write("problem_id,normalized_description\n")
+
+        def load_descriptions():
+            return ["1", "2", "3"], ["log saw stop", "log blade stop", "servic sincro"]
+
+        lexical_prefilter = {"enabled": True, "k1": 1.5, "b": 0.75,
+                             "shortlist_size": 10, "blend": 0.5}
+        engine = ScoringEngine(self.model_path, self.candidates_path,
+                               lambda: (np.array(["1", "2", "3"]), candidates),
+                               lexical_prefilter=lexical_prefilter,
+                               descriptions_path=descriptions_path,
+                               load_descriptions=load_descriptions)
+        snapshot = engine.refresh()
+        assert snapshot.lexical_index is not None
+
+        queries = np.random.rand(2, 8)
+        lexical, exhaustive = engine.rank(snapshot, queries, 3,
+                                          query_tokens=[["sincro"], ["unknown"]])
+        # only the candidate sharing a word is shortlisted
+        assert lexical.tolist() == [2]
+        # queries without shared words are scored against all the candidates
+        assert sorted(exhaustive.tolist()) == [0, 1, 2]
+
+    def test_rank_compressed(self):
+        candidates = np.random.rand(50, 8).astype(np.float32)
+        quantizer = ProductQuantizer(n_subspaces=2, n_centroids=16).fit(candidates)
+        codes = quantizer.encode(candidates)
+
+        compression = {"enabled": True, "shortlist_size": 50}
+        engine = ScoringEngine(self.model_path, self.candidates_path,
+                               lambda: (np.arange(50).astype(str), candidates),
+                               compression=compression,
+                               load_codes=lambda: (np.arange(50).astype(str), quantizer, codes))
+        exact_engine = ScoringEngine(self.model_path, self.candidates_path,
+                                     lambda: (np.arange(50).astype(str), candidates))
+        snapshot = engine.refresh()
+        exact_snapshot = exact_engine.refresh()
+        assert snapshot.quantizer is quantizer
+        # nothing proportional to the full vectors is precomputed
+        assert snapshot.projections is None and snapshot.index is None
+
+        # the shortlist covers all the candidates, so the ranking is exact
+        queries = np.random.rand(3, 8)
+        similarities = ScoringEngine.score(exact_snapshot, queries)
+        for query_similarities, exact, compressed in zip(
+                similarities,
+                exact_engine.rank(exact_snapshot, queries, 5),
+                engine.rank(snapshot, queries, 5)):
+            np.testing.assert_allclose(query_similarities[exact],
+                                       query_similarities[compressed], rtol=1e-5)
+
+    def test_rank_compressed_other_revision(self):
+        candidates = np.random.rand(50, 8).astype(np.float32)
+        quantizer = ProductQuantizer(n_subspaces=2, n_centroids=16).fit(candidates)
+        codes = quantizer.encode(candidates)
+
+        # same number of candidates, but the codes belong to another revision
+        engine = ScoringEngine(self.model_path, self.candidates_path,
+                               lambda: (np.arange(50).astype(str), candidates),
+                               compression={"enabled": True, "shortlist_size": 50},
+                               load_codes=lambda: (np.arange(1, 51).astype(str), quantizer,
+                                                   codes))
+        snapshot = engine.refresh()
+        assert snapshot.quantizer is None and snapshot.codes is None
+        assert all(len(ranking) == 5 for ranking in engine.rank(snapshot, np.random.rand(2, 8), 5))
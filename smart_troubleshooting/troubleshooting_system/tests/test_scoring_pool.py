@@ -0,0 +1,44 @@
+"""
+Testing for ScoringPool class.
+
+Author: Filippo Guggino
+"""
+
+import numpy as np
+
+from smart_troubleshooting.pd_similarity_dev_system.similarity_model \
+    import SimilarityModel
+from smart_troubleshooting.troubleshooting_system.scoring_pool import ScoringPool
+
+
+class TestScoringPool:
+
+    def setup_method(self, test_method):
+        self.model = SimilarityModel(hidden_layer_sizes=(4,), max_iter=5,
+                                     random_state=0xdeadbeef)
+        self.model.fit(np.random.rand(20, 8), np.random.rand(20))
+        self.candidates = np.random.rand(11, 8).astype(np.float32)
+        self.queries = np.random.rand(3, 8).astype(np.float32)
+
+    def test_score_projections(self):
+        projections = self.model.project_first_layer(self.candidates)
+        pool = ScoringPool(self.model, projections, True, 2)
+        try:
+            np.testing.assert_allclose(
+                pool.score(self.queries),
+                self.model.predict_from_projections(projections, self.queries),
+                rtol=1e-5)
+        finally:
+            pool.close()
+
+    def test_score_feature_vectors(self):
+        # more workers than candidates: empty shards are skipped
+        pool = ScoringPool(self.model, self.candidates[:2], False, 3)
+        try:
+            scores = pool.score(self.queries)
+        finally:
+            pool.close()
+        assert scores.shape == (3, 2)
+        np.testing.assert_allclose(
+            scores[1], self.model.predict(self.candidates[:2] - self.queries[1]),
+            rtol=1e-5)
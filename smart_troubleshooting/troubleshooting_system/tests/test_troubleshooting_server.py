@@ -0,0 +1,128 @@
+"""
+Testing for TroubleShootingServer class.
+
+Author: Filippo Guggino
+"""
+
+import json
+import socket
+
+import pytest
+
+from smart_troubleshooting.technical_support_system.request_manager \
+    import RequestManager
+from smart_troubleshooting.troubleshooting_system.micro_batcher \
+    import MicroBatcher
+from smart_troubleshooting.troubleshooting_system.troubleshooting_server \
+    import TroubleShootingServer
+
+
+class MockService:
+    def __init__(self, available=True, failing=False, compatible=True):
+        self.available = available
+        self.failing = failing
+        self.compatible = compatible
+
+    def solve_requests(self, requests):
+        if self.failing:
+            raise RuntimeError("scoring failed")
+        if not self.available:
+            return None
+        if not self.compatible:
+            return [{"requestID": req["requestID"], "problemsIDs": [],
+                     "responseType": "ERROR", "errorMessage": "incompatible candidates"}
+                    for req in requests]
+        return [{"requestID": req["requestID"],
+                 "problemsIDs": [req["problemDescription"]]}
+                for req in requests]
+
+
+class TestTroubleShootingServer:
+
+    def start_server(self, service, micro_batcher=None):
+        self.server = TroubleShootingServer(
+            service, port=0,
+            request_schema_path="technical_support_system/json/schemas/"
+                                "SimilarProblemsReqSchema.json",
+            micro_batcher=micro_batcher)
+        self.server.start_in_background()
+
+    def teardown_method(self, test_method):
+        self.server.stop()
+
+    def test_request_manager(self):
+        self.start_server(MockService())
+        request_manager = RequestManager()
+        request_manager.set_troubleshooting_server(self.server.host,
+                                                   self.server.port)
+
+        assert request_manager.request_similar_problems(1, "problem")["problemsIDs"] \
+            == ["problem"]
+
+    def test_error_response(self):
+        self.start_server(MockService(compatible=False))
+        request_manager = RequestManager()
+        request_manager.set_troubleshooting_server(self.server.host,
+                                                   self.server.port)
+
+        assert request_manager.request_similar_problems(1, "problem") == "Error"
+
+    def test_batch_on_same_connection(self):
+        self.start_server(MockService())
+        requests = {"requests": [{"requestID": 1, "problemDescription": "a"},
+                                 {"requestID": 2, "problemDescription": "b"}]}
+
+        with socket.create_connection((self.server.host, self.server.port)) \
+                as connection, connection.makefile("r") as stream:
+            for _ in range(2):
+                connection.sendall(json.dumps(requests).encode() + b"\n")
+                reply = json.loads(stream.readline())
+                assert [resp["problemsIDs"] for resp in reply["responses"]] == \
+                    [["a"], ["b"]]
+
+    def test_errors(self):
+        self.start_server(MockService(available=False))
+
+        with socket.create_connection((self.server.host, self.server.port)) \
+                as connection, connection.makefile("r") as stream:
+            connection.sendall(b"not a json\n")
+            assert "errorMessage" in json.loads(stream.readline())
+
+            connection.sendall(b'{"requests": [{"requestID": "x"}]}\n')
+            assert "errorMessage" in json.loads(stream.readline())
+
+            connection.sendall(
+                b'{"requests": [{"requestID": 1, "problemDescription": "a"}]}\n')
+            assert "errorMessage" in json.loads(stream.readline())
+
+    def test_micro_batching_metrics(self):
+        service = MockService()
+        self.start_server(service, MicroBatcher(service.solve_requests))
+        request_manager = RequestManager()
+        request_manager.set_troubleshooting_server(self.server.host,
+                                                   self.server.port)
+        assert request_manager.request_similar_problems(1, "problem")["problemsIDs"] \
+            == ["problem"]
+
+        with socket.create_connection((self.server.host, self.server.port)) \
+                as connection, connection.makefile("r") as stream:
+            connection.sendall(b'{"command": "metrics"}\n')
+            assert json.loads(stream.readline())["batchSizes"] == {"1": 1}
+
+    def test_solve_failure(self):
+        service = MockService(failing=True)
+        for micro_batcher in (None, MicroBatcher(service.solve_requests)):
+            self.start_server(service, micro_batcher)
+            with socket.create_connection((self.server.host, self.server.port)) \
+                    as connection, connection.makefile("r") as stream:
+                connection.sendall(
+                    b'{"requests": [{"requestID": 1, "problemDescription": "a"}]}\n')
+                reply = json.loads(stream.readline())
+                assert reply["responses"] == [] and "scoring failed" in reply["errorMessage"]
+            self.server.stop()
+
+    def test_port_in_use(self):
+        self.start_server(MockService())
+        server = TroubleShootingServer(MockService(), port=self.server.port)
+        with pytest.raises(OSError):
+            server.start_in_background()
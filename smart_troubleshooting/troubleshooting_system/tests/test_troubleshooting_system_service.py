@@ -0,0 +1,166 @@
+"""
+Testing for the request handling of TroubleShootingSystemService class.
+"""
+
+import os
+import shutil
+from types import SimpleNamespace
+
+import numpy as np
+
+from smart_troubleshooting.feature_vector_store import write_feature_vectors
+from smart_troubleshooting.file_io import dump_json, load_json
+from smart_troubleshooting.pd_similarity_dev_system.similarity_model import SimilarityModel
+from smart_troubleshooting.troubleshooting_system.troubleshooting_system_service import \
+    TroubleShootingSystemService
+
+REQUEST_SCHEMA_PATH = os.path.abspath(
+    "technical_support_system/json/schemas/SimilarProblemsReqSchema.json")
+REQUEST_PATH = "technical_support_system/json/SimilarProblemsReqFile.json"
+RESPONSE_PATH = "troubleshooting_system/json/SimilarProblemsResponseFile.json"
+REPORT_PATH = "troubleshooting_system/json/troubleshootingReport.json"
+
+
+class MockDataManipulationManager:
+
+    @staticmethod
+    def perform_data_manipulation(sentences):
+        return [sentence.lower() for sentence in sentences]
+
+    @staticmethod
+    def configuration_hash():
+        return "configuration"
+
+
+class MockWordEmbeddingManager:
+    data_manipulation_manager = MockDataManipulationManager()
+    encoder_fingerprint = "encoder/max_seq_length=128"
+
+    @staticmethod
+    def embed_normalized_sentences(sentences, cache=None):
+        return [np.array([len(sentence)], dtype=np.float32) for sentence in sentences]
+
+
+class MockScoringEngine:
+    """
+        The candidate problem closest to a query is the one whose id is the
+        length of its description.
+    """
+
+    def __init__(self, late_requests):
+        self.late_requests = late_requests
+        self.ranked_batches = []
+        self.snapshot = SimpleNamespace(
+            versions={"model": 1, "candidates": 1, "solution_index": None,
+                      "descriptions": None},
+            problem_ids=np.array([str(i) for i in range(100)]),
+            solution_index=None)
+
+    def refresh(self):
+        return self.snapshot
+
+    def rank(self, snapshot, query_vectors, k, shortlist_size=None, aggregation=None,
+             query_tokens=None):
+        # requests submitted by the user while the pending ones are scored
+        pending_requests = load_json(REQUEST_PATH)
+        pending_requests['requests'].extend(self.late_requests)
+        dump_json(pending_requests, REQUEST_PATH)
+        self.ranked_batches.append(len(query_vectors))
+        return [np.array([int(vector[0])]) for vector in query_vectors]
+
+
+class TestTroubleShootingSystemService:
+
+    def test_pending_requests(self, tmp_path, monkeypatch):
+        monkeypatch.chdir(tmp_path)
+        os.makedirs("technical_support_system/json/schemas")
+        os.makedirs("troubleshooting_system/json")
+        shutil.copy(REQUEST_SCHEMA_PATH, "technical_support_system/json/schemas")
+        monkeypatch.setattr(TroubleShootingSystemService, "_preload_encoder", False)
+
+        requests = [{"requestID": 1, "problemDescription": "Paper jam"},
+                    {"requestID": 2, "problemDescription": "No power"},
+                    {"requestID": 3, "problemDescription": "Printer is noisy"}]
+        late_requests = [{"requestID": 4, "problemDescription": "Bad print"}]
+        dump_json({"requests": requests}, REQUEST_PATH)
+
+        service = TroubleShootingSystemService()
+        scoring_engine = MockScoringEngine(late_requests)
+        service._scoring_engine = scoring_engine  # pylint: disable=protected-access
+        service._word_embedding_manager = MockWordEmbeddingManager()  # pylint: disable=protected-access
+        service.activate_troubleshooting_procedure()
+
+        # all the pending requests are scored together, each one gets its response
+        assert scoring_engine.ranked_batches == [3]
+        assert load_json(RESPONSE_PATH)["responses"] == [
+            {"requestID": 1, "problemsIDs": ["9"]},
+            {"requestID": 2, "problemsIDs": ["8"]},
+            {"requestID": 3, "problemsIDs": ["16"]}]
+        # only the answered requests are removed
+        assert load_json(REQUEST_PATH) == {"requests": late_requests}
+
+    def test_response_cache(self, tmp_path, monkeypatch):
+        monkeypatch.chdir(tmp_path)
+        os.makedirs("technical_support_system/json")
+        monkeypatch.setattr(TroubleShootingSystemService, "_preload_encoder", False)
+        dump_json({"requests": []}, REQUEST_PATH)
+
+        service = TroubleShootingSystemService()
+        scoring_engine = MockScoringEngine([])
+        service._scoring_engine = scoring_engine  # pylint: disable=protected-access
+        word_embedding_manager = MockWordEmbeddingManager()
+        service._word_embedding_manager = word_embedding_manager  # pylint: disable=protected-access
+
+        first = service.solve_requests([{"requestID": 1, "problemDescription": "Paper jam"}])
+        # requests with the same normalized description share the cached response
+        second = service.solve_requests([{"requestID": 2, "problemDescription": "PAPER  JAM"}])
+        assert scoring_engine.ranked_batches == [1]
+        assert second == [{"requestID": 2, "problemsIDs": first[0]["problemsIDs"]}]
+
+        # responses of another data manipulation configuration are not reused
+        monkeypatch.setattr(MockDataManipulationManager, "configuration_hash",
+                            staticmethod(lambda: "other"))
+        service.solve_requests([{"requestID": 3, "problemDescription": "Paper jam"}])
+        assert scoring_engine.ranked_batches == [1, 1]
+
+    def test_incompatible_candidates(self, tmp_path, monkeypatch):
+        monkeypatch.chdir(tmp_path)
+        os.makedirs("technical_support_system/json/schemas")
+        os.makedirs("troubleshooting_system/json")
+        os.makedirs("pd_similarity_dev_system/models")
+        shutil.copy(REQUEST_SCHEMA_PATH, "technical_support_system/json/schemas")
+        monkeypatch.setattr(TroubleShootingSystemService, "_preload_encoder", False)
+        model = SimilarityModel(hidden_layer_sizes=(4,), max_iter=5, random_state=0xdeadbeef)
+        model.fit(np.random.rand(20, 1), np.random.rand(20))
+        model.save(TroubleShootingSystemService._neural_network_path)
+        store_path = TroubleShootingSystemService._candidate_feature_vector_store
+        requests = [{"requestID": 1, "problemDescription": "Paper jam"}]
+
+        service = TroubleShootingSystemService()
+        service._word_embedding_manager = MockWordEmbeddingManager()  # pylint: disable=protected-access
+
+        # candidates encoded with a different sequence length cap are not scored
+        write_feature_vectors(store_path, ["1", "2"], np.random.rand(2, 1),
+                              "encoder/max_seq_length=512", "configuration")
+        dump_json({"requests": requests}, REQUEST_PATH)
+        service.activate_troubleshooting_procedure()
+        response = load_json(RESPONSE_PATH)["responses"][0]
+        assert response["responseType"] == "ERROR" and response["problemsIDs"] == []
+        report = load_json(REPORT_PATH)
+        assert report["exitStatus"] == "ERROR"
+        assert "encoder/max_seq_length=512" in report["errorMessage"]
+        # the request is answered, it doesn't stay pending
+        assert load_json(REQUEST_PATH) == {"requests": []}
+
+        # nor candidates normalized with another configuration
+        write_feature_vectors(store_path, ["1", "2"], np.random.rand(2, 1),
+                              MockWordEmbeddingManager.encoder_fingerprint, "other")
+        response = service.solve_requests(requests)[0]
+        assert response["responseType"] == "ERROR"
+        assert "data manipulation configuration" in response["errorMessage"]
+
+        write_feature_vectors(store_path, ["1", "2"], np.random.rand(2, 1),
+                              MockWordEmbeddingManager.encoder_fingerprint, "configuration")
+        responses = service.solve_requests(requests)
+        assert "responseType" not in responses[0]
+        assert sorted(responses[0]["problemsIDs"]) == ["1", "2"]
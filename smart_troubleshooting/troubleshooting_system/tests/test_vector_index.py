@@ -0,0 +1,51 @@
+"""
+Testing for IVFIndex class.
+
+Author: Filippo Guggino
+"""
+
+import numpy as np
+import pytest
+
+from smart_troubleshooting.troubleshooting_system.vector_index \
+    import IVFIndex, kmeans, squared_distances
+
+
+def test_kmeans():
+    rng = np.random.default_rng(0)
+    data = np.concatenate((rng.normal(0, 0.1, (50, 2)),
+                           rng.normal(10, 0.1, (50, 2))))
+    centroids = kmeans(data, 2, random_state=0)
+    centroids = centroids[np.argsort(centroids[:, 0])]
+
+    np.testing.assert_allclose(centroids, [[0, 0], [10, 10]], atol=0.1)
+
+
+@pytest.mark.parametrize('metric', IVFIndex.METRICS)
+class TestIVFIndex:
+
+    def setup_method(self, test_method):
+        rng = np.random.default_rng(0)
+        self.vectors = rng.normal(size=(500, 16)).astype(np.float32)
+        self.queries = rng.normal(size=(5, 16)).astype(np.float32)
+
+    def test_search_all_lists_is_exact(self, metric):
+        index = IVFIndex(n_lists=10, n_probe=10, metric=metric).fit(self.vectors)
+        shortlists = index.search(self.queries, 20)
+
+        vectors, queries = self.vectors, self.queries
+        if metric == "cosine":
+            vectors = vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+            queries = queries / np.linalg.norm(queries, axis=1, keepdims=True)
+        exact = np.argsort(squared_distances(queries, vectors), axis=1)[:, :20]
+
+        for shortlist, expected in zip(shortlists, exact):
+            assert set(shortlist.tolist()) == set(expected.tolist())
+
+    def test_search_few_lists(self, metric):
+        index = IVFIndex(n_lists=10, n_probe=2, metric=metric).fit(self.vectors)
+        shortlists = index.search(self.queries, 1000)
+
+        for shortlist in shortlists:
+            assert 0 < len(shortlist) < len(self.vectors)
+            assert len(np.unique(shortlist)) == len(shortlist)
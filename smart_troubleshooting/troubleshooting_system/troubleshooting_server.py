@@ -0,0 +1,157 @@
+"""
+This module provides a local request/response server exposing the troubleshooting
+procedure, as a low-latency alternative to the SimilarProblemsReqFile and
+SimilarProblemsResponseFile exchange.
+
+The protocol is line-based: each request is a JSON document in the same format of
+the SimilarProblemsReqFile, terminated by a newline, and each reply is a JSON
+document in the same format of the SimilarProblemsResponseFile. The request
+{"command": "metrics"} returns the micro-batching metrics instead.
+
+Author: Filippo Guggino
+"""
+import asyncio
+import json
+import threading
+
+from smart_troubleshooting.file_io import load_json, validate_json
+
+
+class TroubleShootingServer:
+    """
+        asyncio TCP server bound to a local address. Scoring runs in the default
+        executor, so the event loop keeps accepting requests meanwhile.
+        If a micro-batcher is given, requests coming from different connections
+        are solved together.
+    """
+    # pylint: disable=too-many-arguments
+
+    def __init__(self, service, host="127.0.0.1", port=8765, request_schema_path=None,
+                 micro_batcher=None):
+        """
+            :param service: the service answering the requests, offering solve_requests
+            :type service: TroubleShootingSystemService
+            :param host: address the server is bound to
+            :type host: string
+            :param port: port the server is bound to, 0 to pick a free one
+            :type port: integer
+            :param request_schema_path: schema of the requests, None to skip validation
+            :type request_schema_path: string
+            :param micro_batcher: the batcher collecting the requests, None to solve
+                each message on its own
+            :type micro_batcher: MicroBatcher
+        """
+        self._service = service
+        self._micro_batcher = micro_batcher
+        self.host = host
+        self.port = port
+        self._request_schema = None
+        if request_schema_path is not None:
+            self._request_schema = load_json(request_schema_path)
+        self._loop = None
+        self._server = None
+
+    async def _answer(self, message):
+        try:
+            request_data = json.loads(message)
+        except ValueError:
+            return {"responses": [], "errorMessage": "Request is not a valid json"}
+
+        if isinstance(request_data, dict) and request_data.get("command") == "metrics":
+            if self._micro_batcher is None:
+                return {}
+            return self._micro_batcher.metrics()
+
+        if self._request_schema is not None \
+                and validate_json(request_data, self._request_schema) is not True:
+            return {"responses": [], "errorMessage": "Request doesn't respect the schema"}
+
+        try:
+            if self._micro_batcher is not None:
+                responses = await self._micro_batcher.submit(request_data['requests'])
+                if None in responses:
+                    responses = None
+            else:
+                loop = asyncio.get_event_loop()
+                responses = await loop.run_in_executor(
+                    None, self._service.solve_requests, request_data['requests'])
+        except Exception as error:  # pylint: disable=broad-except
+            # the client gets a reply instead of a closed connection
+            return {"responses": [], "errorMessage": "Troubleshooting failed: %s" % error}
+        if responses is None:
+            return {"responses": [], "errorMessage": "Troubleshooting model not available"}
+        return {"responses": responses}
+
+    async def _handle_connection(self, reader, writer):
+        try:
+            while True:
+                message = await reader.readline()
+                if not message:
+                    break
+                reply = await self._answer(message)
+                writer.write(json.dumps(reply).encode() + b"\n")
+                await writer.drain()
+        finally:
+            writer.close()
+
+    async def serve(self, started=None):
+        """
+            Accept connections until the server is stopped.
+
+            :param started: event set once the server is listening
+            :type started: threading.Event
+        """
+        self._loop = asyncio.get_event_loop()
+        self._server = await asyncio.start_server(
+            self._handle_connection, self.host, self.port)
+        # the actual port, in case a free one was requested
+        self.port = self._server.sockets[0].getsockname()[1]
+        if started is not None:
+            started.set()
+
+        async with self._server:
+            try:
+                await self._server.serve_forever()
+            except asyncio.CancelledError:
+                pass
+
+    def start(self):
+        """
+            Run the server in the calling thread, until it's stopped.
+        """
+        asyncio.run(self.serve())
+
+    def start_in_background(self):
+        """
+            Run the server in a daemon thread, returning once it's listening.
+            If the server can't start (e.g. the port is in use), the error is
+            raised in the calling thread.
+
+            :returns: the thread running the server
+            :rtype: threading.Thread
+        """
+        started = threading.Event()
+        errors = []
+
+        def run():
+            try:
+                asyncio.run(self.serve(started))
+            except Exception as error:  # pylint: disable=broad-except
+                errors.append(error)
+            finally:
+                # the caller waits for the server to be listening or to fail
+                started.set()
+
+        thread = threading.Thread(target=run, daemon=True)
+        thread.start()
+        started.wait()
+        if errors:
+            raise errors[0]
+        return thread
+
+    def stop(self):
+        """
+            Stop accepting connections.
+        """
+        if self._server is not None:
+            self._loop.call_soon_threadsafe(self._server.close)
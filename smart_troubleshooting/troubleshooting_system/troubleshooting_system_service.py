@@ -3,6 +3,7 @@ This module provides a set of API to access data manipulation functionalities.
 
 Author: Filippo Guggino, Leonardo Cecchelli
 """
+import csv
 import threading
 import os
 from datetime import datetime
@@ -11,8 +12,15 @@ import time
 import numpy as np
 
 from smart_troubleshooting.file_io import load_json, dump_json, validate_json
-from smart_troubleshooting.pd_similarity_dev_system.similarity_model import SimilarityModel
+from smart_troubleshooting.feature_vector_store import header_path, read_feature_vectors, \
+    read_quantized_feature_vectors
+from smart_troubleshooting.lru_cache import LRUCache
 from smart_troubleshooting.pd_preparation_system.word_embedding_manager import WordEmbeddingManager
+from smart_troubleshooting.troubleshooting_system.scoring_engine import ScoringEngine
+from smart_troubleshooting.troubleshooting_system.micro_batcher import MicroBatcher
+from smart_troubleshooting.troubleshooting_system.product_quantizer import ProductQuantizer
+from smart_troubleshooting.troubleshooting_system.troubleshooting_server \
+    import TroubleShootingServer
 
 
 class TroubleShootingSystemService:
@@ -33,32 +41,115 @@ class TroubleShootingSystemService:
     _similar_problem_req_schema = \
         "technical_support_system/json/schemas/SimilarProblemsReqSchema.json"
     _candidate_similar_problem_path = "pd_preparation_system/csv/FeatureVectorOutputFile.csv"
+    # binary feature vector store, None to read the csv file instead
+    _candidate_feature_vector_store = "pd_preparation_system/feature_vectors"
+    _candidate_descriptions_path = "pd_preparation_system/csv/NormalizedDescriptionsFile.csv"
     _similar_problem_response_path = "troubleshooting_system/json/SimilarProblemsResponseFile.json"
     _similar_problem_response_schema = \
         "troubleshooting_system/json/schema/SimilarProblemsResponseSchema.json"
     _maxnum_candidate_solution = 10
     _troubleshooting_report_file = "troubleshooting_system/json/troubleshootingReport.json"
+    _solution_index_path = "solved_problems_repo/json/SolutionIndexFile.json"
+    _solution_index_schema = "solved_problems_repo/json/schemas/SolutionIndexFileSchema.json"
+    _scoring_mode = "projection"
+    _ranking = "solution"
+    _solution_aggregation = "max"
+    _prefilter = {"enabled": False}
+    _lexical_prefilter = {"enabled": False}
+    _compression = {"enabled": False}
+    _scoring_workers = 0
+    _memory_budget_mb = 256
+    _scoring_threads = 1
+    _embedding_cache_size = 1024
+    _preload_encoder = True
+    # must match the encoder settings of the preparation of the candidates
+    _encoder_settings = {"max_seq_length": 128, "batch_size": 32, "quantization": "none"}
+    _response_cache_settings = {"size": 1024, "ttl_seconds": 600}
+    _server = {"enabled": False, "host": "127.0.0.1", "port": 8765,
+               "batch_window_ms": 5, "max_batch_size": 32}
 
     def __init__(self):
         config_path = "troubleshooting_system/json/troubleshootingConfig.json"
         if os.path.exists(config_path):
             self._load_configuration(config_path)
 
+        # Model and candidate problems stay resident between two activations
+        self._scoring_engine = ScoringEngine(
+            self._neural_network_path,
+            self._candidate_similar_problem_path if self._candidate_feature_vector_store is None
+            else header_path(self._candidate_feature_vector_store),
+            self.retrieve_similar_problems_vector,
+            self._scoring_mode,
+            self._prefilter,
+            self._solution_index_path,
+            self.retrieve_solution_index,
+            self._scoring_workers,
+            self._memory_budget_mb,
+            self._scoring_threads,
+            self._lexical_prefilter,
+            self._candidate_descriptions_path,
+            self.retrieve_similar_problems_descriptions,
+            self._compression,
+            self.retrieve_similar_problems_codes)
+        self._word_embedding_manager = WordEmbeddingManager(
+            self._encoder_settings['max_seq_length'], self._encoder_settings['batch_size'],
+            self._encoder_settings['quantization'])
+        if self._preload_encoder:
+            # the encoder is loaded while waiting for the first request
+            threading.Thread(target=self._word_embedding_manager.preload, daemon=True).start()
+        # Resubmitted problem descriptions don't need to go through the encoder again
+        self._embedding_cache = LRUCache(self._embedding_cache_size)
+        # Identical problems reported during an incident are answered without scoring
+        self._response_cache = LRUCache(self._response_cache_settings['size'],
+                                        self._response_cache_settings['ttl_seconds'])
+        self._response_cache_versions = None
+        # encoder and data manipulation configuration hash the candidates were
+        # prepared with, None if unknown (csv file)
+        self._candidates_encoder = None
+        self._candidates_configuration_hash = None
+
     def _load_configuration(self, config_path):
         config_data = load_json(config_path)
         self._neural_network_path = config_data['neural_network_path']
         self._similar_problem_req_path = config_data['similar_problem_req_path']
         self._similar_problem_req_schema = config_data['similar_problem_req_schema']
         self._candidate_similar_problem_path = config_data['candidate_similar_problem_path']
+        self._candidate_feature_vector_store = config_data.get(
+            'candidate_feature_vector_store', self._candidate_feature_vector_store)
         self._similar_problem_response_path = config_data['similar_problem_response_path']
         self._similar_problem_response_schema = config_data['similar_problem_response_schema']
         self._maxnum_candidate_solution = config_data['maxnum_candidate_solution']
         self._troubleshooting_report_file = config_data['troubleshooting_report_file']
+        self._solution_index_path = \
+            config_data.get('solution_index_path', self._solution_index_path)
+        self._solution_index_schema = \
+            config_data.get('solution_index_schema', self._solution_index_schema)
+        self._scoring_mode = config_data.get('scoring_mode', self._scoring_mode)
+        self._ranking = config_data.get('ranking', self._ranking)
+        self._solution_aggregation = \
+            config_data.get('solution_aggregation', self._solution_aggregation)
+        self._prefilter = config_data.get('prefilter', self._prefilter)
+        self._candidate_descriptions_path = \
+            config_data.get('candidate_descriptions_path', self._candidate_descriptions_path)
+        self._lexical_prefilter = config_data.get('lexical_prefilter', self._lexical_prefilter)
+        self._compression = config_data.get('compression', self._compression)
+        self._scoring_workers = config_data.get('scoring_workers', self._scoring_workers)
+        self._memory_budget_mb = config_data.get('memory_budget_mb', self._memory_budget_mb)
+        self._scoring_threads = config_data.get('scoring_threads', self._scoring_threads)
+        self._embedding_cache_size = \
+            config_data.get('embedding_cache_size', self._embedding_cache_size)
+        self._preload_encoder = config_data.get('preload_encoder', self._preload_encoder)
+        self._encoder_settings = config_data.get('encoder', self._encoder_settings)
+        self._response_cache_settings = \
+            config_data.get('response_cache', self._response_cache_settings)
+        self._server = config_data.get('server', self._server)
 
     def _write_report(self, exit_status, error_message=None):
         report_json = {"exitStatus": exit_status,
                        "errorMessage": error_message,
-                       "lastSegregationTime": str(datetime.now())}
+                       "lastSegregationTime": str(datetime.now()),
+                       "embeddingCache": self._embedding_cache.stats(),
+                       "responseCache": self._response_cache.stats()}
 
         dump_json(report_json, self._troubleshooting_report_file)
 
@@ -74,29 +165,135 @@ class TroubleShootingSystemService:
         """
             Retrieve feature vector of previously solved problems from the PD_Preparation_System.
 
-            :return: feature vector and problem id of problems
-            :rtype: array of dictionaries of type:
-                {<problem_id>, <problem_feature_vector>}
+            :return: problem ids and feature vectors of problems, the i-th row of the
+                matrix is the feature vector of the i-th problem id
+            :rtype: tuple(ndarray of shape (n_problems,),
+                ndarray of float32 or float16 of shape (n_problems, n_features))
         """
+        if self._candidate_feature_vector_store is not None:
+            try:
+                header, problem_ids, feature_vectors = \
+                    read_feature_vectors(self._candidate_feature_vector_store)
+            except OSError:
+                # a new revision replaced the files in the meantime
+                time.sleep(1)
+                return self.retrieve_similar_problems_vector()
+            # compared with the settings of the queries before scoring (see _check_candidates)
+            self._candidates_encoder = header['model']
+            self._candidates_configuration_hash = header['configurationHash']
+            # memory-mapped vectors are used without copying them, in their stored
+            # precision: the scoring engine converts only the rows it scores
+            return problem_ids, feature_vectors
+
         try:
             with open(self._candidate_similar_problem_path) as problem_mapping_file:
-                head_rows = ["problem_id", "problem_feature_vector"]
-                csv_rows = np.genfromtxt(
+                csv_rows = np.loadtxt(
                     problem_mapping_file, delimiter=',',
-                    skip_header=1, dtype=str)
-                similar_problems_vector = []
-                for row in csv_rows:
-                    # Convert string representation retrieved from
-                    # csv file to Numpy array
-                    problem_id = row[0]
-                    problem_vector = np.array(row[1:])
-                    problem_vector = problem_vector.astype(np.float)
-                    problem_embedding = dict(zip(head_rows, [problem_id, problem_vector]))
-                    similar_problems_vector.append(problem_embedding)
+                    skiprows=1, dtype=str, ndmin=2)
+        except OSError:
+            time.sleep(1)
+            return self.retrieve_similar_problems_vector()
+
+        # Convert the whole string matrix retrieved from the csv file at once,
+        # keeping a single contiguous block of memory for all the candidates
+        problem_ids = csv_rows[:, 0]
+        feature_vectors = np.ascontiguousarray(csv_rows[:, 1:].astype(np.float32))
+        return problem_ids, feature_vectors
+
+    def retrieve_similar_problems_codes(self):
+        """
+            Retrieve the product quantization codes of previously solved problems from
+            the feature vector store of the PD_Preparation_System.
+
+            :return: the problem ids, the quantizer and the codes of the problems, None if
+                the store isn't compressed
+            :rtype: tuple(ndarray of shape (n_problems,), ProductQuantizer,
+                ndarray of uint8 of shape (n_problems, n_subspaces))
+        """
+        if self._candidate_feature_vector_store is None:
+            return None
+        try:
+            compressed_vectors = \
+                read_quantized_feature_vectors(self._candidate_feature_vector_store)
         except OSError:
             time.sleep(1)
-            self.retrieve_similar_problems_vector()
-        return similar_problems_vector
+            return self.retrieve_similar_problems_codes()
+
+        if compressed_vectors is None:
+            return None
+        _, problem_ids, codebooks, codes = compressed_vectors
+        # the ids tell the scoring engine whether the codes belong to the same
+        # revision of the store as the feature vectors
+        return problem_ids, ProductQuantizer.from_codebooks(codebooks), codes
+
+    def retrieve_similar_problems_descriptions(self):
+        """
+            Retrieve the normalized descriptions of previously solved problems from the
+            PD_Preparation_System.
+
+            :return: problem ids and normalized descriptions of problems
+            :rtype: tuple(array of strings, array of strings)
+        """
+        try:
+            with open(self._candidate_descriptions_path) as descriptions_file:
+                rows = list(csv.DictReader(descriptions_file, delimiter=','))
+        except OSError:
+            time.sleep(1)
+            return self.retrieve_similar_problems_descriptions()
+
+        return [row['problem_id'] for row in rows], \
+            [row['normalized_description'] for row in rows]
+
+    def retrieve_solution_index(self):
+        """
+            Retrieve the solution of each previously solved problem from the
+            SolutionIndexFile written by the Solved Problems Repository.
+
+            :return: the solution index, None if it's not valid
+            :rtype: dictionary of type:
+                {"problems": {<problem_id>: <solution_id>, ...},
+                 "solutions": {<solution_id>: <solution_description>, ...}}
+        """
+        solution_index = load_json(self._solution_index_path)
+        if solution_index is None \
+                or validate_json(solution_index, load_json(self._solution_index_schema)) is not True:
+            print("There's a problem with the SolutionIndexFile, please check schema.")
+            return None
+        return solution_index
+
+    def is_server_enabled(self):
+        """
+            Check whether requests must be served by the local troubleshooting server
+            instead of the SimilarProblemsReqFile (compatibility mode).
+
+            :returns: True if the server is enabled in the configuration
+            :rtype: boolean
+        """
+        return self._server['enabled']
+
+    def start_troubleshooting_server(self, background=False):
+        """
+            Serve the troubleshooting requests through the local server configured in
+            troubleshootingConfig.json (see TroubleShootingServer). Requests arriving
+            within batch_window_ms are solved together (see MicroBatcher), a window
+            of 0 disables micro-batching.
+
+            :param background: if True, run the server in a daemon thread and return
+            :type background: boolean
+            :returns: the server
+            :rtype: TroubleShootingServer
+        """
+        micro_batcher = None
+        if self._server['batch_window_ms'] > 0:
+            micro_batcher = MicroBatcher(self.solve_requests, self._server['batch_window_ms'],
+                                         self._server['max_batch_size'])
+        server = TroubleShootingServer(self, self._server['host'], self._server['port'],
+                                       self._similar_problem_req_schema, micro_batcher)
+        if background:
+            server.start_in_background()
+        else:
+            server.start()
+        return server
 
     def schedule_troubleshooting_procedure(self, period=1):
         """
@@ -111,23 +308,117 @@ class TroubleShootingSystemService:
         threading.Timer(period,  # re-init timer
                         self.schedule_troubleshooting_procedure).start()
 
-    def activate_troubleshooting_procedure(self):
+    def solve_requests(self, requests):
         """
-            Retrieve feature vector of previously solved problems from the PD_Preparation_System.
-
-            :return: feature vector and problem id of problems
+            Find the problems most similar to the ones described in the requests.
+            All the requests are embedded and scored together in a single pass,
+            except the ones already answered with the same artifacts.
+
+            With the "solution" ranking, the similarities of the problems sharing
+            a solution are aggregated, so that each returned problem has a
+            different solution.
+
+            :param requests: requests submitted by the Technical Support System
+            :type requests: array of dictionaries of type:
+                {"requestID": <request_id>, "problemDescription": <problem_description>}
+            :returns: one response for each request, None if the model or the candidate
+                problems are not available yet. When the solution index knows the
+                solutions of all the similar problems, they are returned as well.
+                If the candidate problems were prepared with other settings than
+                the requests, every response has the "ERROR" responseType
             :rtype: array of dictionaries of type:
-                {<problem_id>, <problem_feature_vector>}
+                {"requestID": <request_id>, "problemsIDs": [<problem_id>, ...],
+                 "solutions": [<solution_description>, ...]}
+                or {"requestID": <request_id>, "problemsIDs": [],
+                    "responseType": "ERROR", "errorMessage": <error_message>}
         """
-        # self.update_candidate_problems()
-        # self.update_neural_model()
+        # reload model and candidate problems only if their files changed
+        snapshot = self._scoring_engine.refresh()
+        if snapshot is None:
+            return None
+
+        configuration_hash = \
+            self._word_embedding_manager.data_manipulation_manager.configuration_hash()
+        error_message = self._check_candidates(configuration_hash)
+        if error_message is not None:
+            print(error_message)
+            return [{"requestID": request['requestID'], "problemsIDs": [],
+                     "responseType": "ERROR", "errorMessage": error_message}
+                    for request in requests]
+
+        # cached responses are valid only for the artifacts they were computed with
+        if snapshot.versions != self._response_cache_versions:
+            self._response_cache.clear()
+            self._response_cache_versions = snapshot.versions
+
+        aggregation = self._solution_aggregation if self._ranking == "solution" else None
+        # normalized descriptions are the ones scored: requests differing only in
+        # case, punctuation or stopwords share their response
+        normalized_sentences = self._word_embedding_manager.data_manipulation_manager \
+            .perform_data_manipulation([req['problemDescription'] for req in requests])
+        keys = [(" ".join(sentence.split()), configuration_hash,
+                 snapshot.versions['model'], snapshot.versions['candidates'],
+                 snapshot.versions['solution_index'], snapshot.versions['descriptions'],
+                 self._maxnum_candidate_solution, aggregation)
+                for sentence in normalized_sentences]
+        results = [self._response_cache.get(key) for key in keys]
+
+        missing = [i for i, result in enumerate(results) if result is None]
+        if missing:
+            missing_sentences = [normalized_sentences[i] for i in missing]
+            user_problem_vectors = self._word_embedding_manager.embed_normalized_sentences(
+                missing_sentences, self._embedding_cache)
+            rankings = self._scoring_engine.rank(
+                snapshot, user_problem_vectors, self._maxnum_candidate_solution,
+                aggregation=aggregation,
+                query_tokens=[sentence.split() for sentence in missing_sentences])
+
+            for i, top_k in zip(missing, rankings):
+                # ids are materialized only for the best candidates
+                result = {"problemsIDs": snapshot.problem_ids[top_k].tolist()}
+                solutions = self._find_solutions(snapshot, result['problemsIDs'])
+                if solutions is not None:
+                    result['solutions'] = solutions
+                results[i] = result
+                self._response_cache.put(keys[i], result)
+
+        return [{"requestID": request['requestID'], **result}
+                for request, result in zip(requests, results)]
+
+    def _check_candidates(self, configuration_hash):
+        # feature vectors of another encoder, or of sentences normalized another
+        # way, can't be compared with the ones of the requests
+        encoder = self._word_embedding_manager.encoder_fingerprint
+        if self._candidates_encoder not in (None, encoder):
+            return "The candidate problems were encoded with %s, the requests with %s: " \
+                   "please check the encoder settings." % (self._candidates_encoder, encoder)
+        if self._candidates_configuration_hash not in (None, configuration_hash):
+            return "The candidate problems were prepared with another data manipulation " \
+                   "configuration: please run the preparation again."
+        return None
+
+    @staticmethod
+    def _find_solutions(snapshot, problem_ids):
+        # Solutions are returned only if all of them are known, otherwise the
+        # Technical Support System asks the repository for them as before
+        if snapshot.solution_index is None:
+            return None
+        solutions = []
+        for problem_id in problem_ids:
+            solution_id = snapshot.solution_index['problems'].get(problem_id)
+            if solution_id not in snapshot.solution_index['solutions']:
+                return None
+            solutions.append(snapshot.solution_index['solutions'][solution_id])
+        return solutions
 
-        if not os.path.exists(self._neural_network_path):
+    def activate_troubleshooting_procedure(self):
+        """
+            Answer all the pending requests of the SimilarProblemsReqFile, writing
+            one response for each of them in the SimilarProblemsResponseFile.
+        """
+        if self._scoring_engine.refresh() is None:
             return
 
-        neural_network = SimilarityModel.load(self._neural_network_path)
-        word_embedding_manager = WordEmbeddingManager()
-
         # check if a new request has been submitted from the user
         user_request_data = load_json(self._similar_problem_req_path)
 
@@ -143,51 +434,23 @@ class TroubleShootingSystemService:
             print("There's a problem with the SimilarProblemReqFile, please check schema.")
             return
 
-        sentences = [req['problemDescription'] for req in user_request_data['requests']]
-        user_problem_vector = word_embedding_manager.create_feature_vector(sentences)
-        user_problem_vector = np.array(user_problem_vector[0])
-
-        similar_problems_descriptor = self.retrieve_similar_problems_vector()
-
-        neural_network_input = \
-            [problem_des['problem_feature_vector'] - user_problem_vector
-             for problem_des in similar_problems_descriptor]
-
-        similarity_results = neural_network.predict(neural_network_input)
-
-        for problem_des, similarity in zip(similar_problems_descriptor, similarity_results):
-            # Feature vector is no more used, so it's deleted for two reasons:
-            #   - waste of space
-            #   - some of these descriptor must be sent back to the user, by removing the
-            #       feature vector, dictionary format is adapted to the one requested from the
-            #       Technical Support System
-            del problem_des['problem_feature_vector']
-            problem_des['similarity_percentage'] = similarity
-
-        similar_problems_descriptor = sorted(
-            similar_problems_descriptor,
-            key=lambda item: item['similarity_percentage'],
-            reverse=True)
-
-        candidate_similar_problems = \
-            similar_problems_descriptor[:self._maxnum_candidate_solution]
+        requests = user_request_data['requests']
+        responses = self.solve_requests(requests)
+        if responses is None:
+            return
 
         # Prepare dictionary schema requested from the Technical Support System
-        similar_problems_response = {
-            "responses": [
-                {
-                    "requestID": user_request_data['requests'][0]['requestID'],
-                    "problemsIDs": []
-                }
-            ]
-        }
-
-        for problem_des in candidate_similar_problems:
-            similar_problems_response['responses'][0]["problemsIDs"].append(
-                problem_des['problem_id'])
-
+        similar_problems_response = {"responses": responses}
         dump_json(similar_problems_response, self._similar_problem_response_path)
-        fresh_req = {"requests": []}
+
+        # Remove only the answered requests, keeping the ones submitted in the meantime
+        pending_requests = load_json(self._similar_problem_req_path)['requests']
+        fresh_req = {"requests": [req for req in pending_requests if req not in requests]}
         dump_json(fresh_req, self._similar_problem_req_path)
 
-        self._write_report("OK")
+        errors = [response['errorMessage'] for response in responses
+                  if response.get('responseType', "OK") != "OK"]
+        if errors:
+            self._write_report("ERROR", errors[0])
+        else:
+            self._write_report("OK")
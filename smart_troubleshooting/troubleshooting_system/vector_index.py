@@ -0,0 +1,182 @@
+"""
+This module provides an approximate nearest-neighbour index over the feature
+vectors of the candidate problems, used to shortlist the candidates to be
+scored by the similarity model.
+
+Author: Filippo Guggino
+"""
+import numpy as np
+
+
+def squared_distances(queries, vectors):
+    """
+        Compute the squared L2 distance between each query and each vector.
+
+        :param queries: the query vectors
+        :type queries: ndarray of shape (n_queries, n_features)
+        :param vectors: the vectors to compare
+        :type vectors: ndarray of shape (n_vectors, n_features)
+        :returns: the distance matrix
+        :rtype: ndarray of shape (n_queries, n_vectors)
+    """
+    return np.einsum('ij,ij->i', queries, queries)[:, np.newaxis] \
+        - 2 * queries @ vectors.T \
+        + np.einsum('ij,ij->i', vectors, vectors)
+
+
+def kmeans(data, n_clusters, n_iter=20, random_state=None):
+    """
+        Cluster the data with the k-means (Lloyd) algorithm.
+
+        :param data: the vectors to cluster
+        :type data: ndarray of shape (n_samples, n_features)
+        :param n_clusters: number of clusters, at most n_samples
+        :type n_clusters: integer
+        :param n_iter: number of iterations
+        :type n_iter: integer
+        :param random_state: seed used to choose the initial centroids
+        :type random_state: integer
+        :returns: the centroids of the clusters
+        :rtype: ndarray of shape (n_clusters, n_features)
+    """
+    rng = np.random.default_rng(random_state)
+    data = np.asarray(data, dtype=np.float32)
+    n_clusters = min(n_clusters, len(data))
+    centroids = data[rng.choice(len(data), n_clusters, replace=False)].copy()
+
+    for _ in range(n_iter):
+        labels = assign_clusters(data, centroids)
+        counts = np.bincount(labels, minlength=n_clusters)
+        # empty clusters keep their previous centroid
+        not_empty = counts > 0
+        offsets = np.concatenate(([0], np.cumsum(counts)[:-1]))
+        sums = np.add.reduceat(data[np.argsort(labels, kind='stable')], offsets[not_empty])
+        centroids[not_empty] = sums / counts[not_empty, np.newaxis]
+
+    return centroids
+
+
+def assign_clusters(data, centroids, chunk_size=10000):
+    """
+        Assign each vector to the closest centroid (L2 distance).
+
+        :param data: the vectors to assign
+        :type data: ndarray of shape (n_samples, n_features)
+        :param centroids: the centroids of the clusters
+        :type centroids: ndarray of shape (n_clusters, n_features)
+        :param chunk_size: number of vectors assigned at once, bounding the
+            size of the distance matrix
+        :type chunk_size: integer
+        :returns: index of the closest centroid of each vector
+        :rtype: ndarray of shape (n_samples,)
+    """
+    centroid_norms = np.einsum('ij,ij->i', centroids, centroids)
+    labels = np.empty(len(data), dtype=np.intp)
+    for start in range(0, len(data), chunk_size):
+        chunk = data[start:start + chunk_size]
+        # ||x - c||^2 without the ||x||^2 term, which doesn't change the argmin
+        distances = centroid_norms - 2 * chunk @ centroids.T
+        labels[start:start + chunk_size] = np.argmin(distances, axis=1)
+    return labels
+
+
+class IVFIndex:
+    """
+        Inverted-file index: candidates are partitioned in n_lists clusters
+        with k-means, and a query is compared only with the candidates of its
+        n_probe closest clusters.
+
+        Supported metrics are "cosine" (vectors are L2-normalized) and "l2".
+    """
+    METRICS = ["cosine", "l2"]
+
+    # Maximum number of training points per list used to compute the centroids
+    _training_points_per_list = 256
+
+    def __init__(self, n_lists=64, n_probe=8, metric="cosine", random_state=0):
+        """
+            :param n_lists: number of clusters (inverted lists)
+            :type n_lists: integer
+            :param n_probe: number of clusters visited by each query
+            :type n_probe: integer
+            :param metric: one of METRICS
+            :type metric: string
+            :param random_state: seed used to train the clusters
+            :type random_state: integer
+        """
+        if metric not in self.METRICS:
+            raise ValueError("Unknown metric: %s" % metric)
+
+        self.n_lists = n_lists
+        self.n_probe = n_probe
+        self.metric = metric
+        self.random_state = random_state
+        self._centroids = None
+        self._vectors = None
+        self._list_order = None
+        self._list_offsets = None
+
+    def _prepare(self, vectors):
+        vectors = np.asarray(vectors, dtype=np.float32)
+        if self.metric == "cosine":
+            norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+            norms[norms == 0] = 1
+            vectors = vectors / norms
+        return vectors
+
+    def fit(self, vectors):
+        """
+            Build the index over the given vectors.
+
+            :param vectors: feature vectors of the candidate problems
+            :type vectors: ndarray of shape (n_candidates, n_features)
+            :returns: self
+        """
+        self._vectors = self._prepare(vectors)
+
+        # centroids are trained on a sample, then all the vectors are assigned
+        rng = np.random.default_rng(self.random_state)
+        n_training = min(len(self._vectors), self.n_lists * self._training_points_per_list)
+        training = self._vectors[rng.choice(len(self._vectors), n_training, replace=False)]
+        self._centroids = kmeans(training, self.n_lists, random_state=self.random_state)
+
+        labels = assign_clusters(self._vectors, self._centroids)
+        # candidates of the i-th list are _list_order[_list_offsets[i]:_list_offsets[i+1]]
+        self._list_order = np.argsort(labels, kind='stable')
+        self._list_offsets = np.concatenate(
+            ([0], np.cumsum(np.bincount(labels, minlength=len(self._centroids)))))
+        return self
+
+    def search(self, query_vectors, shortlist_size, n_probe=None):
+        """
+            Shortlist the candidates closest to each query.
+
+            :param query_vectors: feature vectors of the query problems
+            :type query_vectors: ndarray of shape (n_queries, n_features)
+            :param shortlist_size: maximum number of candidates returned for each query
+            :type shortlist_size: integer
+            :param n_probe: number of lists probed for each query, defaults to the
+                one of the index
+            :type n_probe: integer
+            :returns: for each query, the indices of the shortlisted candidates
+                (in no particular order)
+            :rtype: list of ndarray
+        """
+        query_vectors = self._prepare(np.atleast_2d(query_vectors))
+        n_probe = min(self.n_probe if n_probe is None else n_probe, len(self._centroids))
+        closest_lists = np.argsort(squared_distances(query_vectors, self._centroids),
+                                   axis=1)[:, :n_probe]
+
+        shortlists = []
+        for query_vector, lists in zip(query_vectors, closest_lists):
+            candidates = np.concatenate(
+                [self._list_order[self._list_offsets[i]:self._list_offsets[i + 1]]
+                 for i in lists])
+            if len(candidates) > shortlist_size:
+                distances = squared_distances(query_vector[np.newaxis, :],
+                                              self._vectors[candidates])[0]
+                candidates = candidates[np.argpartition(distances, shortlist_size - 1)
+                                        [:shortlist_size]]
+            shortlists.append(candidates)
+        return shortlists
+